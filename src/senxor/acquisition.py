@@ -0,0 +1,218 @@
+# Copyright (C) Meridian Innovation Ltd. Hong Kong, 2020. All rights reserved.
+#
+"""
+Background acquisition of MI48 frames into a preallocated ring buffer.
+
+The acquisition thread does nothing but MI48.read() into the next slot of
+the ring, so that sensor readout stays real-time however slow the
+consumers are. Consumers subscribe with a delivery policy:
+
+    * 'latest' -- get the most recent frame, skipping any missed ones,
+    * 'drop_oldest' -- get frames in order from a queue of `maxlen`,
+      dropping the oldest when the consumer falls behind,
+    * 'block' -- get every frame in order; when the consumer is `maxlen`
+      frames behind, the acquisition thread waits for it (back-pressure).
+
+Usage:
+
+    acq = Acquisition(mi48)
+    frames = acq.subscribe('latest')
+    acq.start()
+    frame = frames.get(timeout=1.0)
+    temperature = mi48.to_celsius(frame.data)
+"""
+import time
+import logging
+import functools
+import threading
+from collections import namedtuple
+import numpy as np
+from senxor.mi48 import FRAME_HEADER_DTYPE
+
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIPTION_POLICIES = ['latest', 'drop_oldest', 'block']
+
+# A delivered frame: raw uint16 data, header record, sequence number,
+# and host time of reception
+Frame = namedtuple('Frame', ['data', 'header', 'seq', 'host_time'])
+
+
+class FrameRing:
+    """Preallocated ring of raw frames, headers and host times"""
+
+    def __init__(self, depth, npixels):
+        self.depth = depth
+        self.frames = np.zeros((depth, npixels), dtype=np.uint16)
+        self.headers = np.zeros(depth, dtype=FRAME_HEADER_DTYPE)
+        self.host_time = np.zeros(depth, dtype=np.float64)
+        # sequence number of the frame held in each slot
+        self.seq = np.full(depth, -1, dtype=np.int64)
+
+    def slot(self, seq):
+        return seq % self.depth
+
+
+class Subscription:
+    """A consumer of the frames of an Acquisition"""
+
+    def __init__(self, acquisition, policy='latest', maxlen=None):
+        if policy not in SUBSCRIPTION_POLICIES:
+            raise ValueError('Policy must be one of {}'.
+                             format(SUBSCRIPTION_POLICIES))
+        depth = acquisition.ring.depth
+        if maxlen is None:
+            maxlen = 1 if policy == 'latest' else depth // 2
+        # at least one slot must remain for the acquisition to write into
+        self.maxlen = max(1, min(maxlen, depth - 1))
+        self.policy = policy
+        self.acquisition = acquisition
+        self.next_seq = acquisition.count
+        self.delivered = 0
+        self.dropped = 0
+
+    def get(self, timeout=None, copy=True):
+        """
+        Return the next Frame according to the policy, or None on timeout
+        or if the acquisition stopped.
+
+        With `copy` False, the data is a view of the ring slot, which will
+        be overwritten `depth` frames later.
+        """
+        acq = self.acquisition
+        ring = acq.ring
+        while True:
+            with acq.cond:
+                ready = acq.cond.wait_for(
+                    lambda: acq.count > self.next_seq or not acq.running,
+                    timeout)
+                if not ready or acq.count <= self.next_seq:
+                    return None
+                latest = acq.count - 1
+                if self.policy == 'latest':
+                    seq = latest
+                else:
+                    seq = max(self.next_seq, latest - self.maxlen + 1)
+                self.dropped += seq - self.next_seq
+                self.next_seq = seq + 1
+                self.delivered += 1
+                if self.policy == 'block':
+                    acq.cond.notify_all()
+            slot = ring.slot(seq)
+            data = ring.frames[slot]
+            if copy:
+                data = data.copy()
+            frame = Frame(data, ring.headers[slot].copy(), seq,
+                          ring.host_time[slot])
+            if ring.seq[slot] == seq:
+                return frame
+            # overwritten while copying; only possible if not blocking
+            self.dropped += 1
+
+    def lag(self):
+        """Number of frames acquired but not yet delivered"""
+        return self.acquisition.count - self.next_seq
+
+    def close(self):
+        self.acquisition.unsubscribe(self)
+
+
+class Acquisition:
+    """Background reader of an MI48 into a FrameRing"""
+
+    def __init__(self, mi48, depth=32, name=None):
+        """
+        Prepare to acquire from `mi48`, which must be streaming
+        (MI48.start) by the time `start` is called.
+
+        The MI48 output is switched to raw uint16, which is what the ring
+        holds; consumers convert with MI48.to_celsius as needed.
+        """
+        self.mi48 = mi48
+        self.mi48.set_output('raw')
+        self.ring = FrameRing(depth, int(np.prod(mi48.fpa_shape)))
+        self.name = name or '{}-acquisition'.format(mi48.name)
+        self.cond = threading.Condition()
+        self.subscriptions = []
+        self.count = 0  # number of frames acquired; next sequence number
+        self.read_errors = 0
+        self.running = False
+        self.thread = None
+
+    def subscribe(self, policy='latest', maxlen=None):
+        """Return a new Subscription; see the module docstring"""
+        sub = Subscription(self, policy, maxlen)
+        with self.cond:
+            self.subscriptions.append(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self.cond:
+            try:
+                self.subscriptions.remove(sub)
+            except ValueError:
+                pass
+            self.cond.notify_all()
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name=self.name,
+                                       daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=2.0):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def _wait_for_blocking_subscribers(self):
+        """Return False if stopped while waiting"""
+        def room():
+            return not self.running or all(
+                self.count - sub.next_seq < sub.maxlen
+                for sub in self.subscriptions if sub.policy == 'block')
+        with self.cond:
+            self.cond.wait_for(room)
+        return self.running
+
+    def _set_crc_ok(self, slot, seq, ok):
+        """Flag the outcome of a CRC check done by the MI48 worker"""
+        with self.cond:
+            # if not published yet, the header copied then is flagged
+            # already; if overwritten since, the outcome is moot
+            if self.ring.seq[slot] == seq:
+                self.ring.headers['crc_ok'][slot] = ok
+
+    def _run(self):
+        ring = self.ring
+        while self.running:
+            if not self._wait_for_blocking_subscribers():
+                break
+            seq = self.count
+            slot = ring.slot(seq)
+            # invalidate the slot while it is being written
+            ring.seq[slot] = -1
+            try:
+                data, header = self.mi48.read(
+                    out=ring.frames[slot],
+                    crc_done=functools.partial(self._set_crc_ok, slot, seq))
+            except Exception as e:
+                if not self.running:
+                    break
+                logger.error('{}: read failed: {}'.format(self.name, e))
+                data = None
+            if data is None:
+                self.read_errors += 1
+                continue
+            ring.host_time[slot] = time.time()
+            with self.cond:
+                # a frame without header must not carry that of an older
+                # one; copied under the lock, see _set_crc_ok
+                ring.headers[slot] = header if header is not None else 0
+                ring.seq[slot] = seq
+                self.count = seq + 1
+                self.cond.notify_all()
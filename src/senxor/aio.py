@@ -0,0 +1,282 @@
+# Copyright (C) Meridian Innovation Ltd. Hong Kong, 2020. All rights reserved.
+#
+"""
+asyncio transport for MI48 register and frame I/O.
+
+A single event loop can drive several cameras: each AsyncUSB_Interface
+runs one reader task that feeds a USB_StreamParser and demultiplexes the
+acknowledges -- RREG/WREG complete the register command in flight, while
+GFRA frames go into a small frame queue. Register commands are sent one
+at a time, since their acknowledges carry no register address.
+
+Usage:
+
+    mi48, port, _ = connect_senxor()
+    ami48 = AsyncMI48(mi48)
+    await ami48.open()
+    await ami48.start(stream=True)
+    async for data, header in ami48.frames():
+        ...
+"""
+import asyncio
+import collections
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from senxor.interfaces import USB_StreamParser, usb_parse_ack
+from senxor.mi48 import regmap, GET_SINGLE_FRAME, CONTINUOUS_STREAM,\
+                        NO_HEADER
+
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncUSB_Interface:
+    """asyncio counterpart of USB_Interface"""
+
+    def __init__(self, port, parser=None, frame_queue_size=2, timeout=1.0,
+                 retries=3):
+        """
+        Wrap an open serial `port`.
+
+        Pass the `parser` of a USB_Interface previously used on the same
+        port, so that bytes already received are not lost.
+        When the frame queue is full, the oldest frame is dropped.
+        Register commands are sent again if their acknowledge does not
+        arrive within `timeout` seconds, up to `retries` times.
+        """
+        self.port = port
+        self.parser = USB_StreamParser() if parser is None else parser
+        self.frame_queue_size = frame_queue_size
+        self.timeout = timeout
+        self.retries = retries
+        self.frames_dropped = 0
+        self._pending = None  # (ack name, future) of the command in flight
+        # per ack name, the late acknowledges still due to sends that
+        # timed out; these are discarded rather than taken as answers
+        self._stale = collections.Counter()
+        self._late_ack = None  # set when a late acknowledge is discarded
+        self._lock = None
+        self._frames = None
+        self._loop = None
+        self._reader = None
+        self._executor = None
+
+    async def start(self):
+        """Start receiving acknowledges on the running event loop"""
+        self._loop = asyncio.get_running_loop()
+        self._frames = asyncio.Queue(self.frame_queue_size)
+        self._lock = asyncio.Lock()
+        self._late_ack = asyncio.Event()
+        try:
+            # true non-blocking I/O where the loop supports it (posix)
+            self._loop.add_reader(self.port.fileno(), self._on_readable)
+        except (AttributeError, NotImplementedError, ValueError, OSError):
+            # else run the blocking reads in a helper thread
+            self._executor = ThreadPoolExecutor(max_workers=1)
+            self._reader = self._loop.create_task(self._read_loop())
+
+    async def stop(self):
+        """Stop receiving and fail any pending commands"""
+        if self._reader is not None:
+            self._reader.cancel()
+            try:
+                await self._reader
+            except asyncio.CancelledError:
+                pass
+            self._reader = None
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        elif self._loop is not None:
+            self._loop.remove_reader(self.port.fileno())
+        if self._pending is not None:
+            _, fut = self._pending
+            self._pending = None
+            if not fut.done():
+                fut.set_exception(ConnectionError('interface stopped'))
+
+    def _on_readable(self):
+        data = self.port.read(self.port.in_waiting)
+        if data:
+            self.parser.feed(data)
+            self._dispatch()
+
+    async def _read_loop(self):
+        while True:
+            await self._loop.run_in_executor(self._executor,
+                                             self.parser.fill, self.port)
+            self._dispatch()
+
+    def _dispatch(self):
+        """Route every complete packet to its consumer"""
+        while True:
+            packet = self.parser.next_packet()
+            if packet is None:
+                return
+            ack = usb_parse_ack(*packet)
+            if ack is None:
+                logger.debug('Ignoring unknown packet %s', packet[0])
+                continue
+            cmd, data = ack
+            if cmd == 'GFRA':
+                # the parser buffer is reused, so keep a copy
+                self._put_frame(data.copy())
+                continue
+            if self._stale[cmd]:
+                self._stale[cmd] -= 1
+                logger.debug('Discarding late %s acknowledge: %s', cmd, data)
+                self._late_ack.set()
+                continue
+            if self._pending is not None and self._pending[0] == cmd:
+                _, fut = self._pending
+                self._pending = None
+                if not fut.done():
+                    fut.set_result(data)
+            else:
+                logger.debug('Unsolicited %s acknowledge: %s', cmd, data)
+
+    def _put_frame(self, frame):
+        if self._frames.full():
+            self._frames.get_nowait()
+            self.frames_dropped += 1
+        self._frames.put_nowait(frame)
+
+    async def command(self, cmd: str):
+        """Send a command and return the data of its acknowledge"""
+        name = cmd[8:12]
+        async with self._lock:
+            # resends of the same command share the future: whichever of
+            # their acknowledges arrives first carries the right answer
+            fut = self._loop.create_future()
+            self._pending = (name, fut)
+            sent = 0
+            try:
+                for attempt in range(self.retries + 1):
+                    self.port.write(cmd.encode())
+                    sent += 1
+                    try:
+                        await asyncio.wait_for(asyncio.shield(fut),
+                                               self.timeout)
+                        break
+                    except asyncio.TimeoutError:
+                        logger.debug('Timeout waiting for %s acknowledge; '
+                                     'attempt %d', name, attempt + 1)
+            finally:
+                if self._pending is not None and self._pending[1] is fut:
+                    self._pending = None
+                answered = (fut.done() and not fut.cancelled()
+                            and fut.exception() is None)
+                # the other sends may still be acknowledged, later
+                self._stale[name] += sent - int(answered)
+            await self._discard_late_acks(name)
+            if not answered:
+                raise TimeoutError('No acknowledge to {}'.format(cmd))
+            return fut.result()
+
+    async def _discard_late_acks(self, name):
+        """
+        Wait for the late `name` acknowledges until none has arrived for
+        the timeout, then take the rest as lost, so that they cannot be
+        mistaken for the answers to the next commands.
+        """
+        while self._stale[name]:
+            self._late_ack.clear()
+            try:
+                await asyncio.wait_for(self._late_ack.wait(), self.timeout)
+            except asyncio.TimeoutError:
+                logger.debug('%d %s acknowledges lost', self._stale[name],
+                             name)
+                del self._stale[name]
+
+    async def regread(self, reg, regname=""):
+        """Read a control/status register via USB protocol"""
+        cmd = 'RREG{:02X}XXXXXX'.format(reg)
+        cmd = '   #{:04X}{}'.format(len(cmd), cmd)
+        return await self.command(cmd)
+
+    async def regwrite(self, reg, value, regname=""):
+        """Write to a control register via USB protocol"""
+        cmd = 'WREG{:02X}{:02X}XXXX'.format(reg, value)
+        cmd = '   #{:04X}{}'.format(len(cmd), cmd)
+        await self.command(cmd)
+        return None
+
+    async def read(self, size_in_words):
+        """Return the next GFRA frame, dropping the USB header"""
+        data = await self._frames.get()
+        return data[-size_in_words:]
+
+
+class AsyncMI48:
+    """
+    asyncio front end to an MI48 that has been brought up already.
+
+    Frames are decoded by the underlying MI48 object, so they are
+    identical to those returned by MI48.read().
+    """
+
+    def __init__(self, mi48, interface=None, **kwargs):
+        self.mi48 = mi48
+        if interface is None:
+            usb = mi48.interfaces[0]
+            interface = AsyncUSB_Interface(usb.port,
+                                   parser=getattr(usb, 'parser', None),
+                                   **kwargs)
+        self.interface = interface
+
+    async def open(self):
+        await self.interface.start()
+
+    async def close(self):
+        await self.interface.stop()
+
+    async def regread(self, reg, cached=True):
+        """
+        Read a control/status register; Allow hex or str for reg.
+
+        The register shadow cache of the MI48 is shared, as in
+        MI48.regread.
+        """
+        reg, regname = self.mi48._resolve_reg(reg)
+        regcache = self.mi48.regcache
+        if cached and reg in regcache and self.mi48._is_cached(reg):
+            return regcache[reg]
+        value = await self.interface.regread(reg, regname)
+        if value is not None and self.mi48._is_cached(reg):
+            regcache[reg] = value
+        return value
+
+    async def regwrite(self, reg, value):
+        """Write to a control register; keep the shadow cache up to date"""
+        if isinstance(reg, str):
+            regname = reg
+            reg = regmap[regname]
+        else:
+            regname = ""
+        result = await self.interface.regwrite(reg, value, regname)
+        if self.mi48._is_cached(reg):
+            self.mi48.regcache[reg] = value
+        return result
+
+    async def read_frame(self):
+        """Return the next frame as (data, header); see MI48.read"""
+        response = await self.interface.read(self.mi48.get_frame_words())
+        return self.mi48.decode_frame(response)
+
+    async def frames(self):
+        """Asynchronous stream of (data, header)"""
+        while True:
+            yield await self.read_frame()
+
+    async def start(self, stream=True, with_header=True):
+        """Start capture; see MI48.start"""
+        mode = CONTINUOUS_STREAM if stream else GET_SINGLE_FRAME
+        if not with_header:
+            mode = mode | NO_HEADER
+        self.mi48.capture_no_header = (not with_header)
+        await self.regwrite('FRAME_MODE', mode)
+
+    async def stop_capture(self):
+        """Clear the capture bits of FRAME_MODE"""
+        mode = await self.regread('FRAME_MODE')
+        mode &= ~(GET_SINGLE_FRAME | CONTINUOUS_STREAM) & 0xFF
+        await self.regwrite('FRAME_MODE', mode)
@@ -0,0 +1,211 @@
+# Copyright (C) Meridian Innovation Ltd. Hong Kong, 2020. All rights reserved.
+#
+"""
+Heavy spatial denoising off the frame-processing threads.
+
+Non-Local Means, and bilateral filtering at a large `d`, cost too much
+to run in line at full frame rate. A DenoiseService runs cv_filter with
+these in a pool of worker processes. Frames are passed through a block
+of shared memory, so only the slot number and filter parameters are
+pickled.
+
+Every frame submitted has a deadline, `budget` seconds after submission.
+Its result is collected with `collect`, which waits at most until the
+deadline and otherwise returns the frame filtered by the fast `fallback`
+chain in the calling thread. So the latency a frame adds is bounded,
+whatever the load on the workers. Collecting the tickets in the order
+they were submitted, as a Pipeline does, returns the results in order.
+
+Usage:
+
+    denoiser = DenoiseService((61, 61), budget=0.08)
+    ticket = denoiser.submit(levels)     # uint8
+    ...                                  # other work meanwhile
+    filtered = denoiser.collect(ticket)
+    denoiser.close()
+
+The workers are spawned, not forked, so that they do not inherit the
+threads of the host; scripts using the service must guard their entry
+point with `if __name__ == '__main__'`.
+"""
+import time
+import logging
+import threading
+import collections
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+from senxor.utils import cv_filter
+
+
+logger = logging.getLogger(__name__)
+
+# median, bilateral at a large `d`, and NLM
+DENOISE_PARAMETERS = {'blur_ks': 3, 'd': 9, 'sigmaColor': 27, 'sigmaSpace': 27,
+                      'h': 5, 'templateWindowSize': 5, 'searchWindowSize': 11}
+
+# state of a worker process: the views of the shared slots
+_worker = {}
+
+
+def _init_worker(shm_name, shape, nslots):
+    # spawned workers share the resource tracker of the host, which
+    # created the block and unlinks it in `close`
+    shm = shared_memory.SharedMemory(name=shm_name)
+    slots = np.ndarray((2, nslots) + shape, dtype=np.uint8, buffer=shm.buf)
+    _worker.update(shm=shm, inputs=slots[0], outputs=slots[1])
+
+
+def _denoise(slot, parameters, use_bilat, use_nlm):
+    """Filter an input slot into its output slot; return the seconds taken"""
+    t0 = time.perf_counter()
+    _worker['outputs'][slot] = cv_filter(_worker['inputs'][slot], parameters,
+                                         use_median=True, use_bilat=use_bilat,
+                                         use_nlm=use_nlm)
+    return time.perf_counter() - t0
+
+
+def fast_filter(data):
+    """The default fallback: median and a small bilateral filter"""
+    return cv_filter(data, {'blur_ks': 3, 'd': 5, 'sigmaColor': 27,
+                            'sigmaSpace': 27},
+                     use_median=True, use_bilat=True, use_nlm=False)
+
+
+class DenoiseTicket:
+    """A frame submitted to a DenoiseService"""
+
+    def __init__(self, data, deadline, slot=None):
+        self.data = data
+        self.deadline = deadline
+        self.slot = slot
+        self.result = None
+        self.done = threading.Event()
+
+
+class DenoiseService:
+    """Denoising of uint8 frames in worker processes, with a deadline"""
+
+    def __init__(self, shape, parameters=None, use_bilat=True, use_nlm=True,
+                 fallback=fast_filter, budget=0.1, nworkers=2, nslots=None):
+        """
+        Start `nworkers` processes to filter frames of `shape` with
+        cv_filter and `parameters` (by default DENOISE_PARAMETERS).
+
+        `fallback` filters the frames whose result is not ready within
+        `budget` seconds of submission. At most `nslots` frames, by
+        default twice the workers, are in flight; further frames go
+        straight to the fallback.
+        """
+        self.shape = tuple(shape)
+        self.parameters = dict(DENOISE_PARAMETERS)
+        if parameters is not None:
+            self.parameters.update(parameters)
+        self.use_bilat = use_bilat
+        self.use_nlm = use_nlm
+        self.fallback = fallback
+        self.budget = budget
+        self.nslots = nslots or 2 * nworkers
+        nbytes = 2 * self.nslots * int(np.prod(self.shape))
+        self.shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        slots = np.ndarray((2, self.nslots) + self.shape, dtype=np.uint8,
+                           buffer=self.shm.buf)
+        self.inputs, self.outputs = slots[0], slots[1]
+        self.free = collections.deque(range(self.nslots))
+        self.lock = threading.Lock()
+        self.executor = ProcessPoolExecutor(
+            max_workers=nworkers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(self.shm.name, self.shape, self.nslots))
+        self.broken = False
+        self.submitted = 0
+        self.denoised = 0
+        self.missed = 0
+        self.rejected = 0
+        self.errors = 0
+        self._worker_time = 0.
+        self._completed = 0
+
+    def submit(self, data):
+        """
+        Submit the uint8 frame `data` for denoising; return the ticket
+        for `collect`. `data` must not change until collected.
+        """
+        ticket = DenoiseTicket(data, time.monotonic() + self.budget)
+        with self.lock:
+            self.submitted += 1
+            if self.broken or not self.free:
+                self.rejected += 1
+                return ticket
+            slot = self.free.popleft()
+        ticket.slot = slot
+        self.inputs[slot] = data
+        try:
+            future = self.executor.submit(_denoise, slot, self.parameters,
+                                          self.use_bilat, self.use_nlm)
+        except (BrokenProcessPool, RuntimeError) as e:
+            logger.error('Denoise workers unavailable: %s', e)
+            with self.lock:
+                self.broken = True
+                self.rejected += 1
+                self.free.append(slot)
+            ticket.slot = None
+            return ticket
+        future.add_done_callback(lambda f: self._done(ticket, f))
+        return ticket
+
+    def _done(self, ticket, future):
+        # runs in a thread of the executor once a worker finished, or
+        # in close for the futures it cancels
+        try:
+            if not future.cancelled():
+                seconds = future.result()
+                # copy out, so that the slot is free whether or not the
+                # ticket is ever collected
+                ticket.result = self.outputs[ticket.slot].copy()
+                with self.lock:
+                    self._worker_time += seconds
+                    self._completed += 1
+        except Exception as e:
+            with self.lock:
+                self.errors += 1
+            logger.error('Denoising failed: %s', e)
+        finally:
+            with self.lock:
+                self.free.append(ticket.slot)
+            ticket.done.set()
+
+    def collect(self, ticket):
+        """
+        Return the denoised frame of `ticket`, waiting at most until its
+        deadline; past that, the frame filtered by the fallback.
+        """
+        if ticket.slot is not None:
+            timeout = max(0., ticket.deadline - time.monotonic())
+            if ticket.done.wait(timeout) and ticket.result is not None:
+                self.denoised += 1
+                return ticket.result
+            self.missed += 1
+        return self.fallback(ticket.data)
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'submitted': self.submitted,
+                'denoised': self.denoised,
+                'missed': self.missed,
+                'rejected': self.rejected,
+                'errors': self.errors,
+                'worker_ms': (1.e3 * self._worker_time / self._completed
+                              if self._completed else None),
+            }
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        # drop the views before releasing the buffer
+        self.inputs = self.outputs = None
+        self.shm.close()
+        self.shm.unlink()
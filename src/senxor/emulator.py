@@ -0,0 +1,406 @@
+# Copyright (C) Meridian Innovation Ltd. Hong Kong, 2020. All rights reserved.
+#
+"""
+Software emulation of an MI48 behind a serial-port-like object.
+
+MI48Emulator can stand in for the serial.Serial port of a USB_Interface,
+so that the whole senxor stack runs without a camera, e.g. for benchmarks
+and continuous integration. It answers RREG/WREG commands and streams
+GFRA frames with valid header, CRC and USB check sums, at the frame rate
+set through FRAME_RATE, as the real MI48 does.
+
+Faults are injected on demand, to exercise error handling and measure
+their cost:
+
+    * 'corrupt' -- flip a byte of a frame, failing the USB check sum,
+    * 'drop' -- lose a frame; the header frame counter skips it,
+    * 'slow' -- deliver a frame `slow_delay` seconds late (slow readout),
+    * 'noise' -- insert garbage bytes before a frame,
+    * 'late_ack' -- answer a register command `ack_delay` seconds late;
+      the output behind the acknowledge waits for it, as on the wire.
+
+The emulator keeps no thread: frames become due as the clock advances and
+are produced when the port is read.
+
+Usage:
+
+    mi48 = connect_emulator(resolution=(80, 62))
+    mi48.start(stream=True)
+    data, header = mi48.read()
+"""
+import time
+import logging
+import threading
+import collections
+import numpy as np
+from senxor.mi48 import MI48, regmap, crc16, KELVIN_0, DEFAULT_CTRL_STAT,\
+                        GET_SINGLE_FRAME, CONTINUOUS_STREAM, NO_HEADER,\
+                        SPIHDR_FRCNT, SPIHDR_SXVDD, SPIHDR_SXTA, SPIHDR_TIME,\
+                        SPIHDR_MAXV, SPIHDR_MINV, SPIHDR_CRC,\
+                        SPIHDR_TIME_UNIT
+from senxor.interfaces import USB_Interface, USB_SYNC, cksum
+
+
+logger = logging.getLogger(__name__)
+
+FAULTS = ['corrupt', 'drop', 'slow', 'noise', 'late_ack']
+
+# SENXOR_TYPE register value and nominal max FPS per FPA shape (cols, rows)
+EMULATED_CAMERAS = {
+    (80, 62): (1, 25.5),
+    (32, 32): (2, 28.57),
+    (160, 120): (8, 30.0),
+}
+
+# FILTER_CTRL bits that clear once their action is done
+_SELF_CLEARING = {regmap['FILTER_CTRL']: 0x02}
+
+
+def make_scene(shape, nframes=16, background=25., hotspot=60., seed=0):
+    """
+    Return `nframes` raw frames of a hot spot circling over a uniform
+    background, shaped (nframes, cols * rows), in the pixel order of
+    the MI48; temperatures in Celsius.
+    """
+    cols, rows = shape
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:rows, 0:cols]
+    sigma = max(cols, rows) / 10.
+    frames = np.empty((nframes, cols * rows), dtype=np.uint16)
+    for i in range(nframes):
+        phi = 2 * np.pi * i / nframes
+        cx = cols / 2 * (1 + 0.5 * np.cos(phi))
+        cy = rows / 2 * (1 + 0.5 * np.sin(phi))
+        t = background + (hotspot - background) *\
+            np.exp(-((x - cx)**2 + (y - cy)**2) / (2 * sigma**2))
+        t += rng.normal(0, 0.2, t.shape)
+        # 0.1 K units; row after row, matching data_to_frame
+        frames[i] = np.round(10 * (t - KELVIN_0)).ravel()
+    return frames
+
+
+class MI48Emulator:
+    """A serial-like port with an emulated MI48 behind it"""
+
+    def __init__(self, resolution=(80, 62), fps=None,
+                 sn=(0x15, 0x20, 0x01, 0x00, 0x12, 0x34),
+                 fw_version=(0x26, 0x05), timeout=0.5, scene=None, seed=0):
+        """
+        Emulate a camera of `resolution` (cols, rows), one of
+        EMULATED_CAMERAS, delivering at most `fps` frames per second
+        (default the nominal max FPS of the camera type).
+
+        `sn` is the 6 bytes of SENXOR_ID, `fw_version` the values of
+        FW_VERSION_1 and FW_VERSION_2, `timeout` the read timeout in
+        seconds as with serial.Serial. `scene` is an array of raw frames
+        to cycle through; see make_scene.
+        """
+        try:
+            camera_type, maxfps = EMULATED_CAMERAS[tuple(resolution)]
+        except KeyError:
+            raise ValueError('Resolution must be one of {}'.
+                             format(list(EMULATED_CAMERAS)))
+        self.cols, self.rows = resolution
+        self.maxfps = maxfps if fps is None else fps
+        self.timeout = timeout
+        self.write_timeout = timeout
+        self.is_open = True
+        self.rng = np.random.default_rng(seed)
+        if scene is None:
+            scene = make_scene(resolution, seed=seed)
+        self._set_scene(scene)
+        # register file and user flash
+        self.regs = {addr: 0 for addr in range(0x100)}
+        for name, value in DEFAULT_CTRL_STAT.items():
+            self.regs[regmap[name]] = value
+        self.regs[regmap['EVK_TEST']] = 0xFF  # core board on a bridge
+        self.regs[regmap['SENXOR_TYPE']] = camera_type
+        self.regs[regmap['MODULE_TYPE']] = 0
+        self.regs[regmap['FW_VERSION_1']] = fw_version[0]
+        self.regs[regmap['FW_VERSION_2']] = fw_version[1]
+        for i, b in enumerate(sn):
+            self.regs[regmap['SENXOR_ID_0'] + i] = b
+        self.flash = bytearray(0x100)
+        # faults pending for the next frames, and their probabilities
+        self.pending_faults = collections.Counter()
+        self.fault_rates = dict.fromkeys(FAULTS, 0.)
+        self.slow_delay = 0.1
+        self.ack_delay = 1.5 * timeout
+        self.faults = collections.Counter()  # injected so far
+        self.frames_sent = 0
+        self.commands = 0
+        self._lock = threading.RLock()
+        self._in = bytearray()
+        self._out = bytearray()
+        # output scheduled for delivery: (deliver_time, bytes, is_frame)
+        self._scheduled = collections.deque()
+        self._next_frame_time = None
+        self._frame_counter = 0
+        self._t0 = time.monotonic()
+
+    def _set_scene(self, scene):
+        scene = np.ascontiguousarray(scene, dtype='<u2')
+        self.scene = scene
+        self._scene_crc = [crc16(f) for f in scene]
+        self._scene_cksum = [cksum(f) for f in scene]
+        self._scene_max = scene.max(axis=1)
+        self._scene_min = scene.min(axis=1)
+
+    # ---------------------------------
+    # faults
+    # ---------------------------------
+    def inject_fault(self, fault, count=1):
+        """
+        Apply `fault`, one of FAULTS, to the next `count` frames, or
+        register commands for 'late_ack'.
+        """
+        if fault not in FAULTS:
+            raise ValueError('Fault must be one of {}'.format(FAULTS))
+        with self._lock:
+            self.pending_faults[fault] += count
+
+    def set_fault_rate(self, fault, rate):
+        """Apply `fault` to each frame (or command) with probability `rate`"""
+        if fault not in FAULTS:
+            raise ValueError('Fault must be one of {}'.format(FAULTS))
+        self.fault_rates[fault] = rate
+
+    def _take_fault(self, fault):
+        if self.pending_faults[fault] > 0:
+            self.pending_faults[fault] -= 1
+        elif not (self.fault_rates[fault] and
+                  self.rng.random() < self.fault_rates[fault]):
+            return False
+        self.faults[fault] += 1
+        return True
+
+    # ---------------------------------
+    # MI48 behaviour
+    # ---------------------------------
+    def get_frame_period(self):
+        divisor = self.regs[regmap['FRAME_RATE']] or 1
+        return divisor / self.maxfps
+
+    def _ack(self, cmd, data=b'', now=None):
+        """Append an acknowledge with its length and check sum"""
+        payload = '{:04X}'.format(4 + len(cmd) + len(data)).encode() +\
+                  cmd + data
+        cs = cksum(payload) & 0xFFFF
+        packet = USB_SYNC + payload + '{:04X}'.format(cs).encode()
+        delay = self.ack_delay if self._take_fault('late_ack') else 0.
+        if delay or self._scheduled:
+            # output leaves in order, behind anything delivered late
+            self._scheduled.append((now + delay, packet, False))
+        else:
+            self._out += packet
+
+    def _frame_packet(self, now):
+        """Return the GFRA acknowledge of the next frame"""
+        i = self._frame_counter % len(self.scene)
+        with_header = not self.regs[regmap['FRAME_MODE']] & NO_HEADER
+        parts = []
+        cs = 0
+        if with_header:
+            header = np.zeros(self.cols, dtype='<u2')
+            ts = int((now - self._t0) / SPIHDR_TIME_UNIT) & 0xFFFFFFFF
+            header[SPIHDR_FRCNT] = self._frame_counter & 0xFFFF
+            header[SPIHDR_SXVDD] = 33000
+            header[SPIHDR_SXTA] = 30315
+            header[SPIHDR_TIME] = ts & 0xFFFF
+            header[SPIHDR_TIME + 1] = ts >> 16
+            header[SPIHDR_MAXV] = self._scene_max[i]
+            header[SPIHDR_MINV] = self._scene_min[i]
+            header[SPIHDR_CRC] = self._scene_crc[i]
+            header = header.tobytes()
+            parts.append(header)
+            cs += cksum(header)
+        pixels = self.scene[i]
+        parts.append(pixels.data)
+        cs += self._scene_cksum[i]
+        size = 2 * len(pixels) + (2 * self.cols if with_header else 0)
+        length = '{:04X}'.format(4 + 4 + size).encode()
+        cs += cksum(length + b'GFRA')
+        packet = b''.join([USB_SYNC, length, b'GFRA'] + parts +
+                          ['{:04X}'.format(cs & 0xFFFF).encode()])
+        if self._take_fault('corrupt'):
+            packet = bytearray(packet)
+            k = len(USB_SYNC) + 8 + int(self.rng.integers(size))
+            packet[k] ^= 0xFF
+            packet = bytes(packet)
+        if self._take_fault('noise'):
+            packet = self.rng.bytes(int(self.rng.integers(1, 64))) + packet
+        return packet
+
+    def _produce(self, now):
+        """Schedule the frames that became due by `now`"""
+        mode_addr = regmap['FRAME_MODE']
+        while self._next_frame_time is not None and\
+              self._next_frame_time <= now:
+            t = self._next_frame_time
+            mode = self.regs[mode_addr]
+            if mode & GET_SINGLE_FRAME:
+                # single frame done; back to idle
+                self.regs[mode_addr] = mode & ~GET_SINGLE_FRAME & 0xFF
+                self._next_frame_time = None
+            elif mode & CONTINUOUS_STREAM:
+                self._next_frame_time = t + self.get_frame_period()
+            else:
+                self._next_frame_time = None
+                break
+            if self._take_fault('drop'):
+                self._frame_counter += 1
+                continue
+            delay = self.slow_delay if self._take_fault('slow') else 0.
+            self._scheduled.append((t + delay, self._frame_packet(t), True))
+            self._frame_counter += 1
+        # deliver in order; a late frame holds up the ones behind it
+        while self._scheduled and self._scheduled[0][0] <= now:
+            _, packet, is_frame = self._scheduled.popleft()
+            self._out += packet
+            self.frames_sent += is_frame
+
+    def _next_event(self):
+        """Time at which more output may become available, or None"""
+        times = []
+        if self._scheduled:
+            times.append(self._scheduled[0][0])
+        if self._next_frame_time is not None:
+            times.append(self._next_frame_time)
+        return min(times) if times else None
+
+    def _regread(self, addr):
+        if self.regs[regmap['FLASH_CTRL']] & 0x01 and addr < len(self.flash):
+            return self.flash[addr]
+        return self.regs[addr]
+
+    def _regwrite(self, addr, value, now):
+        if self.regs[regmap['FLASH_CTRL']] & 0x01 and addr < len(self.flash)\
+           and addr != regmap['FLASH_CTRL']:
+            self.flash[addr] = value
+            return
+        if addr == regmap['SENXOR_POWERUP']:
+            return
+        if addr == regmap['FRAME_MODE']:
+            capture = value & (GET_SINGLE_FRAME | CONTINUOUS_STREAM)
+            if capture and self._next_frame_time is None:
+                # the first frame takes a frame period to integrate
+                self._next_frame_time = now + self.get_frame_period()
+            elif not capture:
+                self._next_frame_time = None
+        self.regs[addr] = value & ~_SELF_CLEARING.get(addr, 0)
+
+    def _process_commands(self, now):
+        """Execute the complete commands written by the host"""
+        buf = self._in
+        while True:
+            i = buf.find(USB_SYNC)
+            if i < 0:
+                del buf[:max(0, len(buf) - len(USB_SYNC) + 1)]
+                return
+            j = i + len(USB_SYNC)
+            if len(buf) < j + 4:
+                return
+            try:
+                n = int(bytes(buf[j: j + 4]), base=16)
+            except ValueError:
+                del buf[:j]
+                continue
+            if len(buf) < j + 4 + n:
+                return
+            cmd = bytes(buf[j + 4: j + 4 + n])
+            del buf[:j + 4 + n]
+            self.commands += 1
+            name = cmd[:4]
+            try:
+                addr = int(cmd[4:6], base=16)
+                if name == b'RREG':
+                    self._ack(name, '{:02X}'.format(self._regread(addr)).
+                              encode(), now)
+                elif name == b'WREG':
+                    self._regwrite(addr, int(cmd[6:8], base=16), now)
+                    self._ack(name, now=now)
+                else:
+                    logger.debug('Emulator ignoring command %s', cmd)
+            except ValueError:
+                logger.debug('Emulator ignoring malformed command %s', cmd)
+
+    # ---------------------------------
+    # serial.Serial-like interface
+    # ---------------------------------
+    def write(self, data):
+        with self._lock:
+            now = time.monotonic()
+            # frames due already precede the acknowledges
+            self._produce(now)
+            self._in += data
+            self._process_commands(now)
+        return len(data)
+
+    @property
+    def in_waiting(self):
+        with self._lock:
+            self._produce(time.monotonic())
+            return len(self._out)
+
+    def read(self, size=1):
+        """Return up to `size` bytes; fewer only on timeout"""
+        deadline = None if self.timeout is None else\
+                   time.monotonic() + self.timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._produce(now)
+                if len(self._out) >= size or\
+                   (deadline is not None and now >= deadline):
+                    data = bytes(self._out[:size])
+                    del self._out[:size]
+                    return data
+                wake = self._next_event()
+            if deadline is not None:
+                wake = deadline if wake is None else min(wake, deadline)
+            # nothing may ever come without a deadline; poll for writes
+            # from other threads
+            time.sleep(max(0., min(wake - now, 0.05)) if wake is not None
+                       else 0.05)
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        n = len(data)
+        b[:n] = data
+        return n
+
+    def reset_input_buffer(self):
+        with self._lock:
+            self._produce(time.monotonic())
+            self._out.clear()
+            self._scheduled.clear()
+
+    def reset_output_buffer(self):
+        with self._lock:
+            self._in.clear()
+
+    def open(self):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def get_stats(self):
+        """Return the emulator counters as a dictionary"""
+        return {
+            'commands': self.commands,
+            'frames_sent': self.frames_sent,
+            'frame_counter': self._frame_counter,
+            'faults': dict(self.faults),
+        }
+
+
+def connect_emulator(resolution=(80, 62), name='emulator', profile_cache=None,
+                     **kwargs):
+    """
+    Return an MI48 connected to a new MI48Emulator, the way
+    connect_senxor connects to a camera; `kwargs` go to MI48Emulator.
+    """
+    port = MI48Emulator(resolution, **kwargs)
+    usb = USB_Interface(port, bulk_read=True)
+    return MI48([usb, usb], name=name, profile_cache=profile_cache)
@@ -14,11 +14,11 @@ logger = logging.getLogger(__name__)
 
 def cksum(data, sum=0):
     """Calculate simple sum over data, allowing for non-zero init"""
-    sum = sum
-    for byte in data:
-        sum += byte
-    #
-    return sum
+    # Vectorised sum over the bytes; the data may be any object exposing
+    # the buffer protocol (bytes, bytearray, memoryview).
+    # A GFRA payload is ~10 KB, so a python loop here is very costly.
+    data = np.frombuffer(data, dtype=np.uint8)
+    return sum + int(data.sum(dtype=np.uint64))
 
 
 class I2C_Interface:
@@ -145,13 +145,185 @@ USB_CMD_LEN = 4
 USB_ACK_LEN = 4
 USB_CKS_LEN = 4  # check sum
 USB_HDR_LEN = 320
+USB_SYNC = b'   #'  # marker preceding every acknowledge
+USB_MAX_ACK_LEN = 0xFFFF  # the length field is 4 hex digits
+
+
+class USB_StreamParser:
+    """
+    Incremental parser of the acknowledge stream coming from the MI48.
+
+    Bytes from the port are appended to a buffer, which is compacted in
+    place as packets are consumed, so that a packet is always contiguous.
+    The parser works as a state machine: scan for the sync marker, then
+    validate the length field, then wait for the complete packet and
+    verify its check sum.  A damaged packet is dropped by skipping past
+    its marker and scanning for the next one, so that any good packets
+    already received are not lost.
+
+    The counters `resyncs`, `dropped_bytes`, `cksum_errors` and
+    `length_errors` can be used to monitor link quality.
+    """
+    SYNC, LENGTH, PAYLOAD = 0, 1, 2
+
+    def __init__(self, size=0x10000):
+        self._buf = bytearray(size)
+        self._head = 0  # start of unparsed data
+        self._tail = 0  # end of valid data
+        self._state = self.SYNC
+        self._ack_len = 0
+        self.packets = 0
+        self.resyncs = 0
+        self.dropped_bytes = 0
+        self.cksum_errors = 0
+        self.length_errors = 0
+
+    def __len__(self):
+        """Number of buffered, not yet parsed bytes"""
+        return self._tail - self._head
+
+    def reset(self):
+        """Drop all buffered data (counters are preserved)"""
+        self._head = self._tail = 0
+        self._state = self.SYNC
+
+    def _reserve(self, nbytes):
+        """Ensure room for `nbytes` past the tail; return writable view"""
+        if self._tail + nbytes > len(self._buf):
+            n = self._tail - self._head
+            if n + nbytes > len(self._buf):
+                # allocate rather than resize: views of the old buffer
+                # may still be held by the caller
+                buf = bytearray(max(2 * len(self._buf), n + nbytes))
+                buf[:n] = self._buf[self._head: self._tail]
+                self._buf = buf
+            else:
+                self._buf[:n] = self._buf[self._head: self._tail]
+            self._head, self._tail = 0, n
+        return memoryview(self._buf)[self._tail: self._tail + nbytes]
+
+    def feed(self, data):
+        """Append bytes received by other means to the buffer"""
+        n = len(data)
+        self._reserve(n)[:] = data
+        self._tail += n
+
+    def fill(self, port):
+        """
+        Read from `port` what is available or needed to complete the
+        current packet, subject to the port timeout.
+
+        Return the number of bytes read; 0 means timeout.
+        """
+        if self._state == self.PAYLOAD:
+            need = len(USB_SYNC) + self._ack_len + USB_CKS_LEN
+        else:
+            need = len(USB_SYNC) + USB_ACK_LEN
+        need = max(need - len(self), getattr(port, 'in_waiting', 0), 1)
+        # in the payload, this receives the rest of the packet, e.g. a
+        # whole frame, with readinto straight into the buffer
+        n = usb_readinto(port, self._reserve(need))
+        self._tail += n
+        return n
+
+    def _drop(self, nbytes):
+        self._head += nbytes
+        self.dropped_bytes += nbytes
+
+    def _resync(self):
+        """Give up on the packet at head; look for the next marker"""
+        self.resyncs += 1
+        self._drop(len(USB_SYNC))
+        self._state = self.SYNC
+
+    def next_packet(self):
+        """
+        Return the next valid packet as (cmd, data), or None if more
+        bytes are needed.
+
+        `cmd` is bytes; `data` is a memoryview into the internal buffer,
+        which is valid only until the next `fill` or `feed`.
+        """
+        buf = self._buf
+        while True:
+            if self._state == self.SYNC:
+                i = buf.find(USB_SYNC, self._head, self._tail)
+                if i < 0:
+                    # keep a tail that may be the start of a marker
+                    keep = min(len(USB_SYNC) - 1, len(self))
+                    skip = len(self) - keep
+                    if skip:
+                        self._drop(skip)
+                    return None
+                if i > self._head:
+                    self.resyncs += 1
+                    self._drop(i - self._head)
+                self._state = self.LENGTH
+            if self._state == self.LENGTH:
+                if len(self) < len(USB_SYNC) + USB_ACK_LEN:
+                    return None
+                i = self._head + len(USB_SYNC)
+                try:
+                    ack_len = int(bytes(buf[i: i + USB_ACK_LEN]), base=16)
+                except ValueError:
+                    ack_len = -1
+                if ack_len < USB_ACK_LEN + USB_CMD_LEN or\
+                   ack_len > USB_MAX_ACK_LEN:
+                    logger.debug('Bad USB ack length: %s',
+                                 bytes(buf[i: i + USB_ACK_LEN]))
+                    self.length_errors += 1
+                    self._resync()
+                    continue
+                self._ack_len = ack_len
+                self._state = self.PAYLOAD
+            # PAYLOAD
+            i = self._head + len(USB_SYNC)
+            end = i + self._ack_len + USB_CKS_LEN
+            if end > self._tail:
+                return None
+            cks = bytes(buf[i + self._ack_len: end])
+            try:
+                cks = int(cks, base=16)
+            except ValueError:
+                cks = -1
+            cs = cksum(memoryview(buf)[i: i + self._ack_len]) & 0xFFFF
+            if cs != cks:
+                logger.warning('Check sum mismatch: calculated %#x, '
+                               'received %#x', cs, cks)
+                self.cksum_errors += 1
+                self._resync()
+                continue
+            cmd = bytes(buf[i + USB_ACK_LEN: i + USB_ACK_LEN + USB_CMD_LEN])
+            data = memoryview(buf)[i + USB_ACK_LEN + USB_CMD_LEN:
+                                   i + self._ack_len]
+            self._head = end
+            self._state = self.SYNC
+            self.packets += 1
+            return cmd, data
+
+    def get_stats(self):
+        """Return the link quality counters as a dictionary"""
+        return {
+            'packets': self.packets,
+            'resyncs': self.resyncs,
+            'dropped_bytes': self.dropped_bytes,
+            'cksum_errors': self.cksum_errors,
+            'length_errors': self.length_errors,
+        }
+
 
 class USB_Interface:
     """USB interface object to access a connected device"""
 
-    def __init__(self, port):
+    def __init__(self, port, bulk_read=False):
         self.port = port
         self.log = logger
+        # All acknowledges are received through the stream parser, which
+        # resynchronises on corrupted packets without flushing the port
+        self.parser = USB_StreamParser()
+        # In bulk read mode, GFRA frames are returned as a view into the
+        # parser buffer, without a copy
+        self.bulk_read = bulk_read
 
     def open(self):
         self.port.open()
@@ -162,6 +334,7 @@ class USB_Interface:
 
     def reset_input_buffer(self):
         self.port.reset_input_buffer()
+        self.parser.reset()
 
     def reset_output_buffer(self):
         self.port.reset_output_buffer()
@@ -173,7 +346,7 @@ class USB_Interface:
             cmd = 'RREG{:02X}XXXXXX'.format(reg)
             cmd = '   #{:04X}{}'.format(len(cmd), cmd)
             cmd_name = 'GET_{}'.format(regname)
-            result = usb_command(self.port, cmd, cmd_name)
+            result = usb_command(self.port, cmd, cmd_name, parser=self.parser)
             if result is None: return
             if not isinstance(result, int):
                 # a non int would be a GFRA coming back before the RREG
@@ -185,46 +358,197 @@ class USB_Interface:
         cmd = 'WREG{:02X}{:02X}XXXX'.format(reg, value)
         cmd = '   #{:04X}{}'.format(len(cmd), cmd)
         cmd_name = 'SET_{}'.format(regname)
-        usb_command(self.port, cmd, cmd_name)
+        usb_command(self.port, cmd, cmd_name, parser=self.parser)
         return None
 
+    def regread_many(self, regs, regnames=None, batch=16):
+        """
+        Read several control/status registers, pipelining the commands.
+
+        Up to `batch` RREG commands are sent back to back before their
+        acknowledges are collected; the MI48 acknowledges in order, and
+        interleaved GFRA packets are skipped. If an acknowledge is lost,
+        the late acknowledges of that batch are waited out and discarded,
+        and its registers are read again one by one.
+        Return a list of register values.
+        """
+        if regnames is None:
+            regnames = [''] * len(regs)
+        values = []
+        for i in range(0, len(regs), batch):
+            _regs = regs[i: i + batch]
+            _names = regnames[i: i + batch]
+            cmds = []
+            for reg in _regs:
+                cmd = 'RREG{:02X}XXXXXX'.format(reg)
+                cmds.append('   #{:04X}{}'.format(len(cmd), cmd))
+            self.port.write(''.join(cmds).encode())
+            _values = self._collect_acks('RREG', len(_regs))
+            if len(_values) < len(_regs):
+                # acks match by name only, so any still due from this
+                # batch would answer the reads below
+                late = self._collect_acks('RREG')
+                self.log.debug('Lost RREG acknowledge in batch; discarded '
+                               '%d late; reading registers one by one',
+                               len(late))
+                _values = [self.regread(reg, name)
+                           for reg, name in zip(_regs, _names)]
+            elif logger.isEnabledFor(logging.DEBUG):
+                for cmd, value in zip(cmds, _values):
+                    logger.debug('%s', fmt_usb_cmd(cmd, value))
+            values += _values
+        return values
+
+    def _collect_acks(self, name, count=None):
+        """
+        Return the data of up to `count` `name` acknowledges, skipping
+        other packets; stop once none has arrived for the port timeout.
+        """
+        return usb_collect_acks(self.port, self.parser, name, count)
+
     def read(self, size_in_words):
         """Read a GFRA acknowledge, remove USB header, and return data frame.
 
         The returned data frame is a 1-D numpy array of unsigned int16.
+        In bulk read mode, this array is a view into a buffer reused by
+        the next read, so copy it if it must persist.
         """
-        cmd, data = usb_acknowledge(self.port)
+        if self.bulk_read:
+            return self.read_frame(size_in_words)
+        cmd, data = usb_acknowledge(self.port, self.parser)
         if cmd == 'GFRA':
             # data is a sequence (1-d array) of 16-bit unsigned ints
             # here we drop the USB header 
-            return data[-size_in_words:]
+            return data[-size_in_words:].copy()
         else:
-            self.log.warning('read returned {} acknowledge.'.format(cmd))
+            self.log.warning('read returned %s acknowledge.', cmd)
+            return None
+
+    def read_frame(self, size_in_words):
+        """Receive a GFRA acknowledge and return a view of the frame.
+
+        The acknowledge is received with `readinto` straight into the
+        parser buffer and its check sum is vectorised. The returned 1-D
+        array of uint16 shares memory with that buffer, and is valid
+        only until the next read from this interface.
+
+        Return None on timeout or non-GFRA acknowledge.
+        """
+        packet = self.get_packet()
+        if packet is None:
             return None
+        cmd, data = packet
+        if cmd != b'GFRA':
+            self.log.warning('read_frame returned %s acknowledge.', cmd)
+            return None
+        # view of the pixel words, dropping the USB header
+        data = np.frombuffer(data, dtype='u2', count=len(data) // 2)
+        return data[-size_in_words:]
+
+    def trigger_frame(self, reg, value, size_in_words, timeout=1.0,
+                      regname=""):
+        """Write a register that triggers a frame and return the frame.
+
+        The write is not acknowledged separately: the WREG and GFRA
+        acknowledges are collected as they come, saving a round trip.
+        A GFRA received before the WREG acknowledge predates the trigger
+        (e.g. the late frame of a previous trigger) and is discarded.
 
+        Return the frame as `read` would, or None if it does not arrive
+        within `timeout` seconds.
+        """
+        cmd = 'WREG{:02X}{:02X}XXXX'.format(reg, value)
+        cmd = '   #{:04X}{}'.format(len(cmd), cmd)
+        deadline = time.monotonic() + timeout
+        self.port.write(cmd.encode())
+        acknowledged = False
+        while time.monotonic() < deadline:
+            packet = self.get_packet(deadline)
+            if packet is None:
+                continue
+            _cmd, data = packet
+            if _cmd == b'WREG':
+                acknowledged = True
+                logger.debug('SET_%s: %s', regname, cmd)
+            elif _cmd == b'GFRA' and acknowledged:
+                data = np.frombuffer(data, dtype='u2', count=len(data) // 2)
+                data = data[-size_in_words:]
+                return data if self.bulk_read else data.copy()
+            else:
+                logger.debug('trigger_frame skipping stale %s acknowledge',
+                             _cmd)
+        return None
 
-def usb_command(port, cmd: str, cmd_name='', verbose=True):
-    """send command to MI48 via USB and return its acknowledge"""
+    def get_packet(self, deadline=None):
+        """
+        Return the next valid (cmd, data) packet, or None on timeout or
+        past the `deadline` (time.monotonic)
+        """
+        return usb_get_packet(self.port, self.parser, deadline)
+
+    def get_link_stats(self):
+        """Return the link quality counters of the stream parser"""
+        return self.parser.get_stats()
+
+
+def usb_command(port, cmd: str, cmd_name='', verbose=True, parser=None):
+    """send command to MI48 via USB and return its acknowledge
+
+    If a stream `parser` is given, acknowledges of other commands, e.g.
+    GFRA frames, are skipped instead of flushing the input buffer, and
+    the command is sent again only if its acknowledge times out.
+    """
     _cmd = ''
+    sent = 0
     while _cmd != cmd[8:12]:
         # host command
         port.write(cmd.encode())
+        sent += 1
         # device ack
+        if parser is not None:
+            while True:
+                packet = usb_get_packet(port, parser)
+                if packet is None:
+                    # timeout; send the command again
+                    _cmd = ''
+                    break
+                _cmd, data = usb_parse_ack(*packet)
+                if _cmd == cmd[8:12]:
+                    break
+                if verbose:
+                    logger.debug('Expected ACK: %s, rcvd: %s; skipping',
+                                 cmd[8:12], _cmd)
+            continue
         _cmd, data = usb_acknowledge(port)
         if _cmd != cmd[8:12]:
             if verbose:
-                logger.debug('Expected ACK: {}, rcvd: {}'.
-                             format(cmd[8:12], _cmd))
+                logger.debug('Expected ACK: %s, rcvd: %s', cmd[8:12], _cmd)
                 logger.debug('Resetting input buffer')
             port.reset_input_buffer()
+    if parser is not None and sent > 1:
+        # the acknowledges of the earlier sends may still come, and
+        # would answer the next commands
+        late = usb_collect_acks(port, parser, cmd[8:12], sent - 1)
+        logger.debug('Discarded %d late %s acknowledges',
+                     len(late), cmd[8:12])
     if _cmd == 'RREG':
         assert isinstance(data, int)
     # report
-    if verbose: logger.debug('{}'.format(fmt_usb_cmd(cmd, data)))
+    if verbose and logger.isEnabledFor(logging.DEBUG):
+        logger.debug('%s', fmt_usb_cmd(cmd, data))
     return data
 
-def usb_acknowledge(port):
-    """Receive the EVK acknowledge and parse it"""
+def usb_acknowledge(port, parser=None):
+    """Receive the EVK acknowledge and parse it
+
+    If a stream `parser` is given, corrupted acknowledges are skipped
+    by the parser, without resetting the input buffer.
+    """
+    if parser is not None:
+        packet = None
+        while packet is None:
+            packet = usb_get_packet(port, parser)
+        return usb_parse_ack(*packet)
     ack = None
     # this loop will make the program hang if ser.read()
     # has no timeout configured!
@@ -238,6 +562,54 @@ def usb_acknowledge(port):
     parsed = usb_parse_ack(*ack)
     return parsed
 
+def usb_get_packet(port, parser, deadline=None):
+    """
+    Return the next valid (cmd, data) from `parser`; None on timeout,
+    or once past the `deadline` (time.monotonic) if given.
+    """
+    while True:
+        packet = parser.next_packet()
+        if packet is not None:
+            return packet
+        if deadline is None:
+            if not parser.fill(port):
+                return None
+            continue
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        timeout = port.timeout
+        if timeout is not None and timeout <= remaining:
+            n = parser.fill(port)
+        else:
+            # wait no longer than the deadline for this read
+            port.timeout = remaining
+            try:
+                n = parser.fill(port)
+            finally:
+                port.timeout = timeout
+        if not n:
+            return None
+
+def usb_collect_acks(port, parser, name, count=None):
+    """
+    Return the data of up to `count` `name` acknowledges from `parser`,
+    skipping other packets; stop once none has arrived for the port
+    timeout.
+    """
+    quiet = getattr(port, 'timeout', None) or 1.0
+    deadline = time.monotonic() + quiet
+    acks = []
+    while count is None or len(acks) < count:
+        packet = usb_get_packet(port, parser)
+        ack = None if packet is None else usb_parse_ack(*packet)
+        if ack is not None and ack[0] == name:
+            acks.append(ack[1])
+            deadline = time.monotonic() + quiet
+        elif time.monotonic() > deadline:
+            break
+    return acks
+
 def usb_parse_ack(cmd:str, data:bytes):
     """
     Parse command and return the command string and a data item.
@@ -255,10 +627,10 @@ def usb_parse_ack(cmd:str, data:bytes):
         return cmd, None
     if cmd == 'RREG':
         # read command returns only a register value
-        return cmd, int(data.decode(), base=16)
+        return cmd, int(bytes(data).decode(), base=16)
     if cmd == 'SERR':
         # I have no info on what SERR contains... undocumented
-        return cmd, data.decode()
+        return cmd, bytes(data).decode()
     if cmd == 'GFRA':
         # Frame acknowledge contains unencoded unsigned 16-bit ints
         data = np.frombuffer(data, dtype='u2')
@@ -273,18 +645,8 @@ def usb_get_ack(port):
 
     Return bytes.
     """
-    res = ''
-    while res != '   #':
-        res = port.read(4)
-        if res is None:
-            # likely the result of interface.read timeout (e.g. for USB)
-            return None
-        try:
-            res = res.decode()
-        except UnicodeDecodeError:
-            # This will happen if we're draining USB buffer from GFRA ack.
-            # so we ignore till we reach the beginning of the next frame.
-            res = ''
+    if not usb_get_sync(port):
+        return None
 
     # Read the length field and start check sum calculation
     _len = port.read(USB_ACK_LEN)
@@ -312,14 +674,49 @@ def usb_get_ack(port):
         cks = int(cks, base=16)
     except ValueError:
         # if host too slow, we get invalid literals here
-        logger.error('Bad USB check sum literals for {}: {}'.format(cmd, cks))
+        logger.error('Bad USB check sum literals for %s: %s', cmd, cks)
         return None
     if cs != cks:
-        logger.error('Check sum mismatch: calculated {}, received {}'.
-                    format(hex(cs), hex(cks)))
+        logger.error('Check sum mismatch: calculated %#x, received %#x',
+                     cs, cks)
         return None
     return cmd, data
 
+def usb_get_sync(port):
+    """Read up to and including the '   #' marker; False on timeout"""
+    res = ''
+    while res != '   #':
+        res = port.read(4)
+        if res is None:
+            # likely the result of interface.read timeout (e.g. for USB)
+            return False
+        try:
+            res = res.decode()
+        except UnicodeDecodeError:
+            # This will happen if we're draining USB buffer from GFRA ack.
+            # so we ignore till we reach the beginning of the next frame.
+            res = ''
+    return True
+
+def usb_readinto(port, buf):
+    """
+    Fill the writable `buf` from the port; return the number of bytes
+    read, which is less than len(buf) on timeout.
+    """
+    n, size = 0, len(buf)
+    while n < size:
+        try:
+            k = port.readinto(buf[n:])
+        except AttributeError:
+            # port has no readinto; fall back to read and copy
+            chunk = port.read(size - n)
+            k = len(chunk)
+            buf[n: n + k] = chunk
+        if not k:
+            break
+        n += k
+    return n
+
 def fmt_usb_cmd(cmd, data):
     """Command is a string already; here we return a more informative one"""
     s = []
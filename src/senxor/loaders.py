@@ -0,0 +1,218 @@
+# Copyright (C) Meridian Innovation Ltd. Hong Kong, 2020. All rights reserved.
+#
+"""
+Fast loading of SenXorViewer CSV captures.
+
+A capture has one row per frame: a few header columns (the timestamp
+first, Vdd and the SenXor temperature in columns 2 and 3), followed by
+the pixel values. The file is parsed in chunks of rows, with the
+timestamps converted for a whole chunk at once, and the result is saved
+once as flat binary files next to the CSV:
+
+    <filename>.cache/
+        meta.json   -- shapes, dtypes, and size/mtime of the CSV
+        time.bin    -- float64, microseconds since the epoch (UTC)
+        vdd.bin, tsx.bin, frames.bin -- float32
+
+Subsequent loads memory-map these files, so they are instant whatever
+the length of the capture, and only the frames used are read from disk.
+"""
+import os
+import json
+import shutil
+import datetime
+import logging
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 1
+CSV_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f%z'
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def get_cache_dir(filename):
+    return '{}.cache'.format(filename)
+
+
+def _tz_suffix_len(s):
+    """Length of the UTC-offset suffix of an ISO time string"""
+    if s.endswith('Z'):
+        return 1
+    if len(s) > 6 and s[-6] in '+-' and s[-3] == ':':
+        return 6
+    if len(s) > 5 and s[-5] in '+-' and s[-4:].isdigit():
+        return 5
+    return 0
+
+def _utc_us(dt):
+    """Microseconds since the epoch of `dt`; naive times are taken as UTC"""
+    offset = dt.utcoffset() or datetime.timedelta(0)
+    return ((dt.replace(tzinfo=None) - _EPOCH - offset) /
+            datetime.timedelta(microseconds=1))
+
+def stptime2float_array(strings, fmt=CSV_TIME_FORMAT):
+    """
+    Vectorised stptime2float: convert a sequence of time strings to
+    float microseconds since the epoch, UTC.
+
+    Strings of one length (the usual case for a fixed format) are parsed
+    by numpy in one go, and the UTC offset of every distinct suffix is
+    parsed once, so offsets may change within the sequence, e.g. with
+    daylight saving. Otherwise, fall back to parsing one at a time.
+    """
+    s = np.char.strip(np.asarray(strings, dtype=str))
+    if s.size == 0:
+        return np.empty(0)
+    s0 = str(s.flat[0])
+    n = len(s0)
+    lengths = np.char.str_len(s)
+    if fmt == CSV_TIME_FORMAT and (lengths == n).all():
+        k = _tz_suffix_len(s0)
+        try:
+            flat = s.reshape(-1).astype('U{}'.format(n))
+            # casting to a shorter string type cuts off the UTC offset
+            t = flat.astype('U{}'.format(n - k)).astype('datetime64[us]')
+            t = t.astype(np.int64).astype(float)
+            if k:
+                suffixes = flat.view('U1').reshape(-1, n)[:, n - k:]
+                suffixes = np.ascontiguousarray(suffixes).view(
+                    'U{}'.format(k)).ravel()
+                _, first, index = np.unique(suffixes, return_index=True,
+                                            return_inverse=True)
+                offsets = np.array([
+                    datetime.datetime.strptime(flat[i], fmt).utcoffset() /
+                    datetime.timedelta(microseconds=1) for i in first])
+                t -= offsets[index.ravel()]
+            return t.reshape(s.shape)
+        except (ValueError, TypeError):
+            pass
+    return np.array([_utc_us(datetime.datetime.strptime(x, fmt))
+                     for x in s.flat]).reshape(s.shape)
+
+
+def _is_number(s):
+    try:
+        float(s)
+        return True
+    except ValueError:
+        return False
+
+
+def parse_senxor_csv(filename, npixels=4960, time_col=0, vdd_col=2,
+                     tsx_col=3, chunk_rows=1024):
+    """
+    Yield the capture in `filename` as chunks of (time, vdd, tsx, frames)
+    arrays, of at most `chunk_rows` rows each.
+
+    A first line that is not numeric in its last column is taken as
+    column titles and skipped.
+    """
+    with open(filename) as f:
+        first = f.readline()
+        if not first:
+            return
+        lines = [] if not _is_number(first.rsplit(',', 1)[-1]) else [first]
+        nhead = len(first.split(',')) - npixels
+        if nhead < 0:
+            raise ValueError('{}: fewer than {} pixel columns'.
+                             format(filename, npixels))
+        while True:
+            while len(lines) < chunk_rows:
+                line = f.readline()
+                if not line:
+                    break
+                if line.strip():
+                    lines.append(line)
+            if not lines:
+                return
+            # the few header columns are split in python; the pixels
+            # by the C parser of loadtxt
+            head = [line.split(',', nhead)[:nhead] for line in lines]
+            frames = np.loadtxt(lines, delimiter=',', dtype=np.float32,
+                                usecols=range(nhead, nhead + npixels),
+                                ndmin=2)
+            head = np.array(head, dtype=str).reshape(len(lines), nhead)
+            try:
+                t = stptime2float_array(head[:, time_col])
+            except (ValueError, IndexError):
+                t = np.full(len(lines), np.nan)
+            vdd = head[:, vdd_col].astype(np.float32)
+            tsx = head[:, tsx_col].astype(np.float32)
+            yield t, vdd, tsx, frames
+            lines = []
+
+
+def _source_stamp(filename):
+    st = os.stat(filename)
+    return {'size': st.st_size, 'mtime': st.st_mtime}
+
+def convert_senxor_csv(filename, npixels=4960, **kwargs):
+    """
+    Parse the capture in `filename` into its binary cache directory;
+    return the cache directory. `kwargs` go to parse_senxor_csv.
+    """
+    cache = get_cache_dir(filename)
+    tmp = cache + '.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    names = ['time', 'vdd', 'tsx', 'frames']
+    files = [open(os.path.join(tmp, name + '.bin'), 'wb') for name in names]
+    nrows = 0
+    try:
+        for chunk in parse_senxor_csv(filename, npixels, **kwargs):
+            for f, data in zip(files, chunk):
+                f.write(np.ascontiguousarray(data).tobytes())
+            nrows += len(chunk[0])
+    finally:
+        for f in files:
+            f.close()
+    meta = {
+        'version': CACHE_VERSION,
+        'rows': nrows,
+        'npixels': npixels,
+        'dtypes': {'time': '<f8', 'vdd': '<f4', 'tsx': '<f4',
+                   'frames': '<f4'},
+        'source': _source_stamp(filename),
+    }
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    shutil.rmtree(cache, ignore_errors=True)
+    os.replace(tmp, cache)
+    return cache
+
+
+def load_senxor_csv(filename, npixels=4960, **kwargs):
+    """
+    Return the capture in `filename` as a dictionary of memory-mapped
+    arrays: 'time', 'vdd', 'tsx' and 'frames' (rows, npixels).
+
+    The CSV is converted to its binary cache on first use, or whenever
+    it changed since.
+    """
+    cache = get_cache_dir(filename)
+    try:
+        with open(os.path.join(cache, 'meta.json')) as f:
+            meta = json.load(f)
+        valid = meta.get('version') == CACHE_VERSION and\
+                meta.get('npixels') == npixels and\
+                meta.get('source') == _source_stamp(filename)
+    except (OSError, ValueError):
+        valid = False
+    if not valid:
+        logger.info('Converting {} to binary'.format(filename))
+        convert_senxor_csv(filename, npixels, **kwargs)
+        with open(os.path.join(cache, 'meta.json')) as f:
+            meta = json.load(f)
+    n = meta['rows']
+    result = {}
+    for name, dtype in meta['dtypes'].items():
+        shape = (n, npixels) if name == 'frames' else (n,)
+        path = os.path.join(cache, name + '.bin')
+        if n == 0:
+            result[name] = np.empty(shape, dtype=dtype)
+        else:
+            result[name] = np.memmap(path, dtype=dtype, mode='r',
+                                     shape=shape)
+    return result
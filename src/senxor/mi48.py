@@ -7,20 +7,64 @@ import functools
 import time
 import struct
 import array
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 
+
+logger = logging.getLogger(__name__)
+
+# Loggers of the senxor subsystems, for set_log_level
+LOG_SUBSYSTEMS = {
+    'mi48': 'senxor.mi48',
+    'usb': 'senxor.interfaces',
+    'aio': 'senxor.aio',
+    'acquisition': 'senxor.acquisition',
+    'multicam': 'senxor.multicam',
+    'profiles': 'senxor.profiles',
+}
+
 # For CRC reference start with http://crcmod/sourceforge.net/crcmod.predefined.html
 # The MI48 implements the CRC-16/CCITT-FALSE
 # polynomial = 0x11021, init=0xFFFF, reversed=False, xor-out=0x0000,
 # check=0x29B1 (for input of b'123456789)
-import crcmod.predefined
+CRC16_POLY = 0x1021
+CRC16_INIT = 0xFFFF
+
+def logger_wrapper(name, level, msg, *args, exc_info=None, logger=None):
+    """
+    Log `msg` prefixed by `name`.
 
-def logger_wrapper(name, level, msg, exc_info=None, logger=None):
-    _msg = '{:12s} {}'.format(name, msg)
-    if logger == None:
-        logging.log(level, _msg, exc_info=exc_info)
+    Formatting is deferred until the level is known to be enabled: pass
+    the values as `args` to be filled into the {} fields of `msg`,
+    instead of formatting `msg` in the call.
+    """
+    if logger is None:
+        logger = logging.getLogger(__name__)
+    if not logger.isEnabledFor(level):
+        return
+    if args:
+        msg = msg.format(*args)
+    logger.log(level, '%-12s %s', name, msg, exc_info=exc_info)
+
+def set_log_level(level, subsystem=None):
+    """
+    Set the log level of a senxor `subsystem`, one of LOG_SUBSYSTEMS,
+    or of all of them if None.
+
+    E.g. set_log_level(logging.WARNING, 'usb') leaves the register and
+    frame I/O with next to no logging cost, while other subsystems
+    keep logging at their own level.
+    """
+    if subsystem is None:
+        name = 'senxor'
     else:
-        logger.log(level, _msg, exc_info=exc_info)
+        try:
+            name = LOG_SUBSYSTEMS[subsystem]
+        except KeyError:
+            raise ValueError('Subsystem must be one of {}'.
+                             format(list(LOG_SUBSYSTEMS)))
+    logging.getLogger(name).setLevel(level)
 
 # =======================
 # MI48xx specific objects
@@ -37,6 +81,21 @@ SPIHDR_TIME  = 3   # two words
 SPIHDR_MAXV  = 5
 SPIHDR_MINV  = 6
 SPIHDR_CRC   = 7
+SPIHDR_TIME_UNIT = 1.e-3  # seconds per tick of the header timestamp
+
+# Decoded frame header; all fields keep the integer units of the MI48:
+# senxor_vdd in 0.1 mV, senxor_temperature in 0.01 K, pixel_max and
+# pixel_min in 0.1 K, timestamp combined from its two words
+FRAME_HEADER_DTYPE = np.dtype([
+    ('frame_counter',      np.uint16),
+    ('senxor_vdd',         np.uint16),
+    ('senxor_temperature', np.uint16),
+    ('timestamp',          np.uint32),
+    ('pixel_max',          np.uint16),
+    ('pixel_min',          np.uint16),
+    ('crc',                np.uint16),
+    ('crc_ok',             np.int8),   # 1 pass, 0 fail, -1 not checked (yet)
+])
 
 DEFAULT_CTRL_STAT = {
     'FRAME_MODE': 0x20,
@@ -86,6 +145,24 @@ regmap = {
     "SENXOR_ID_5"   : 0xE5,  # R  Serial number of the attached camera module
 }
 
+# reverse of regmap, for logging; the first name of an address wins
+_regnames = {}
+for _name, _addr in regmap.items():
+    _regnames.setdefault(_addr, _name)
+
+# Registers that may change without a write from the host, or whose
+# written bits do not read back as written; these bypass the register
+# shadow cache and are always read from the MI48
+VOLATILE_REGS = ['EVK_TEST', 'SENXOR_POWERUP', 'FRAME_MODE', 'STATUS',
+                 'FILTER_CTRL', 'FLASH_CTRL']
+# Bits that clear themselves after a write, {'RegName': mask}
+SELF_CLEARING_BITS = {
+    'FILTER_CTRL': 0x02,  # initialise filter 1
+}
+CACHED_REG_ADDRS = set(addr for name, addr in regmap.items()
+                       if name not in VOLATILE_REGS) -\
+                   set(regmap[name] for name in VOLATILE_REGS)
+
 MI48_FRAME_MODE    = 0xB1  # RW Control the capture and readout of thermal data 
 MI48_FW_VERSION_1  = 0xB2  # R  Firmware Version (Major, Minor)
 MI48_FW_VERSION_2  = 0xB3  # R  Firmware Version (Build)
@@ -132,6 +209,7 @@ SENXOR_NAME = {
     2: 'MI0301',
     3: 'MI0802',
     4: 'MI0802',
+    8: 'panther',
 }
 
 FPA_SHAPE = {
@@ -153,7 +231,174 @@ FPA_SHAPE = {
 }
 
 
-crc16 = crcmod.predefined.mkCrcFun('crc-ccitt-false')
+def _crc16_powers(n):
+    """
+    Return x^k mod P, the CRC-16 polynomial, for k in range(n).
+
+    The array is doubled a block at a time: x^(m + j) is the product of
+    x^(16 + j) by x^(m - 16), a linear map over GF(2) applied to all j at
+    once, given by the images x^(m - 16 + i) of the 16 bits i.
+    """
+    pows = np.empty(max(n, 32), dtype=np.uint16)
+    reg = 1
+    for k in range(32):
+        pows[k] = reg
+        reg = ((reg << 1) ^ (CRC16_POLY if reg & 0x8000 else 0)) & 0xFFFF
+    m = 32
+    while m < n:
+        size = min(m - 16, n - m)
+        src = pows[16: 16 + size]
+        block = np.zeros(size, dtype=np.uint16)
+        for i in range(16):
+            block[(src >> i) & 1 == 1] ^= pows[m - 16 + i]
+        pows[m: m + size] = block
+        m += size
+    return pows[:n]
+
+@functools.lru_cache(maxsize=4)
+def get_crc16_tables(nbytes):
+    """
+    Return the position-dependent CRC tables for messages of `nbytes`.
+
+    The CRC is linear over GF(2), so the CRC of a message is the XOR of
+    the contributions of its bytes, each depending on the byte value and
+    on its distance from the end of the message, plus the contribution
+    of the initial value. Return (table, base, init), where
+    table[base[i] + byte] is the contribution of `byte` at position i.
+    The table takes nbytes * 512 bytes of memory, e.g. 20 MB for the
+    frames of a 160x120 camera; it is built on the first CRC check.
+    """
+    nbits = 8 * nbytes
+    pows = _crc16_powers(nbits + 32)
+    # contribution of a single bit k positions from the end: x^(k+16) mod P
+    bits = pows[16: 16 + nbits]
+    # the initial value, shifted through the whole message
+    init = 0
+    for i in range(16):
+        if CRC16_INIT >> i & 1:
+            init ^= int(pows[nbits + i])
+    # order by position from the start, MSbit first within each byte
+    bits = bits[::-1].reshape(nbytes, 8)
+    # the byte values with bit w set are those below w, plus bit w
+    table = np.empty((nbytes, 256), dtype=np.uint16)
+    table[:, 0] = 0
+    for j in range(7, -1, -1):
+        w = 1 << (7 - j)
+        np.bitwise_xor(table[:, :w], bits[:, j, np.newaxis],
+                       out=table[:, w: 2 * w])
+    table = table.ravel()
+    base = np.arange(0, len(table), 256, dtype=np.intp)
+    return table, base, init
+
+def crc16(data):
+    """
+    Return the CRC-16/CCITT-FALSE of `data`, e.g. a uint16 frame.
+
+    `data` may be any contiguous buffer; its bytes are taken in memory
+    order, without conversion. The computation is a single vectorised
+    gather and XOR-reduction over precomputed tables.
+    """
+    data = np.frombuffer(np.ascontiguousarray(data), dtype=np.uint8)
+    table, base, init = get_crc16_tables(len(data))
+    return int(np.bitwise_xor.reduce(table[base + data])) ^ init
+
+# Results of MI48.measure_max_fps, {(sn, fw_version): dict}
+MEASURED_MAX_FPS = {}
+
+# CRC verification policies of MI48.read(), see MI48.set_crc_policy
+CRC_POLICIES = ['all', 'off', 'worker']
+
+# Output formats of MI48.read(); the MI48 delivers uint16 in units of 0.1 K
+OUTPUT_FORMATS = ['raw', 'float16', 'float32']
+
+
+@functools.lru_cache(maxsize=None)
+def get_celsius_lut(dtype='float32'):
+    """
+    Return a 65536-entry lookup table: raw pixel value -> temperature [C].
+
+    Converting through the table is a single gather, without any
+    full-frame temporaries; the entries are the same as those of
+    (raw / 10. + KELVIN_0).astype(dtype).
+    """
+    raw = np.arange(0x10000)
+    lut = (raw / 10. + KELVIN_0).astype(dtype)
+    lut.flags.writeable = False
+    return lut
+
+
+class AcquisitionStats:
+    """
+    Running statistics of frame acquisition health.
+
+    Updated once per frame with a handful of scalar operations, so that it
+    can be left on in production. Dropped frames are detected from gaps in
+    the header frame counter; timing is based on the host clock, keeping
+    the last `window` inter-frame intervals for the jitter percentiles.
+    """
+
+    def __init__(self, window=256):
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        self.frames = 0
+        self.dropped_frames = 0
+        self.counter_resets = 0
+        self.intervals = np.zeros(self.window)
+        self._n_intervals = 0
+        self._last_counter = None
+        self._last_time = None
+        self.t_start = time.monotonic()
+
+    def update(self, header=None, host_time=None):
+        """Account for a frame received at `host_time` (monotonic)"""
+        if host_time is None:
+            host_time = time.monotonic()
+        self.frames += 1
+        if self._last_time is not None:
+            self.intervals[self._n_intervals % self.window] =\
+                    host_time - self._last_time
+            self._n_intervals += 1
+        self._last_time = host_time
+        if header is None:
+            return
+        counter = int(header['frame_counter'])
+        if self._last_counter is not None:
+            # the counter is 16 bit and wraps around
+            gap = (counter - self._last_counter - 1) & 0xFFFF
+            if gap > 0x8000:
+                # counter went backwards; the MI48 restarted capture
+                self.counter_resets += 1
+            else:
+                self.dropped_frames += gap
+        self._last_counter = counter
+
+    def get_fps(self):
+        """Achieved FPS over the recent window"""
+        n = min(self._n_intervals, self.window)
+        if n == 0:
+            return 0.0
+        return float(n / self.intervals[:n].sum())
+
+    def snapshot(self):
+        """Return a dictionary of the statistics; times in ms"""
+        n = min(self._n_intervals, self.window)
+        res = {
+            'frames': self.frames,
+            'dropped_frames': self.dropped_frames,
+            'counter_resets': self.counter_resets,
+            'uptime_s': time.monotonic() - self.t_start,
+            'fps': self.get_fps(),
+        }
+        if n > 0:
+            p50, p90, p99 = 1.e3 * np.percentile(self.intervals[:n],
+                                                  [50, 90, 99])
+            res.update({'interval_p50_ms': float(p50),
+                        'interval_p90_ms': float(p90),
+                        'interval_p99_ms': float(p99),
+                        'jitter_ms': float(1.e3 * self.intervals[:n].std())})
+        return res
 
 
 class MI48:
@@ -161,13 +406,43 @@ class MI48:
     MI48xx abstraction
     """
     def __init__(self, interfaces:list, fps=None, name="MI48",
-                reset_handler=None, data_ready=None, read_raw=False):
-        """Initialise with a serial port"""
+                reset_handler=None, data_ready=None, read_raw=False,
+                profile_cache=None, output=None):
+        """Initialise with a serial port
+
+        `output` selects the format of the frames returned by `read`, one
+        of OUTPUT_FORMATS; by default 'raw' if `read_raw` else 'float16'.
+
+        If a `profile_cache` (see senxor.profiles.ProfileCache) is given
+        and holds a profile for the connected camera and firmware, the
+        camera information is taken from it, instead of read from the MI48.
+        """
         # logging stuff
         self.name = name
-        self.log = functools.partial(logger_wrapper, self.name, logger=None)
+        self.log = functools.partial(logger_wrapper, self.name, logger=logger)
         # interface handles
         self.interfaces = interfaces
+        # shadow of the non-volatile registers, {address: value}
+        self.regcache = {}
+        self.user_flash = False
+        # seconds per parameter of the last flash read/write
+        self.flash_timing = {}
+        # set the format of the returned data and CRC checking; needed
+        # already if a residual frame is dumped during bootup
+        if output is None:
+            output = 'raw' if read_raw else 'float16'
+        self.set_output(output)
+        self.crc_error = False
+        self.crc_errors = 0
+        self.crc_checked = 0
+        self._crc_lock = threading.Lock()
+        self._crc_worker = None
+        self.set_crc_policy('all')
+        self.stats = AcquisitionStats()
+        # trigger-to-frame latency [s] of the recent capture_once calls
+        self.capture_latency = np.zeros(256)
+        self.captures = 0
+        self.capture_timeouts = 0
         # note that this will potentially clear only the host
         # interface buffers; meanwhile, the MI48 buffers would
         # require different handling, if the MI48 was left in
@@ -183,6 +458,8 @@ class MI48:
         self.parse_header = self.has_evk_bridge()
         if not self.parse_header:
             self.powerup()
+            # do not parse frame header if MI48 is not on the core dev board
+            self.parse_header = self.has_evk_bridge()
         # At this stage check that MI48 is not streaming already,
         # which may happen if termination of last stream was not handled 
         # cleanly. If we do not stop the MI48 here, the status handling
@@ -193,11 +470,18 @@ class MI48:
             self.stop_capture()
         #
         # check what camera we have
-        self.camera_info = self.get_camera_info()
-        # do not parse frame header if MI48 is not on the core dev board
-        self.parse_header = self.has_evk_bridge()
-        # check status register and raise relevant flags
-        status, mode = self.bootup(verbose=True)
+        self.profile_cache = profile_cache
+        profile = self.get_cached_profile()
+        if profile is None:
+            self.camera_info = self.get_camera_info()
+        else:
+            self.log(logging.DEBUG, 'Using cached profile of {}', self.sn)
+            # a copy, as the MI48 adds its current state to camera_info
+            self.set_camera_info(dict(profile['camera_info']))
+        # check status register and raise relevant flags; the control
+        # registers were checked already when the profile was cached
+        status, mode = self.bootup(verbose=True,
+                                   check_regs=profile is None)
         # may need to handle ValueError from above call:
             # happens if USB is still streaming when we restart
             # and instead of RREG (int) we get GFRA acknowledge (array)
@@ -209,18 +493,18 @@ class MI48:
         # see if we need to react to any errors
         if bootup_error:
             status, mode = self.error_handler(status, mode, verbose=True)
-            self.log(logging.DEBUG, 'Status: {}'.format(hex(status)))
-            self.log(logging.DEBUG, 'Mode  : {}'.format(hex(mode)))
+            self.log(logging.DEBUG, 'Status: 0x{:02X}', status)
+            self.log(logging.DEBUG, 'Mode  : 0x{:02X}', mode)
         self.capture_no_header = mode & NO_HEADER
         # reset crc.error
         self.crc_error = False
         # set FPS
         if fps is not None:
             self.set_fps(fps)
-        # set the format of the returned data
-        self.read_raw = read_raw
+        if profile is None and self.profile_cache is not None:
+            self.store_profile()
 
-    def bootup(self, verbose=False, powerup=False):
+    def bootup(self, verbose=False, powerup=False, check_regs=True):
         """Ensure bootup of the mi48 is complete, returning MODE and STATUS.
 
         Return all flags raised at any one point while looping and waiting for
@@ -234,7 +518,7 @@ class MI48:
         # depends on CPU frequency too.
         timeout = max(0.025, time.get_clock_info('monotonic').resolution)
         if powerup: self.powerup()
-        self.check_ctrl_stat_regs()
+        if check_regs: self.check_ctrl_stat_regs()
         t0 = time.monotonic()
         status = self.get_status(verbose=verbose)
         mode = self.get_mode(verbose=verbose)
@@ -246,12 +530,12 @@ class MI48:
             boot_in_progress = status & BOOTING_UP
             time.sleep(timeout)
         t1 = time.monotonic()
-        self.log(logging.DEBUG, 'Bootup complete in {:.0f} ms'.
-                format(1.e3 * (t1-t0)))
+        self.log(logging.DEBUG, 'Bootup complete in {:.0f} ms',
+                 1.e3 * (t1-t0))
         # clear boot in progress flag as we're done with it
         status = status & (~BOOTING_UP & 0xFF)
-        self.log(logging.DEBUG, 'Status: {}'.format(hex(status)))
-        self.log(logging.DEBUG, 'Mode  : {}'.format(hex(mode)))
+        self.log(logging.DEBUG, 'Status: 0x{:02X}', status)
+        self.log(logging.DEBUG, 'Mode  : 0x{:02X}', mode)
 #        mode = mode & no_header
         return status, mode
 
@@ -299,6 +583,7 @@ class MI48:
                 self.log(logging.ERROR,
                     'SenXor Interface ERROR: Attempting SW reset of MI48')
                 self.reset()
+                self.clear_regcache()
             except TypeError:
                 # no reset handle provided
                 self.log(logging.ERROR,
@@ -309,8 +594,8 @@ class MI48:
         status = self.get_status(verbose=True)
         return status, mode
 
-    def regread(self, reg):
-        """Read a control/status register; Allow hex or str for reg"""
+    def _resolve_reg(self, reg):
+        """Return (address, name) of a register given by name or address"""
         if isinstance(reg, str):
             regname = reg
             # Try to get the address value from the register map, but
@@ -324,36 +609,124 @@ class MI48:
         else:
             # assume integer; make up the hex representation for logging
             regname = f'0x{reg:02X}'
-        return self.interfaces[0].regread(reg, regname)
+        return reg, regname
+
+    def _is_cached(self, addr):
+        # while user flash is enabled, addresses may refer to flash
+        return not self.user_flash and addr in CACHED_REG_ADDRS
+
+    def regread(self, reg, cached=True):
+        """Read a control/status register; Allow hex or str for reg
+
+        Non-volatile registers are served from the register shadow cache
+        when possible, unless `cached` is False.
+        """
+        reg, regname = self._resolve_reg(reg)
+        if cached and reg in self.regcache and self._is_cached(reg):
+            return self.regcache[reg]
+        value = self.interfaces[0].regread(reg, regname)
+        if value is not None and self._is_cached(reg):
+            self.regcache[reg] = value
+        return value
+
+    def regread_many(self, regs, cached=True):
+        """
+        Read a list of registers given by name or address.
+
+        Registers missing from the shadow cache (or volatile ones) are
+        read in one pipelined batch if the interface supports it.
+        Return a list of values in the order of `regs`.
+        """
+        resolved = [self._resolve_reg(reg) for reg in regs]
+        values = [None] * len(regs)
+        todo = []
+        for i, (addr, name) in enumerate(resolved):
+            if cached and addr in self.regcache and self._is_cached(addr):
+                values[i] = self.regcache[addr]
+            else:
+                todo.append(i)
+        if not todo:
+            return values
+        addrs = [resolved[i][0] for i in todo]
+        names = [resolved[i][1] for i in todo]
+        try:
+            _values = self.interfaces[0].regread_many(addrs, names)
+        except AttributeError:
+            # interface has no batched access
+            _values = [self.interfaces[0].regread(addr, name)
+                       for addr, name in zip(addrs, names)]
+        for i, addr, value in zip(todo, addrs, _values):
+            values[i] = value
+            if value is not None and self._is_cached(addr):
+                self.regcache[addr] = value
+        return values
 
     def regwrite(self, reg, value):
-        """Write to a control register"""
+        """Write to a control register; keep the shadow cache up to date"""
         if isinstance(reg, str):
             regname = reg
             reg = regmap[regname]
         else:
             regname = ""
-        return self.interfaces[0].regwrite(reg, value, regname)
+        result = self.interfaces[0].regwrite(reg, value, regname)
+        if self._is_cached(reg):
+            self.regcache[reg] = value
+        return result
 
+    def clear_regcache(self):
+        """Forget all shadowed register values, e.g. after a reset"""
+        self.regcache.clear()
 
-    def read(self):
+
+    def set_output(self, output):
+        """Set the format of the frames returned by `read`"""
+        if output not in OUTPUT_FORMATS:
+            raise ValueError('Output must be one of {}'.format(OUTPUT_FORMATS))
+        self.output = output
+        self.read_raw = (output == 'raw')
+        self._lut = None if self.read_raw else get_celsius_lut(output)
+
+    def to_celsius(self, data, out=None, dtype='float32'):
+        """Convert raw pixel values to temperature [C] through the LUT"""
+        return np.take(get_celsius_lut(dtype), data, out=out)
+
+    def read(self, out=None, crc_done=None):
         """Read a data frame
 
         Return the temperature data or (data, header), where the
         header is a dictionary.
-        The returned data is a 2D array of np.float16 representing the
-        temperature in Celsius.
+        The returned data is a 1D array of the format set by `output`:
+        np.float16 or np.float32 representing the temperature in Celsius,
+        or the raw np.uint16 in units of 0.1 K; it is never overwritten
+        by later reads.
+        If `out` is given, the data is written into it and returned;
+        it must be a 1D array of the matching size and dtype.
         Header values if requested are also decoded from bytes.
+        If the CRC check is left to the worker (see set_crc_policy),
+        `crc_done(ok)` is called once it completes.
         """
-        # figure out how many words to get; recall 2 bytes per pixel
-        data_size = np.prod(self.fpa_shape)
-        size_in_words = data_size
+        # The spi device must provide read(number-of-bytes) function
+        response = self.interfaces[1].read(self.get_frame_words())
+        return self.decode_frame(response, out=out, crc_done=crc_done)
+
+    def get_frame_words(self):
+        """Return the size of a frame in words, including optional header"""
+        # recall 2 bytes per pixel
+        size_in_words = np.prod(self.fpa_shape)
         if not self.capture_no_header:
             size_in_words += self.cols
-        # print('Reading {} words'.format(size_in_words))
+        return size_in_words
 
-        # The spi device must provide read(number-of-bytes) function
-        response = self.interfaces[1].read(size_in_words)
+    def decode_frame(self, response, out=None, update_stats=True,
+                     crc_done=None):
+        """
+        Decode a frame as received from the interface; see `read`.
+
+        `response` is a 1-D array of 16-bit words, or None, in which case
+        return (None, None). Frames not part of a stream should not
+        `update_stats`, else the counter gaps count as dropped frames.
+        """
+        data_size = np.prod(self.fpa_shape)
 
         # Obtain the data but do NOT convert to degrees C yet,
         # because we have to calculate CRC on it first.
@@ -373,24 +746,105 @@ class MI48:
         else:
             _header = response[:-data_size]
             header = self.parse_frame_header(_header)
-            self.crc_error = False
-            # check crc
-            # note that MI48 implements CRC-16/CCITT-FALSE which
-            # must be initialised with 0xFFFF
-            _crc = crc16(data)
-            if not header['crc'] == hex(_crc):
-                self.crc_error = True
-                self.log(logging.ERROR, 'Frame CRC error. '+
-                    'Header CRC: {}, Data CRC: {}'.\
-                    format(header['crc'], hex(_crc)))
+            self._crc_count += 1
+            if self.crc_policy == 'worker':
+                # the frame buffer may be reused by the next read
+                self._crc_worker.submit(self.check_crc, data.copy(), header,
+                                        crc_done)
+            elif self.crc_policy == 'all' or (self.crc_every and
+                    self._crc_count % self.crc_every == 0):
+                self.check_crc(data, header)
+        if update_stats:
+            self.stats.update(header)
 
         # Once we have done the CRC check, convert to degrees C
         # unless raw numbers are requested
         if self.read_raw:
-            return data, header
+            # the response may be a view into a buffer reused by the
+            # next read, so never return it as is
+            if out is None:
+                return data.copy(), header
+            np.copyto(out, data)
+            return out, header
         else:
-            data = data / 10. + KELVIN_0
-            return data.astype(np.float16), header
+            return np.take(self._lut, data, out=out), header
+
+    def set_crc_policy(self, policy='all'):
+        """
+        Select how frame CRCs are verified in `read`:
+
+            * 'all' -- every frame, on the calling thread,
+            * N (int) -- every N-th frame, on the calling thread,
+            * 'worker' -- every frame, on a background worker thread,
+            * 'off' -- never.
+
+        The outcome is flagged in header['crc_ok'] (-1 if not checked;
+        with 'worker' it is set once the check completes), and failures
+        are counted in `crc_errors`.
+        """
+        if isinstance(policy, int):
+            if policy < 1:
+                raise ValueError('CRC check interval must be positive')
+            self.crc_every = policy
+        elif policy in CRC_POLICIES:
+            self.crc_every = None
+        else:
+            raise ValueError('CRC policy must be an int or one of {}'.
+                             format(CRC_POLICIES))
+        self.crc_policy = policy
+        self._crc_count = 0
+        if policy == 'worker' and self._crc_worker is None:
+            self._crc_worker = ThreadPoolExecutor(max_workers=1)
+        return None
+
+    def check_crc(self, data, header, done=None):
+        """
+        Verify the CRC of `data` against `header`; flag and count.
+        Then call `done(ok)`, if given.
+        """
+        # note that MI48 implements CRC-16/CCITT-FALSE which
+        # must be initialised with 0xFFFF
+        _crc = crc16(data)
+        ok = header['crc'] == _crc
+        header['crc_ok'] = ok
+        with self._crc_lock:
+            self.crc_checked += 1
+            self.crc_error = not ok
+            if not ok:
+                self.crc_errors += 1
+        if not ok:
+            self.log(logging.ERROR, 'Frame CRC error. '
+                     'Header CRC: {}, Data CRC: {}',
+                     hex(header['crc']), hex(_crc))
+        if done is not None:
+            done(ok)
+        return ok
+
+    def get_stats(self):
+        """
+        Return acquisition health statistics as a dictionary.
+
+        This does not access the MI48, so it is safe to call from any
+        thread, e.g. the UI or a web server. The expected FPS is based
+        on the last known FRAME_RATE register value.
+        """
+        res = self.stats.snapshot()
+        res['crc_errors'] = self.crc_errors
+        res['crc_checked'] = self.crc_checked
+        divisor = self.regcache.get(regmap['FRAME_RATE'])
+        try:
+            res['expected_fps'] = float(self.maxfps) / divisor
+        except (AttributeError, TypeError, ZeroDivisionError):
+            res['expected_fps'] = None
+        try:
+            link = self.interfaces[1].get_link_stats()
+        except AttributeError:
+            # interface without a stream parser
+            link = {}
+        res['resyncs'] = link.get('resyncs', 0)
+        res['link'] = link
+        res['capture_latency'] = self.get_capture_latency()
+        return res
 
     def has_evk_bridge(self):
         """
@@ -409,14 +863,14 @@ class MI48:
     def powerup(self):
         """Read calibration data from flash, and initialise SenXor"""
         self.regwrite('SENXOR_POWERUP', 0x13)
+        self.clear_regcache()
         time.sleep(0.1)
 
     def get_status(self, verbose=False):
         """Read status register; log if non-zero status in verbose mode"""
         status = self.regread('STATUS')
         if verbose and status != 0:
-            self.log(logging.WARNING,'Non-zero STATUS: 0x{:02X}'.
-                    format(status))
+            self.log(logging.WARNING, 'Non-zero STATUS: 0x{:02X}', status)
             self.log(logging.WARNING, ', '.join(self.parse_status(status)))
         return status
 
@@ -436,8 +890,7 @@ class MI48:
         # close immediately, and a timeout will return None here.
         if mode is None: return None
         if verbose and (mode & 0x03)!= 0x00:
-            self.log(logging.WARNING,'Capture in progress: 0x{:02X}'.
-                    format(mode))
+            self.log(logging.WARNING, 'Capture in progress: 0x{:02X}', mode)
             self.log(logging.WARNING, ', '.join(self.parse_mode(mode)))
         return mode
 
@@ -499,6 +952,12 @@ class MI48:
         except AttributeError:
             # if we haven't yet read the info from camera module
             pass
+        # fetch all the identification registers in one batch; the
+        # getters below are then served from the register cache
+        self.regread_many(['SENXOR_TYPE', 'MODULE_TYPE', 'EVK_ID'] +
+                          ['SENXOR_ID_{}'.format(i)
+                           for i in range(MI48_SENXOR_ID_LEN)] +
+                          ['FW_VERSION_1', 'FW_VERSION_2', 'FRAME_RATE'])
         # read camera module info
         res = {}
         self.camera_info = res
@@ -511,6 +970,18 @@ class MI48:
         res['CAMERA_MFG'] = uid_hexsn
         res['SN'] = 'SN'+uid_hex
         res['FW_VERSION'] = self.get_fw_version()
+        self.set_camera_info(res)
+        res['MAX_FPS'] = self.get_max_fps()
+        self.maxfps = res['MAX_FPS']
+        # note that current FPS requires self.maxfps, 
+        # becuase we can only read the divisor
+        res['Current FPS'] = self.get_fps()
+        return res
+
+    def set_camera_info(self, res):
+        """Set the camera attributes from a camera info dictionary"""
+        self.camera_info = res
+        res['NAME'] = self.name
         self.camera_type = res['CAMERA_TYPE']
         self.module_type = res['MODULE_TYPE']
         self.camera_name = SENXOR_NAME[self.camera_type]
@@ -521,19 +992,73 @@ class MI48:
         self.camera_id_hexsn = res['CAMERA_MFG']
         self.sn = res['SN'].upper()
         self.fw_version = res['FW_VERSION']
-        res['MAX_FPS'] = self.get_max_fps()
-        self.maxfps = res['MAX_FPS']
-        # note that current FPS requires self.maxfps, 
-        # becuase we can only read the divisor
-        res['Current FPS'] = self.get_fps()
-        return res
+        if 'MAX_FPS' in res:
+            self.maxfps = res['MAX_FPS']
+            res['Current FPS'] = self.get_fps()
+
+    def get_cached_profile(self):
+        """
+        Return the cached profile of the connected camera, or None.
+
+        Only the identity of the camera is read from the MI48: its ID and
+        firmware version, in one batch. A profile cached for a different
+        firmware version is ignored.
+        """
+        if self.profile_cache is None:
+            return None
+        self.regread_many(['SENXOR_ID_{}'.format(i)
+                           for i in range(MI48_SENXOR_ID_LEN)] +
+                          ['FW_VERSION_1', 'FW_VERSION_2'])
+        uid, uid_hex, uid_hexsn = self.get_camera_id()
+        self.sn = ('SN' + uid_hex).upper()
+        profile = self.profile_cache.get(self.sn)
+        if profile is None:
+            return None
+        if profile['camera_info'].get('FW_VERSION') != self.get_fw_version():
+            self.log(logging.INFO, 'Firmware changed; ignoring cached profile')
+            return None
+        return profile
+
+    def store_profile(self, **items):
+        """Store the camera profile, and any extra `items`, in the cache"""
+        if self.profile_cache is None:
+            return None
+        info = dict(self.camera_info)
+        info.pop('Current FPS', None)
+        self.profile_cache.update(self.sn, camera_info=info,
+                                  fpa_shape=list(self.fpa_shape),
+                                  maxfps=self.maxfps, **items)
+        return None
+
+    def apply_settings(self, settings):
+        """
+        Write the control registers in `settings`, {'RegName': value},
+        whose current value differs; return the names of those written.
+
+        The current values are read in one batch. The applied settings
+        are stored in the profile cache, if any.
+        """
+        regs = list(settings.keys())
+        current = self.regread_many(regs, cached=False)
+        written = []
+        for reg, value in zip(regs, current):
+            # ignore self-clearing bits, e.g. filter initialisation
+            mask = ~SELF_CLEARING_BITS.get(reg, 0x00) & 0xFF
+            if value is None or (value ^ settings[reg]) & mask:
+                self.regwrite(reg, settings[reg])
+                written.append(reg)
+                if reg == 'FILTER_CTRL':
+                    # let the filters settle, as in enable_filter
+                    time.sleep(40.e-3)
+        self.log(logging.DEBUG, 'Settings applied: {}', written)
+        self.store_profile(settings=settings)
+        return written
 
     def get_ctrl_stat_regs(self):
         """Read all registers, return a dictionary {'RegName': 0xValue}"""
-        res = {}
         self.log(logging.DEBUG, 'Reading Control and Status Regs:')
-        for reg in list(DEFAULT_CTRL_STAT.keys()):
-            res[reg] = self.regread(reg)
+        regs = list(DEFAULT_CTRL_STAT.keys())
+        res = dict(zip(regs, self.regread_many(regs)))
         return res
 
     def check_ctrl_stat_regs(self, expect=None):
@@ -548,17 +1073,26 @@ class MI48:
                 _exp = expect.get(reg)
                 if val != _exp:
                     log_level = logging.WARNING
-                    self.log(log_level, '{}: {} (expected {})'.
-                             format(reg, hex(val), hex(_exp)))
+                    self.log(log_level, '{}: {} (expected {})',
+                             reg, hex(val), hex(_exp))
                     continue
-            self.log(log_level, '{}: {}'.format(reg, val))
+            self.log(log_level, '{}: {}', reg, val)
 
     def get_max_fps(self):
-        """Get some frames in continuous mode and establish max FPS"""
-        # TODO: real implementation of burst capture 250 frames, and 
-        #       determine average FPS.
-        #       Or at least map maxfps to corresponding FW of the MI48
-        #       and the camera type.
+        """Return the max FPS, as measured by `measure_max_fps` if cached.
+
+        Without a measurement for this camera and firmware, fall back
+        to the nominal values for the camera type.
+        """
+        measured = MEASURED_MAX_FPS.get((self.sn, self.fw_version))
+        if measured is None and self.profile_cache is not None:
+            profile = self.profile_cache.get(self.sn) or {}
+            measured = profile.get('measured_max_fps')
+            if measured is not None and\
+               measured.get('fw_version') != self.fw_version:
+                measured = None
+        if measured is not None:
+            return measured['fps']
         if self.camera_type in [0,1]:
             maxfps = 25.5  # this is true for Bobcat with latest MI48Ax
             return maxfps
@@ -568,6 +1102,75 @@ class MI48:
         maxfps = 30.0  # aspirational
         return maxfps
 
+    def measure_max_fps(self, nframes=250, nskip=5):
+        """
+        Stream a burst of `nframes` at FPS divisor 1 and measure the max FPS.
+
+        The rate is measured from the header frame counters and
+        timestamps, so that frames missed by the host do not bias it;
+        it is cross-checked against the host clock. The host throughput
+        ceiling is the frame rate the reading thread could sustain given
+        the CPU time it spent per frame: if it is close to the measured
+        rate, the host rather than the sensor is the bottleneck.
+
+        The result is cached per serial number and firmware version, in
+        memory and in the profile cache if any, and used by
+        get_fps/set_fps from then on. Return a dictionary of results.
+        The MI48 must not be streaming; the FPS setting is restored.
+        """
+        divisor = self.get_frame_rate()
+        no_header = self.capture_no_header
+        counters, stamps, host_times = [], [], []
+        cpu_time = 0.
+        self.set_frame_rate(1)
+        self.start(stream=True, with_header=True)
+        try:
+            for i in range(nskip + nframes):
+                t0 = time.thread_time()
+                # the burst is not part of the acquisition statistics
+                response = self.interfaces[1].read(self.get_frame_words())
+                data, header = self.decode_frame(response,
+                                                 update_stats=False)
+                t1 = time.thread_time()
+                if data is None or header is None or i < nskip:
+                    continue
+                cpu_time += t1 - t0
+                host_times.append(time.monotonic())
+                counters.append(int(header['frame_counter']))
+                stamps.append(int(header['timestamp']))
+        finally:
+            self.stop_capture()
+            self.set_frame_rate(divisor)
+            self.capture_no_header = no_header
+        if len(counters) < 2:
+            raise RuntimeError('Too few frames to measure max FPS')
+        # counters wrap around at 16 bit, timestamps at 32 bit
+        nproduced = int(np.sum(np.diff(counters) & 0xFFFF))
+        elapsed = float(np.sum(np.diff(stamps) & 0xFFFFFFFF)) * SPIHDR_TIME_UNIT
+        # frames produced by the MI48 per second of host clock
+        host_fps = nproduced / (host_times[-1] - host_times[0])
+        fps = nproduced / elapsed if elapsed > 0 else 0.
+        if abs(fps - host_fps) > 0.1 * host_fps:
+            # timestamp unit mismatch; rely on counters and host clock
+            self.log(logging.WARNING, 'Header timestamps inconsistent with '
+                     'host clock; using host clock')
+            fps = host_fps
+        res = {
+            'fps': fps,
+            'fps_host_clock': host_fps,
+            'host_ceiling_fps': len(counters) / cpu_time if cpu_time else None,
+            'frames': len(counters),
+            'frames_missed': nproduced - (len(counters) - 1),
+            'fw_version': self.fw_version,
+        }
+        self.log(logging.INFO, 'Measured max FPS {:.2f} (host clock {:.2f}), '
+                 'host ceiling {} FPS', fps, host_fps, res['host_ceiling_fps'])
+        MEASURED_MAX_FPS[(self.sn, self.fw_version)] = res
+        self.maxfps = fps
+        self.camera_info['MAX_FPS'] = fps
+        self.store_profile(measured_max_fps=res)
+        return res
+
     def get_fps(self):
         """Get current FPS [1/s]"""
         divisor = self.get_frame_rate()
@@ -580,14 +1183,19 @@ class MI48:
         """Set the frame rate divisor register (integer)"""
         self.regwrite('FRAME_RATE', fps_divisor)
 
-    def set_fps(self, fps):
-        """Set the desired FPS [1/s] or the closest possible"""
+    def get_fps_divisor(self, fps):
+        """Return the FRAME_RATE divisor closest to the desired FPS"""
         try:
-            fps_divisor = int(round(float(self.maxfps) / fps))
+            # the MI48 cannot go faster than maxfps
+            return max(1, int(round(float(self.maxfps) / fps)))
         except ZeroDivisionError:
-            fps_divisor = 32
-        self.log(logging.DEBUG, 'FPS target {}, divisor {}, actual {}'.
-                 format(fps, fps_divisor, self.maxfps/fps_divisor))
+            return 32
+
+    def set_fps(self, fps):
+        """Set the desired FPS [1/s] or the closest possible"""
+        fps_divisor = self.get_fps_divisor(fps)
+        self.log(logging.DEBUG, 'FPS target {}, divisor {}, actual {}',
+                 fps, fps_divisor, self.maxfps/fps_divisor)
         self.regwrite('FRAME_RATE', fps_divisor)
         return None
 
@@ -602,8 +1210,7 @@ class MI48:
         # ensure we have an int for regwrite, even if we get a float > 1, e.g. 93.0
         emissivity = int(emissivity)
         #
-        self.log(logging.DEBUG, 'Setting emissivity to {} %'.
-                 format(emissivity))
+        self.log(logging.DEBUG, 'Setting emissivity to {} %', emissivity)
         self.regwrite('EMISSIVITY', emissivity)
         return None
 
@@ -630,20 +1237,22 @@ class MI48:
             fctrl |= 0x40  # bit 6
         if f3_ks_5:
             fctrl |= 0x20  # bit 5
-        msg = "Enabling"
-        if fctrl & 0x01:
-            fset1 = self.get_filter_1()
-            msg += ' Filter 1 ({})'.format(hex(fset1))
-        if fctrl & 0x04:
-            fset2 = self.get_filter_2()
-            msg += ' Filter 2 ({})'.format(hex(fset2))
-        if fctrl & 0x40:
-            msg += ' Filter 3 ({})'.format(hex(fctrl & 0x20))
-        self.log(logging.DEBUG, msg)
+        if logger.isEnabledFor(logging.DEBUG):
+            # the filter settings cost register reads; only if logged
+            msg = "Enabling"
+            if fctrl & 0x01:
+                msg += ' Filter 1 ({})'.format(hex(self.get_filter_1()))
+            if fctrl & 0x04:
+                msg += ' Filter 2 ({})'.format(hex(self.get_filter_2()))
+            if fctrl & 0x40:
+                msg += ' Filter 3 ({})'.format(hex(fctrl & 0x20))
+            self.log(logging.DEBUG, msg)
         self.regwrite('FILTER_CTRL', fctrl)
         time.sleep(40.e-3)
-        self.log(logging.DEBUG, 'FILTER_CONTROL {}'.format(
-                 hex(self.get_filter_ctrl())))
+        if logger.isEnabledFor(logging.DEBUG):
+            # FILTER_CTRL is volatile; read it back only if it is logged
+            self.log(logging.DEBUG, 'FILTER_CONTROL 0x{:02X}',
+                     self.get_filter_ctrl())
         #return self.regread('FILTER_CTRL')
         return None
 
@@ -667,8 +1276,10 @@ class MI48:
             msg += ' Filter 3'
         self.log(logging.DEBUG, msg)
         self.regwrite('FILTER_CTRL', fctrl)
-        self.log(logging.DEBUG, 'FILTER_CONTROL {}'.format(
-                 hex(self.get_filter_ctrl())))
+        if logger.isEnabledFor(logging.DEBUG):
+            # FILTER_CTRL is volatile; read it back only if it is logged
+            self.log(logging.DEBUG, 'FILTER_CONTROL 0x{:02X}',
+                     self.get_filter_ctrl())
         return None
 
     def get_filter_1(self):
@@ -703,7 +1314,7 @@ class MI48:
         if sens_factor > 3:
             # assume we're giving it as hex register value or int or anyway x100
             sens_factor *= 0.01
-        self.log(logging.DEBUG, f'Setting sensitivity factor to {sens_factor}')
+        self.log(logging.DEBUG, 'Setting sensitivity factor to {}', sens_factor)
         regval = int(sens_factor * 100)
         self.regwrite('SENS_FACTOR', regval)
         return None
@@ -716,8 +1327,8 @@ class MI48:
             regval = 256 - abs(n)
         else:
             regval = n
-        self.log(logging.DEBUG, 'Setting temperature offset, [K]: {}, regvalue: {}'.
-                 format(offset_in_Kelvin, regval))
+        self.log(logging.DEBUG, 'Setting temperature offset, [K]: {}, '
+                 'regvalue: {}', offset_in_Kelvin, regval)
         self.regwrite('OFFSET_CORR', regval)
         return None
 
@@ -732,9 +1343,8 @@ class MI48:
     def get_camera_id(self):
         """Read SenXor_ID register; Return string Year.Week.Fab.SerNum
         """
-        uid = []
-        for i in range(0, MI48_SENXOR_ID_LEN):
-            uid.append(self.regread('SENXOR_ID_{}'.format(i)))
+        uid = self.regread_many(['SENXOR_ID_{}'.format(i)
+                                 for i in range(0, MI48_SENXOR_ID_LEN)])
         uid_hex = bytearray(uid).hex()
         year = 2000 + uid[0]
         week = uid[1]
@@ -754,11 +1364,36 @@ class MI48:
         fwv_build = fwb
         return '{}.{}.{}'.format(fwv_major, fwv_minor, fwv_build)
 
-    def enable_user_flash(self):
+    def enable_user_flash(self, timeout=1.0):
+        # once in flash mode, STATUS reads user flash; so check first
+        self.wait_flash_ready(timeout)
         self.regwrite('FLASH_CTRL', 0x01)
+        self.user_flash = True
 
     def disable_user_flash(self):
         self.regwrite('FLASH_CTRL', 0x00)
+        self.user_flash = False
+
+    def wait_flash_ready(self, timeout=1.0, poll_timeout=5.e-3):
+        """
+        Poll STATUS until the MI48 is not booting up (and thus able to
+        access its flash); return True if ready within `timeout` seconds.
+
+        Valid only with the user flash disabled, since in flash mode the
+        STATUS address maps to the user flash; `enable_user_flash` polls.
+        """
+        if self.user_flash:
+            raise RuntimeError('STATUS is not readable in user flash mode')
+        t0 = time.monotonic()
+        while True:
+            status = self.regread('STATUS')
+            if status is not None and not status & BOOTING_UP:
+                return True
+            if time.monotonic() - t0 > timeout:
+                self.log(logging.ERROR, 'Flash not ready in {:.0f} ms',
+                         1.e3 * timeout)
+                return False
+            time.sleep(poll_timeout)
 
     def get_compensation_params(self, npar=4, base_addr=0):
         """
@@ -769,23 +1404,30 @@ class MI48:
         The parameters are stored at `base_addr` in the user
         flash space, using little-endian order, i.e.  LSB to 0x00 etc.,
         in the form of 4--byte IEEE-754 numbers.
+
+        The four bytes of each parameter are read in one pipelined batch;
+        the time taken per parameter is kept in `self.flash_timing['read']`.
         """
         params = []
+        timing = []
         for i in range(npar):
             # Parameters are stored as IEEE-754 floats, i.e. 4-bytes,
             # little endian.
             # When we read the MI48 we get back unsigned int for each
             # byte.
-            int_list = []
-            for j in range(4):
-                flash_addr = base_addr + 4 * i + j
-                int_list.append(self.regread(flash_addr))
-                time.sleep(1)
+            t0 = time.monotonic()
+            addrs = [base_addr + 4 * i + j for j in range(4)]
+            int_list = self.regread_many(addrs, cached=False)
             byte_array = array.array('B', int_list)
             params.append(struct.unpack('<f', byte_array)[0])
+            timing.append(time.monotonic() - t0)
+            self.log(logging.INFO, 'Flash read of parameter {} in {:.1f} ms',
+                     i, 1.e3 * timing[-1])
+        self.flash_timing['read'] = timing
         return params
 
-    def store_compensation_params(self, params, base_addr=0, timeout=0.5):
+    def store_compensation_params(self, params, base_addr=0, timeout=0.5,
+                                  poll_timeout=5.e-3):
         """
         Write compensation parameters to user space of MI48 flash.
 
@@ -793,33 +1435,45 @@ class MI48:
         a 4-byte IEEE-754 representation and stored in sequence,
         starting from `base_addr` in the user flash space, using
         little-endian order, i.e.  LSB to `base_addr`
+
+        Every byte is read back until it matches what was written, polling
+        every `poll_timeout` seconds; raise RuntimeError if that does not
+        happen within `timeout` seconds.
+        The time taken per parameter is kept in `self.flash_timing['write']`.
         """
+        timing = []
         for i, p in enumerate(params):
+            t0 = time.monotonic()
             byte_array = struct.pack('<f', p)
             int_list = list(byte_array)
             assert len(list(byte_array)) == 4
             for j, uint8 in enumerate(int_list):
                 flash_addr = base_addr + 4 * i + j
                 self.regwrite(flash_addr, uint8)
-                # writing to a flash memory; not sure of the speed
-                time.sleep(timeout)
+            # writing to a flash memory takes time; verify by reading
+            # back, rather than sleeping for a worst-case period
+            addrs = [base_addr + 4 * i + j for j in range(4)]
+            tw = time.monotonic()
+            while self.regread_many(addrs, cached=False) != int_list:
+                if time.monotonic() - tw > timeout:
+                    self.log(logging.ERROR,
+                             'Flash write of parameter {} failed verify', i)
+                    raise RuntimeError('Flash write verify failed at 0x{:02X}'.
+                                       format(addrs[0]))
+                time.sleep(poll_timeout)
+            timing.append(time.monotonic() - t0)
+            self.log(logging.INFO, 'Flash write of parameter {} in {:.1f} ms',
+                     i, 1.e3 * timing[-1])
+        self.flash_timing['write'] = timing
 
     def parse_frame_header(self, header: list):
         """
-        Return a dictionary with parsed head items in appropriate type.
+        Return the header as a record of FRAME_HEADER_DTYPE.
 
-        Assume header is already a list of 16 bit unsigned int or similar
+        Assume header is already a 1-D array of 16 bit unsigned int.
+        Use `header_to_dict` for values in physical units.
         """
-        result = {}
-        result['frame_counter']         = header[SPIHDR_FRCNT]
-        result['senxor_vdd']            = header[SPIHDR_SXVDD] / 1.0e4
-        result['senxor_temperature']    = header[SPIHDR_SXTA] / 100. + KELVIN_0
-        result['timestamp']             = (header[SPIHDR_TIME + 1] << 16) +\
-                                          header[SPIHDR_TIME]
-        result['pixel_max']             = header[SPIHDR_MAXV] / 10. + KELVIN_0
-        result['pixel_min']             = header[SPIHDR_MINV] / 10. + KELVIN_0
-        result['crc']                   = hex(header[SPIHDR_CRC])
-        return result
+        return decode_frame_headers(header)[0]
 
     def start(self, stream=True, with_header=True):
         """
@@ -842,6 +1496,59 @@ class MI48:
         self.regwrite('FRAME_MODE', mode)
         return None
 
+    def capture_once(self, timeout=1.0, with_header=True, out=None):
+        """
+        Trigger the capture of a single frame and return (data, header)
+        as `read` does, or (None, None) on timeout.
+
+        The MI48 must not be streaming. It returns to idle by itself after
+        the frame, so there is no USB traffic between triggers.
+        The trigger-to-frame latency is kept in `last_capture_latency`
+        and summarised by get_capture_latency.
+
+        The MI48 delivers the first frame completed after the trigger,
+        so the latency is lowest at the maximum FPS (FRAME_RATE 1).
+        """
+        mode = GET_SINGLE_FRAME
+        if not with_header:
+            mode = mode | NO_HEADER
+        self.capture_no_header = (not with_header)
+        size_in_words = self.get_frame_words()
+        t0 = time.perf_counter()
+        if hasattr(self.interfaces[0], 'trigger_frame'):
+            # trigger and wait for the frame in one go
+            response = self.interfaces[0].trigger_frame(
+                regmap['FRAME_MODE'], mode, size_in_words, timeout,
+                regname='FRAME_MODE')
+        else:
+            self.regwrite('FRAME_MODE', mode)
+            response = self.interfaces[1].read(size_in_words)
+        latency = time.perf_counter() - t0
+        if response is None:
+            self.capture_timeouts += 1
+            self.log(logging.WARNING, 'No frame within {:.0f} ms of trigger',
+                     1.e3 * timeout)
+            return None, None
+        self.last_capture_latency = latency
+        self.capture_latency[self.captures % len(self.capture_latency)] =\
+                latency
+        self.captures += 1
+        return self.decode_frame(response, out=out, update_stats=False)
+
+    def get_capture_latency(self):
+        """Return the statistics of the capture_once latency, in ms"""
+        n = min(self.captures, len(self.capture_latency))
+        res = {'captures': self.captures, 'timeouts': self.capture_timeouts}
+        if n > 0:
+            p50, p90, p99 = 1.e3 * np.percentile(self.capture_latency[:n],
+                                                  [50, 90, 99])
+            res.update({'last_ms': 1.e3 * self.last_capture_latency,
+                        'min_ms': float(1.e3 * self.capture_latency[:n].min()),
+                        'p50_ms': float(p50),
+                        'p90_ms': float(p90),
+                        'p99_ms': float(p99)})
+        return res
+
     def stop_capture(self, verbose=True, poll_timeout=0.1,
                      stop_timeout=0.3):
         """Stop capture; currently clears the FRAME_MODE register."""
@@ -865,11 +1572,11 @@ class MI48:
             delay = time.time() - t0
             if delay > stop_timeout:  # in ms
                 self.log(logging.DEBUG,
-                         'Camera module failed to stop in {:.0f} ms'.\
-                         format(1.e3 * stop_timeout))
+                         'Camera module failed to stop in {:.0f} ms',
+                         1.e3 * stop_timeout)
                 return mode
-        self.log(logging.DEBUG, 'Camera module stopped in {:.0f} ms.'.
-            format(1.e3 * delay))
+        self.log(logging.DEBUG, 'Camera module stopped in {:.0f} ms.',
+                 1.e3 * delay)
         return mode
 
     def clear_interface_buffers(self):
@@ -895,6 +1602,9 @@ class MI48:
         self.log(logging.DEBUG, 'Closing host interfaces')
         self.clear_interface_buffers()
         self.close_interfaces()
+        if self._crc_worker is not None:
+            self._crc_worker.shutdown(wait=True)
+            self._crc_worker = None
         return None
 
     def __repr__(self):
@@ -908,15 +1618,51 @@ class MI48:
 
 def get_reg_name(addr):
     """Given a register address, return its name"""
-    for key, val in regmap.items():
-        if val == addr: return key
-    return 'Unknown reg: 0x{:02X}'.format(addr)
+    try:
+        return _regnames[addr]
+    except KeyError:
+        return 'Unknown reg: 0x{:02X}'.format(addr)
+
+def decode_frame_headers(headers):
+    """
+    Decode the headers of N frames in one go.
+
+    `headers` is an array of 16-bit header words, shaped (N, n_words) or
+    (n_words,) for a single frame. Return a 1-D array of FRAME_HEADER_DTYPE.
+    """
+    headers = np.asarray(headers)
+    headers = headers.reshape(-1, headers.shape[-1])
+    result = np.empty(len(headers), dtype=FRAME_HEADER_DTYPE)
+    result['frame_counter']         = headers[:, SPIHDR_FRCNT]
+    result['senxor_vdd']            = headers[:, SPIHDR_SXVDD]
+    result['senxor_temperature']    = headers[:, SPIHDR_SXTA]
+    result['timestamp']             = headers[:, SPIHDR_TIME + 1]
+    result['timestamp']           <<= 16
+    result['timestamp']            |= headers[:, SPIHDR_TIME]
+    result['pixel_max']             = headers[:, SPIHDR_MAXV]
+    result['pixel_min']             = headers[:, SPIHDR_MINV]
+    result['crc']                   = headers[:, SPIHDR_CRC]
+    result['crc_ok']                = -1
+    return result
+
+def header_to_dict(hdr):
+    """Return a dictionary with the header items in physical units"""
+    result = {}
+    result['frame_counter']         = int(hdr['frame_counter'])
+    result['senxor_vdd']            = float(hdr['senxor_vdd'] / 1.0e4)
+    result['senxor_temperature']    = float(hdr['senxor_temperature'] / 100. + KELVIN_0)
+    result['timestamp']             = int(hdr['timestamp'])
+    result['pixel_max']             = float(hdr['pixel_max'] / 10. + KELVIN_0)
+    result['pixel_min']             = float(hdr['pixel_min'] / 10. + KELVIN_0)
+    result['crc']                   = hex(int(hdr['crc']))
+    return result
 
 def format_header(hdr):
     """Format frame header to represent in log messages"""
     s = "FID{:6d}  time{:8d}  V_dd {:5.3f}  T_SX {:5.2f}".\
-        format(hdr['frame_counter'], hdr['timestamp'],\
-               hdr['senxor_vdd'], hdr['senxor_temperature'])
+        format(int(hdr['frame_counter']), int(hdr['timestamp']),\
+               hdr['senxor_vdd'] / 1.0e4,
+               hdr['senxor_temperature'] / 100. + KELVIN_0)
     s += '\n'
     return s
 
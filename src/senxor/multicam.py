@@ -0,0 +1,261 @@
+# Copyright (C) Meridian Innovation Ltd. Hong Kong, 2020. All rights reserved.
+#
+"""
+Concurrent acquisition from several SenXor modules.
+
+Each camera has its own Acquisition thread. The threads spend nearly all
+their time blocked in serial reads, with the GIL released, so a slow camera
+or consumer never holds up the others. Frames of different cameras are
+matched into sets by their capture time.
+
+The capture time of a frame is the header timestamp of its camera, mapped
+onto the host clock. The MI48 clocks are neither synchronised nor started
+together, so for each camera we track the offset between the two clocks
+as the smallest observed (host receive time - header timestamp); that is
+the offset plus the shortest transfer latency. Frames without a header
+fall back to the host receive time.
+
+Usage:
+
+    cameras = SenxorArray()
+    cameras.open()
+    cameras.start()
+    frameset = cameras.get_frameset(timeout=1.0)
+    for name, frame in frameset.frames.items():
+        temperature = cameras[name].to_celsius(frame.data)
+    cameras.stop()
+"""
+import time
+import logging
+import threading
+import collections
+from collections import namedtuple
+from senxor.mi48 import SPIHDR_TIME_UNIT
+from senxor.acquisition import Acquisition
+from senxor.utils import connect_senxor, get_senxor_port_names
+
+
+logger = logging.getLogger(__name__)
+
+# Frames of all cameras captured at about the same `time` (host clock);
+# `frames` maps camera name to acquisition.Frame, `spread` is the range of
+# their capture times in seconds
+FrameSet = namedtuple('FrameSet', ['time', 'frames', 'spread'])
+
+
+class CameraClock:
+    """Map the header timestamps of one camera onto the host clock"""
+
+    def __init__(self, drift_gain=0.01):
+        # fraction of a positive deviation by which the offset follows,
+        # to track clock drift; negative deviations are taken in full
+        self.drift_gain = drift_gain
+        self.reset()
+
+    def reset(self):
+        self.offset = None
+        self.last_timestamp = None
+
+    def capture_time(self, frame):
+        """Return the capture time of `frame` on the host clock"""
+        header = frame.header
+        if header is None or header['timestamp'] == 0:
+            return frame.host_time
+        ts = int(header['timestamp'])
+        if self.last_timestamp is not None and ts < self.last_timestamp:
+            # camera reset or timestamp wrap
+            self.reset()
+        self.last_timestamp = ts
+        sample = frame.host_time - ts * SPIHDR_TIME_UNIT
+        if self.offset is None or sample < self.offset:
+            self.offset = sample
+        else:
+            self.offset += self.drift_gain * (sample - self.offset)
+        return ts * SPIHDR_TIME_UNIT + self.offset
+
+
+class SenxorArray:
+    """A set of SenXor modules acquired concurrently"""
+
+    def __init__(self, sources=None, depth=32, profile_cache=None,
+                 tolerance=None):
+        """
+        Prepare to open the cameras in `sources`, a list of comport names
+        or indices as accepted by connect_senxor; by default all SenXor
+        modules connected to the host.
+
+        Frames are matched into a set if their capture times are within
+        `tolerance` seconds; by default half the frame period of the
+        slowest camera.
+        """
+        self.sources = sources
+        self.depth = depth
+        self.profile_cache = profile_cache
+        self.tolerance = tolerance
+        # resolved at start, so that matching needs no register reads
+        self._tolerance = None
+        self.cameras = collections.OrderedDict()
+        self.acquisitions = {}
+        self.subscriptions = {}
+        self.clocks = {}
+        # frames received but not yet matched, per camera
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.framesets = 0
+        self.unmatched = 0
+        self._spread_sum = 0.
+        self.t_start = None
+
+    def __len__(self):
+        return len(self.cameras)
+
+    def __getitem__(self, name):
+        return self.cameras[name]
+
+    def __iter__(self):
+        return iter(self.cameras.values())
+
+    def open(self):
+        """Connect to the cameras; return the names of those connected"""
+        sources = self.sources
+        if sources is None:
+            sources = get_senxor_port_names()
+        for src in sources:
+            mi48, port, _ = connect_senxor(src=src,
+                                           profile_cache=self.profile_cache)
+            if mi48 is None:
+                logger.warning('Failed connecting to SenXor {}'.format(src))
+                continue
+            self.add(mi48)
+        if not self.cameras:
+            logger.error('No SenXor connected')
+        return list(self.cameras)
+
+    def add(self, mi48):
+        """Add an MI48 that is already connected"""
+        if mi48.name in self.cameras:
+            raise ValueError('Duplicate camera name {}'.format(mi48.name))
+        acq = Acquisition(mi48, depth=self.depth)
+        self.cameras[mi48.name] = mi48
+        self.acquisitions[mi48.name] = acq
+        # the matcher must see every frame to pick the best match, but
+        # must never hold up a camera
+        self.subscriptions[mi48.name] = acq.subscribe(
+            'drop_oldest', maxlen=self.depth // 2)
+        self.clocks[mi48.name] = CameraClock()
+        self.pending[mi48.name] = collections.deque()
+
+    def get_tolerance(self):
+        if self.tolerance is not None:
+            return self.tolerance
+        fps = [mi48.get_fps() for mi48 in self]
+        fps = [f for f in fps if f]
+        if not fps:
+            return 0.05
+        return 0.5 / min(fps)
+
+    def start(self, with_header=True):
+        """Start streaming from all cameras"""
+        # start each reader right after its camera, so that no camera
+        # overflows while the next ones are being started; the reader
+        # must not start before the header mode is set
+        self._tolerance = self.get_tolerance()
+        for name, mi48 in self.cameras.items():
+            mi48.start(stream=True, with_header=with_header)
+            self.acquisitions[name].start()
+        self.t_start = time.monotonic()
+
+    def stop(self):
+        """Stop acquisition and close all cameras"""
+        for acq in self.acquisitions.values():
+            acq.stop()
+        for mi48 in self:
+            try:
+                mi48.stop()
+            except Exception as e:
+                logger.warning('{}: failed stopping: {}'.format(mi48.name, e))
+
+    def _fill(self, name, deadline):
+        """Ensure a pending frame of camera `name`; False on timeout"""
+        queue = self.pending[name]
+        if queue:
+            return True
+        timeout = max(0., deadline - time.monotonic())
+        frame = self.subscriptions[name].get(timeout=timeout)
+        if frame is None:
+            return False
+        queue.append((self.clocks[name].capture_time(frame), frame))
+        return True
+
+    def get_frameset(self, timeout=None):
+        """
+        Return the next FrameSet, with one frame of every camera,
+        or None on timeout.
+
+        Frames that have no match within the tolerance in all other
+        cameras are discarded; see `unmatched` in get_stats.
+        """
+        deadline = time.monotonic() + (1.e9 if timeout is None else timeout)
+        tolerance = self._tolerance
+        if tolerance is None:
+            tolerance = self.get_tolerance()
+        with self.lock:
+            while True:
+                for name in self.cameras:
+                    if not self._fill(name, deadline):
+                        return None
+                heads = {name: q[0][0] for name, q in self.pending.items()}
+                latest = max(heads.values())
+                # drop the frames too old to match the latest head
+                stale = [name for name, t in heads.items()
+                         if t < latest - tolerance]
+                if not stale:
+                    break
+                for name in stale:
+                    self.pending[name].popleft()
+                    self.unmatched += 1
+            frames = collections.OrderedDict()
+            for name, q in self.pending.items():
+                frames[name] = q.popleft()[1]
+            earliest = min(heads.values())
+            self.framesets += 1
+            self._spread_sum += latest - earliest
+        return FrameSet(0.5 * (earliest + latest), frames, latest - earliest)
+
+    def framesets_iter(self, timeout=1.0):
+        """Yield FrameSets until one is not complete within `timeout`"""
+        while True:
+            frameset = self.get_frameset(timeout)
+            if frameset is None:
+                return
+            yield frameset
+
+    def get_stats(self):
+        """
+        Return per-camera and aggregate throughput as a dictionary.
+
+        Per camera are the statistics of MI48.get_stats, plus the frames
+        lost by its reader and by the matcher.
+        """
+        cameras = {}
+        total_fps = 0.
+        for name, mi48 in self.cameras.items():
+            res = mi48.get_stats()
+            acq = self.acquisitions[name]
+            res['read_errors'] = acq.read_errors
+            res['matcher_dropped'] = self.subscriptions[name].dropped
+            res['matcher_lag'] = self.subscriptions[name].lag()
+            cameras[name] = res
+            total_fps += res.get('fps') or 0.
+        uptime = 0. if self.t_start is None else \
+                 time.monotonic() - self.t_start
+        return {
+            'cameras': cameras,
+            'ncameras': len(self.cameras),
+            'total_fps': total_fps,
+            'framesets': self.framesets,
+            'frameset_fps': self.framesets / uptime if uptime > 0 else 0.,
+            'unmatched': self.unmatched,
+            'mean_spread_ms': (1.e3 * self._spread_sum / self.framesets
+                               if self.framesets else None),
+        }
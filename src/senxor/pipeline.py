@@ -0,0 +1,244 @@
+# Copyright (C) Meridian Innovation Ltd. Hong Kong, 2020. All rights reserved.
+#
+"""
+Staged processing of acquired frames, each stage on its own thread.
+
+A Pipeline takes frames from an acquisition Subscription and passes them
+down a chain of Stages. Each stage is a worker thread with a small
+bounded input queue; when a stage falls behind, the oldest frame in its
+queue is dropped, so the latest frame wins and a slow stage never holds
+up the stages before it, nor the acquisition. OpenCV and NumPy release
+the GIL in their heavy lifting, so the stages run in parallel on
+several cores.
+
+A frame travels as a PipelineItem, on which each stage function sets its
+results; a stage function returning False drops the frame. The item is
+timestamped at every stage boundary. A stage runs on one frame at a
+time, but different stages run on different frames at once, so stage
+functions must not share output buffers between frames.
+
+Usage:
+
+    def geometry(item):
+        item.raw = geo.apply(item.frame.data, out=np.empty(geo.shape, 'u2'))
+
+    acq = Acquisition(mi48)
+    pipeline = Pipeline(acq.subscribe('latest'),
+                        [('geometry', geometry), ('render', render)])
+    acq.start()
+    pipeline.start()
+    ...
+    print(pipeline.get_stats())
+    pipeline.stop()
+"""
+import time
+import logging
+import threading
+import collections
+
+
+logger = logging.getLogger(__name__)
+
+
+class PipelineItem:
+    """A frame in the pipeline, with the results of the stages so far"""
+
+    def __init__(self, frame):
+        # the acquisition.Frame
+        self.frame = frame
+        self.seq = frame.seq
+        # (boundary, host time) pairs, from the reception of the frame
+        # to the end of the last stage that processed it
+        self.times = [('acquired', frame.host_time)]
+
+    def stamp(self, name):
+        self.times.append((name, time.time()))
+
+    def latency(self):
+        """Seconds from reception of the frame to the last boundary"""
+        return self.times[-1][1] - self.times[0][1]
+
+
+class StageQueue:
+    """Bounded queue of items; a put into a full queue drops the oldest"""
+
+    def __init__(self, maxlen=1):
+        self.maxlen = max(1, maxlen)
+        self.items = collections.deque()
+        self.cond = threading.Condition()
+        self.closed = False
+        self.dropped = 0
+
+    def put(self, item):
+        with self.cond:
+            if len(self.items) >= self.maxlen:
+                self.items.popleft()
+                self.dropped += 1
+            self.items.append(item)
+            self.cond.notify()
+
+    def get(self, timeout=None):
+        """Return the oldest item, or None on timeout or once closed"""
+        with self.cond:
+            self.cond.wait_for(lambda: self.items or self.closed, timeout)
+            if self.closed or not self.items:
+                return None
+            return self.items.popleft()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.items.clear()
+            self.cond.notify_all()
+
+
+class Stage:
+    """A worker thread applying `func` to the items of its queue"""
+
+    def __init__(self, name, func, maxlen=1):
+        self.name = name
+        self.func = func
+        self.queue = StageQueue(maxlen)
+        # where processed items go: the next stage's queue or the sink
+        self.output = None
+        self.thread = None
+        self.processed = 0
+        self.skipped = 0
+        self.errors = 0
+        # total seconds spent in `func`, and waiting in the queue
+        self._busy = 0.
+        self._queued = 0.
+
+    def start(self, name_prefix=''):
+        self.thread = threading.Thread(target=self._run, daemon=True,
+                                       name='{}{}'.format(name_prefix, self.name))
+        self.thread.start()
+
+    def stop(self, timeout=2.0):
+        self.queue.close()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                # closed
+                break
+            t0 = time.time()
+            self._queued += t0 - item.times[-1][1]
+            try:
+                keep = self.func(item)
+            except Exception as e:
+                self.errors += 1
+                logger.error('Stage %s failed on frame %s: %s',
+                             self.name, item.seq, e)
+                continue
+            item.stamp(self.name)
+            self._busy += item.times[-1][1] - t0
+            self.processed += 1
+            if keep is False:
+                self.skipped += 1
+                continue
+            if self.output is not None:
+                self.output(item)
+
+    def get_stats(self, uptime):
+        n = self.processed + self.errors
+        return {
+            'fps': self.processed / uptime if uptime > 0 else 0.,
+            'processed': self.processed,
+            'dropped': self.queue.dropped,
+            'skipped': self.skipped,
+            'errors': self.errors,
+            'busy_ms': 1.e3 * self._busy / n if n else None,
+            'queued_ms': 1.e3 * self._queued / n if n else None,
+        }
+
+
+class Pipeline:
+    """A chain of Stages fed by an acquisition Subscription"""
+
+    def __init__(self, source, stages, maxlen=1, name='pipeline'):
+        """
+        `stages` is a sequence of (name, func) pairs; every stage has an
+        input queue of `maxlen` items.
+        """
+        if not stages:
+            raise ValueError('A pipeline needs at least one stage')
+        self.source = source
+        self.name = name
+        self.stages = collections.OrderedDict()
+        for stage_name, func in stages:
+            if stage_name in self.stages:
+                raise ValueError('Duplicate stage {}'.format(stage_name))
+            self.stages[stage_name] = Stage(stage_name, func, maxlen)
+        chain = list(self.stages.values())
+        for stage, next_stage in zip(chain[:-1], chain[1:]):
+            stage.output = next_stage.queue.put
+        chain[-1].output = self._done
+        self.running = False
+        self.thread = None
+        self.t_start = None
+        self.fed = 0
+        self.completed = 0
+        self.last_item = None
+        self._latency = 0.
+
+    def __getitem__(self, name):
+        return self.stages[name]
+
+    def start(self):
+        self.running = True
+        self.t_start = time.monotonic()
+        for stage in self.stages.values():
+            stage.start('{}-'.format(self.name))
+        self.thread = threading.Thread(target=self._feed, daemon=True,
+                                       name='{}-feed'.format(self.name))
+        self.thread.start()
+
+    def stop(self, timeout=2.0):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+        for stage in self.stages.values():
+            stage.stop(timeout)
+
+    def _feed(self):
+        first = next(iter(self.stages.values()))
+        while self.running:
+            # the frames outlive their ring slot down the pipeline
+            frame = self.source.get(timeout=1.0, copy=True)
+            if frame is None:
+                if self.running:
+                    logger.error('%s: no frame received', self.name)
+                continue
+            self.fed += 1
+            first.queue.put(PipelineItem(frame))
+
+    def _done(self, item):
+        self.completed += 1
+        self._latency += item.latency()
+        self.last_item = item
+
+    def get_stats(self):
+        """
+        Return the statistics of each stage and of the whole pipeline:
+        the rate of completed frames and their mean latency from
+        reception to the end of the last stage.
+        """
+        uptime = 0. if self.t_start is None else \
+                 time.monotonic() - self.t_start
+        stages = collections.OrderedDict(
+            (name, stage.get_stats(uptime))
+            for name, stage in self.stages.items())
+        return {
+            'stages': stages,
+            'fed': self.fed,
+            'completed': self.completed,
+            'fps': self.completed / uptime if uptime > 0 else 0.,
+            'latency_ms': (1.e3 * self._latency / self.completed
+                           if self.completed else None),
+        }
@@ -0,0 +1,67 @@
+# Copyright (C) Meridian Innovation Ltd. Hong Kong, 2020. All rights reserved.
+#
+"""
+On-disk cache of camera profiles, for fast reconnection.
+
+A profile is a dictionary keyed by the SenXor serial number (MI48.sn),
+holding the camera information (type, module, ID, FW version, max FPS),
+the FPA shape and the last applied register settings.
+"""
+import os
+import json
+import logging
+from pathlib import Path
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROFILE_FILE = Path.home() / '.senxor' / 'profiles.json'
+
+
+class ProfileCache:
+    """Camera profiles persisted as a JSON file"""
+
+    def __init__(self, filename=None):
+        if filename is None:
+            filename = DEFAULT_PROFILE_FILE
+        self.filename = Path(filename)
+        self.profiles = self.load()
+
+    def load(self):
+        """Read the profiles from file; start afresh if missing or corrupt"""
+        try:
+            with open(self.filename) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (ValueError, OSError) as e:
+            logger.warning('Ignoring camera profile cache {}: {}'.
+                           format(self.filename, e))
+            return {}
+
+    def save(self):
+        """Write the profiles to file, replacing it atomically"""
+        self.filename.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.filename.with_suffix('.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(self.profiles, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.filename)
+
+    def get(self, sn):
+        """Return the profile of camera `sn`, or None"""
+        return self.profiles.get(sn)
+
+    def update(self, sn, **items):
+        """Update the profile of camera `sn` with `items` and save"""
+        self.profiles.setdefault(sn, {}).update(items)
+        try:
+            self.save()
+        except OSError as e:
+            # the cache is an optimisation; never fail the caller
+            logger.warning('Failed saving camera profile cache {}: {}'.
+                           format(self.filename, e))
+
+    def remove(self, sn):
+        """Forget the profile of camera `sn`"""
+        if self.profiles.pop(sn, None) is not None:
+            self.save()
@@ -0,0 +1,475 @@
+# Copyright (C) Meridian Innovation Ltd. Hong Kong, 2020. All rights reserved.
+#
+"""
+Binary recording of raw frames, with a side index.
+
+A recording is an append-only file of chunks, each holding a run of raw
+uint16 frames, their host times and their headers (FRAME_HEADER_DTYPE):
+
+    | file header, padded to RECORDING_HEADER_SIZE | chunk | chunk | ...
+
+    chunk: | CHUNK_HEADER | frames | host times (f8) | headers |
+
+The file header is the magic followed by JSON describing the frames.
+
+Optionally, chunks are compressed losslessly: the first frame of a chunk
+is a keyframe, each following frame is stored as its difference to the
+previous one, and the chunk is compressed with zlib or lzma. Thermal
+frames change little from one to the next, so the differences are small
+numbers; their low and high bytes are stored in separate planes, as the
+high bytes are then nearly all 0x00 or 0xFF. Any frame is decoded from
+its chunk alone, so a chunk is the unit of random access.
+
+Next to the data file, `<filename>.idx` holds one RECORDING_INDEX_DTYPE
+record per frame, with its frame counter, timestamp, host time and
+location, for lookup without touching the data. The index can be rebuilt
+from the chunks if lost.
+
+Frames are accepted into preallocated chunk buffers and written by a
+background thread, so that `write` never waits for the disk; should the
+disk fall behind by all the buffers, frames are dropped and counted.
+
+Usage:
+
+    recorder = FrameRecorder('session.sxr', mi48.fpa_shape)
+    recorder.attach(acquisition)
+    ...
+    recorder.close()
+
+    rec = RecordingReader('session.sxr')
+    data, header = rec[100]
+    frames = rec.get_frames(0, 1000)   # (1000, npixels) uint16
+"""
+import os
+import json
+import time
+import lzma
+import zlib
+import queue
+import struct
+import logging
+import threading
+import numpy as np
+from senxor.mi48 import FRAME_HEADER_DTYPE
+
+
+logger = logging.getLogger(__name__)
+
+RECORDING_MAGIC = b'SXREC01\x00'
+RECORDING_HEADER_SIZE = 4096
+RECORDING_EXT = 'sxr'
+
+# magic, codec, number of frames, (reserved), sequence number of the first
+# frame, number of bytes that follow
+CHUNK_HEADER = struct.Struct('<4sIIIQQ')
+CHUNK_MAGIC = b'SXCK'
+CODEC_RAW = 0
+CODEC_DELTA_ZLIB = 1
+CODEC_DELTA_LZMA = 2
+
+# compression option of FrameRecorder -> (codec, default level)
+COMPRESSION = {
+    None: (CODEC_RAW, None),
+    'zlib': (CODEC_DELTA_ZLIB, 1),
+    'lzma': (CODEC_DELTA_LZMA, 0),
+}
+
+RECORDING_INDEX_DTYPE = np.dtype([
+    ('seq',           np.uint64),
+    ('frame_counter', np.uint16),
+    ('timestamp',     np.uint32),
+    ('host_time',     np.float64),
+    ('chunk_offset',  np.uint64),  # file offset of the chunk header
+    ('chunk_index',   np.uint32),  # position of the frame in its chunk
+])
+
+
+def get_index_filename(filename):
+    return '{}.idx'.format(filename)
+
+
+class ChunkBuffer:
+    """Preallocated storage of the frames of one chunk"""
+
+    def __init__(self, nframes, npixels):
+        self.frames = np.zeros((nframes, npixels), dtype='<u2')
+        self.host_times = np.zeros(nframes, dtype='<f8')
+        self.headers = np.zeros(nframes, dtype=FRAME_HEADER_DTYPE)
+        self.n = 0
+        self.seq = 0  # sequence number of the first frame
+
+    def full(self):
+        return self.n == len(self.frames)
+
+
+class FrameRecorder:
+    """Append-only chunked recorder of raw frames"""
+
+    def __init__(self, filename, fpa_shape, chunk_frames=256, nbuffers=4,
+                 info=None, compression=None, level=None):
+        """
+        Create the recording `filename` for frames of `fpa_shape`.
+
+        Frames are written in chunks of `chunk_frames`; `nbuffers` chunks
+        may be waiting for the disk before frames are dropped.
+        `info` is a dictionary stored in the file header, e.g. the
+        camera info.
+        `compression` is one of COMPRESSION: None, 'zlib' or 'lzma', at
+        the given `level`; a keyframe starts every chunk.
+        """
+        try:
+            self.codec, default_level = COMPRESSION[compression]
+        except KeyError:
+            raise ValueError('Compression must be one of {}'.
+                             format(list(COMPRESSION)))
+        self.compression = compression
+        self.level = default_level if level is None else level
+        self.filename = filename
+        self.fpa_shape = tuple(fpa_shape)
+        self.npixels = int(np.prod(fpa_shape))
+        self.chunk_frames = chunk_frames
+        self.file = open(filename, 'wb')
+        self.index_file = open(get_index_filename(filename), 'wb')
+        header = {
+            'fpa_shape': self.fpa_shape,
+            'npixels': self.npixels,
+            'chunk_frames': chunk_frames,
+            'compression': compression,
+            'header_dtype': FRAME_HEADER_DTYPE.descr,
+            'start_time': time.time(),
+            'info': info or {},
+        }
+        header = json.dumps(header).encode()
+        header = RECORDING_MAGIC + struct.pack('<I', len(header)) + header
+        if len(header) > RECORDING_HEADER_SIZE:
+            raise ValueError('Recording info too large')
+        self.file.write(header.ljust(RECORDING_HEADER_SIZE, b'\x00'))
+        self._offset = RECORDING_HEADER_SIZE
+        self._free = queue.Queue()
+        for i in range(nbuffers):
+            self._free.put(ChunkBuffer(chunk_frames, self.npixels))
+        self._full = queue.Queue()
+        self._current = self._free.get_nowait()
+        self.frames = 0  # accepted
+        self.dropped = 0
+        self.written = 0
+        self.write_time = 0.  # seconds spent in disk writes
+        self.encode_time = 0.  # seconds spent compressing
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+        self._feeder = None
+        self._writer = threading.Thread(target=self._run, daemon=True,
+                                        name='recorder-{}'.format(
+                                            os.path.basename(filename)))
+        self._writer.start()
+
+    def write(self, data, header=None, host_time=None):
+        """
+        Accept a raw frame for writing; return False if it had to be
+        dropped because the disk is behind. Never blocks.
+        """
+        buf = self._current
+        if buf is None:
+            try:
+                buf = self._current = self._free.get_nowait()
+            except queue.Empty:
+                self.dropped += 1
+                return False
+            buf.n = 0
+            buf.seq = self.frames
+        i = buf.n
+        buf.frames[i] = data
+        if header is not None:
+            buf.headers[i] = header
+        else:
+            buf.headers[i] = np.zeros((), dtype=FRAME_HEADER_DTYPE)
+        buf.host_times[i] = time.time() if host_time is None else host_time
+        buf.n += 1
+        self.frames += 1
+        if buf.full():
+            self._full.put(buf)
+            self._current = None
+        return True
+
+    def flush(self):
+        """Hand the frames accepted so far over to the writer"""
+        buf = self._current
+        if buf is not None and buf.n > 0:
+            self._full.put(buf)
+            self._current = None
+
+    def encode_chunk(self, buf):
+        """Return (codec, list of buffers) storing the chunk `buf`"""
+        n = buf.n
+        parts = [buf.frames[:n], buf.host_times[:n], buf.headers[:n]]
+        if self.codec == CODEC_RAW:
+            return CODEC_RAW, parts
+        parts[0] = delta_encode(parts[0])
+        data = b''.join(memoryview(np.ascontiguousarray(part)).cast('B')
+                        for part in parts)
+        if self.codec == CODEC_DELTA_ZLIB:
+            data = zlib.compress(data, self.level)
+        else:
+            data = lzma.compress(data, preset=self.level)
+        return self.codec, [np.frombuffer(data, dtype=np.uint8)]
+
+    def _write_chunk(self, buf):
+        n = buf.n
+        t0 = time.monotonic()
+        codec, parts = self.encode_chunk(buf)
+        t1 = time.monotonic()
+        self.encode_time += t1 - t0
+        size = sum(part.nbytes for part in parts)
+        self.raw_bytes += n * (buf.frames.itemsize * self.npixels +
+                               buf.host_times.itemsize +
+                               buf.headers.itemsize)
+        self.stored_bytes += size
+        t0 = t1
+        self.file.write(CHUNK_HEADER.pack(CHUNK_MAGIC, codec, n, 0,
+                                          buf.seq, size))
+        for part in parts:
+            self.file.write(memoryview(np.ascontiguousarray(part)).cast('B'))
+        self.file.flush()
+        index = np.empty(n, dtype=RECORDING_INDEX_DTYPE)
+        index['seq'] = buf.seq + np.arange(n)
+        index['frame_counter'] = buf.headers['frame_counter'][:n]
+        index['timestamp'] = buf.headers['timestamp'][:n]
+        index['host_time'] = buf.host_times[:n]
+        index['chunk_offset'] = self._offset
+        index['chunk_index'] = np.arange(n)
+        # the index follows the data, so it never points past the file
+        self.index_file.write(index.tobytes())
+        self.index_file.flush()
+        self.write_time += time.monotonic() - t0
+        self._offset += CHUNK_HEADER.size + size
+        self.written += n
+
+    def _run(self):
+        while True:
+            buf = self._full.get()
+            if buf is None:
+                return
+            try:
+                self._write_chunk(buf)
+            except Exception as e:
+                logger.error('{}: chunk write failed: {}'.
+                             format(self.filename, e))
+            buf.n = 0
+            self._free.put(buf)
+
+    def attach(self, acquisition):
+        """
+        Record the frames of an Acquisition from a thread of our own.
+
+        The subscription drops the oldest frames rather than hold up the
+        acquisition, should this thread ever fall behind.
+        """
+        sub = acquisition.subscribe('drop_oldest',
+                                    maxlen=acquisition.ring.depth // 2)
+        self._subscription = sub
+        self._feeding = True
+
+        def feed():
+            while self._feeding:
+                # no copy: the frame is copied into the chunk buffer
+                frame = sub.get(timeout=0.5, copy=False)
+                if frame is not None:
+                    self.write(frame.data, frame.header, frame.host_time)
+        self._feeder = threading.Thread(target=feed, daemon=True,
+                                        name='{}-feeder'.format(
+                                            self._writer.name))
+        self._feeder.start()
+        return sub
+
+    def get_stats(self):
+        """
+        Return the recorder statistics as a dictionary.
+
+        The compression ratio is of the chunk data; the encode and write
+        rates are in MB/s of raw data.
+        """
+        mb = self.raw_bytes / 1.e6
+        return {
+            'frames': self.frames,
+            'written': self.written,
+            'dropped': self.dropped,
+            'pending_chunks': self._full.qsize(),
+            'write_time_s': self.write_time,
+            'encode_time_s': self.encode_time,
+            'bytes': self._offset,
+            'compression': self.compression,
+            'compression_ratio': (self.raw_bytes / self.stored_bytes
+                                  if self.stored_bytes else None),
+            'encode_mb_s': (mb / self.encode_time
+                            if self.encode_time > 0 else None),
+            'write_mb_s': (mb / self.write_time
+                           if self.write_time > 0 else None),
+        }
+
+    def close(self):
+        """Write all accepted frames and close the files"""
+        if self._feeder is not None:
+            self._feeding = False
+            self._feeder.join()
+            self._feeder = None
+            self._subscription.close()
+        self.flush()
+        self._full.put(None)
+        self._writer.join()
+        self.file.close()
+        self.index_file.close()
+        if self.dropped:
+            logger.warning('{}: {} frames dropped; disk too slow'.
+                           format(self.filename, self.dropped))
+
+
+def delta_encode(frames):
+    """
+    Return the (N, npixels) uint16 `frames` as the first frame followed
+    by frame-to-frame differences (modulo 2**16), each split into a plane
+    of low bytes and a plane of high bytes.
+    """
+    delta = frames.copy()
+    np.subtract(frames[1:], frames[:-1], out=delta[1:])
+    planes = delta.view(np.uint8).reshape(len(frames), -1, 2)
+    return np.ascontiguousarray(planes.transpose(0, 2, 1))
+
+def delta_decode(data):
+    """Inverse of delta_encode, given the planes as (N, npixels) uint16"""
+    n, npixels = data.shape
+    planes = data.view(np.uint8).reshape(n, 2, npixels)
+    delta = np.ascontiguousarray(planes.transpose(0, 2, 1)).view('<u2').\
+            reshape(n, npixels)
+    # the sum wraps around modulo 2**16, undoing the differences
+    return np.cumsum(delta, axis=0, dtype=np.uint16)
+
+
+def read_recording_header(mm):
+    """Return the header dictionary of a memory-mapped recording"""
+    if bytes(mm[:len(RECORDING_MAGIC)]) != RECORDING_MAGIC:
+        raise ValueError('Not a SenXor recording')
+    i = len(RECORDING_MAGIC)
+    n, = struct.unpack('<I', bytes(mm[i: i + 4]))
+    return json.loads(bytes(mm[i + 4: i + 4 + n]).decode())
+
+
+class RecordingReader:
+    """Random access to a recording through np.memmap"""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.mm = np.memmap(filename, dtype=np.uint8, mode='r')
+        self.info = read_recording_header(self.mm)
+        self.npixels = self.info['npixels']
+        self.fpa_shape = tuple(self.info['fpa_shape'])
+        try:
+            self.index = np.fromfile(get_index_filename(filename),
+                                     dtype=RECORDING_INDEX_DTYPE)
+        except FileNotFoundError:
+            logger.warning('{}: no index; rebuilding'.format(filename))
+            self.index = self.rebuild_index()
+        self._chunk_cache = {}
+
+    def __len__(self):
+        return len(self.index)
+
+    def _chunks(self):
+        """Yield (offset, codec, nframes, seq, size) of each chunk"""
+        offset = RECORDING_HEADER_SIZE
+        while offset + CHUNK_HEADER.size <= len(self.mm):
+            magic, codec, n, _, seq, size = CHUNK_HEADER.unpack(
+                bytes(self.mm[offset: offset + CHUNK_HEADER.size]))
+            if magic != CHUNK_MAGIC or\
+               offset + CHUNK_HEADER.size + size > len(self.mm):
+                # incomplete last chunk, e.g. after a crash
+                return
+            yield offset, codec, n, seq, size
+            offset += CHUNK_HEADER.size + size
+
+    def rebuild_index(self, save=True):
+        """Reconstruct the index from the chunks; save it if `save`"""
+        parts = []
+        for offset, codec, n, seq, size in self._chunks():
+            frames, host_times, headers = self.decode_chunk(offset)
+            index = np.empty(n, dtype=RECORDING_INDEX_DTYPE)
+            index['seq'] = seq + np.arange(n)
+            index['frame_counter'] = headers['frame_counter']
+            index['timestamp'] = headers['timestamp']
+            index['host_time'] = host_times
+            index['chunk_offset'] = offset
+            index['chunk_index'] = np.arange(n)
+            parts.append(index)
+        index = np.concatenate(parts) if parts else\
+                np.empty(0, dtype=RECORDING_INDEX_DTYPE)
+        if save:
+            index.tofile(get_index_filename(self.filename))
+        return index
+
+    def decode_chunk(self, offset):
+        """
+        Return (frames, host_times, headers) of the chunk at `offset`;
+        views of the memory map for raw chunks.
+        """
+        magic, codec, n, _, seq, size = CHUNK_HEADER.unpack(
+            bytes(self.mm[offset: offset + CHUNK_HEADER.size]))
+        i = offset + CHUNK_HEADER.size
+        data = self.mm[i: i + size]
+        if codec == CODEC_DELTA_ZLIB:
+            data = np.frombuffer(zlib.decompress(data), dtype=np.uint8)
+        elif codec == CODEC_DELTA_LZMA:
+            data = np.frombuffer(lzma.decompress(data), dtype=np.uint8)
+        elif codec != CODEC_RAW:
+            raise ValueError('Unsupported chunk codec {}'.format(codec))
+        i = 2 * n * self.npixels
+        frames = data[:i].view('<u2').reshape(n, self.npixels)
+        if codec != CODEC_RAW:
+            frames = delta_decode(frames)
+        host_times = data[i: i + 8 * n].view('<f8')
+        i += host_times.nbytes
+        headers = data[i: i + n * FRAME_HEADER_DTYPE.itemsize].\
+                  view(FRAME_HEADER_DTYPE)
+        return frames, host_times, headers
+
+    def get_chunk(self, offset):
+        chunk = self._chunk_cache.get(offset)
+        if chunk is None:
+            chunk = self.decode_chunk(offset)
+            # raw chunks are views; keep only the last of other codecs
+            if len(self._chunk_cache) > 1:
+                self._chunk_cache.clear()
+            self._chunk_cache[offset] = chunk
+        return chunk
+
+    def __getitem__(self, i):
+        """Return (data, header) of frame `i`"""
+        rec = self.index[i]
+        frames, host_times, headers = self.get_chunk(int(rec['chunk_offset']))
+        j = int(rec['chunk_index'])
+        return frames[j], headers[j]
+
+    def get_frames(self, start=0, stop=None):
+        """
+        Return the frames [start, stop) as an (N, npixels) array; a view
+        of the file if they lie within one chunk.
+        """
+        index = self.index[start: stop]
+        if len(index) == 0:
+            return np.empty((0, self.npixels), dtype='<u2')
+        parts = []
+        for offset in np.unique(index['chunk_offset']):
+            sel = index['chunk_index'][index['chunk_offset'] == offset]
+            frames = self.get_chunk(int(offset))[0]
+            parts.append(frames[sel[0]: sel[-1] + 1])
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def find_frame_counter(self, counter):
+        """Return the indices of the frames with header `counter`"""
+        return np.flatnonzero(self.index['frame_counter'] == counter)
+
+    def find_host_time(self, t):
+        """Return the index of the first frame received at or after `t`"""
+        return int(np.searchsorted(self.index['host_time'], t))
+
+    def close(self):
+        self._chunk_cache.clear()
+        del self.mm
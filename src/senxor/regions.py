@@ -0,0 +1,166 @@
+# Copyright (C) Meridian Innovation Ltd. Hong Kong, 2020. All rights reserved.
+#
+"""
+Temperature statistics of rectangular zones of a frame.
+
+RegionStats builds a summed-area table of the frame and of its square,
+once per frame; the sum over any rectangle is then four lookups, so the
+mean and standard deviation of any number of zones cost the same
+whatever their size or overlap.
+
+Zones are defined by a configuration, a dictionary or a JSON file:
+
+    {
+        "units": "fraction",
+        "zones": {"Top": [0, 0, 1, 0.3333], ...},
+        "grids": [{"prefix": "bed", "rows": 8, "cols": 8,
+                   "box": [0, 0, 1, 1]}],
+        "overlay": ["Top", ...]
+    }
+
+Each zone is a box [x1, y1, x2, y2], end exclusive, as fractions of the
+frame width and height, or in pixels with "units": "pixel". A grid
+defines rows x cols zones named <prefix>-<row>-<col> tiling its box,
+by default the whole frame.
+"overlay", if given, lists the zones to show on a display; by default
+all of them.
+
+Usage:
+
+    stats = RegionStats(zones_to_pixels(load_zones('bed.json'), shape))
+    means, sdevs = stats.compute(frame)
+"""
+import json
+import logging
+import collections
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+ZONE_UNITS = ['fraction', 'pixel']
+
+# thirds of the frame
+DEFAULT_ZONES = {
+    'units': 'fraction',
+    'zones': {
+        'Top': [0, 0, 1, 1/3],
+        'Bottom': [0, 2/3, 1, 1],
+        'Left': [0, 0, 1/3, 1],
+        'Right': [2/3, 0, 1, 1],
+        'Center': [1/3, 1/3, 2/3, 2/3],
+    },
+}
+
+
+def load_zones(filename):
+    """Return the zone configuration in the JSON file `filename`"""
+    with open(filename) as f:
+        config = json.load(f)
+    if 'zones' not in config and 'grids' not in config:
+        raise ValueError('{}: no zones or grids defined'.format(filename))
+    return config
+
+
+def grid_zones(rows, cols, prefix='zone', box=(0, 0, 1, 1)):
+    """Return the zones of a rows x cols grid tiling `box`"""
+    x1, y1, x2, y2 = box
+    xs = np.linspace(x1, x2, cols + 1)
+    ys = np.linspace(y1, y2, rows + 1)
+    zones = collections.OrderedDict()
+    for r in range(rows):
+        for c in range(cols):
+            name = '{}-{}-{}'.format(prefix, r, c)
+            zones[name] = [xs[c], ys[r], xs[c + 1], ys[r + 1]]
+    return zones
+
+
+def zones_to_pixels(config, shape):
+    """
+    Return the zones of `config` in a frame of `shape` (rows, cols), as
+    an ordered dictionary of pixel boxes (x1, y1, x2, y2).
+    """
+    units = config.get('units', 'fraction')
+    if units not in ZONE_UNITS:
+        raise ValueError('Zone units must be one of {}'.format(ZONE_UNITS))
+    h, w = shape
+    scale = (w, h, w, h) if units == 'fraction' else (1, 1, 1, 1)
+    # the whole frame, in the units of the config
+    frame_box = (0, 0, 1, 1) if units == 'fraction' else (0, 0, w, h)
+    zones = collections.OrderedDict(config.get('zones', {}))
+    for grid in config.get('grids', []):
+        zones.update(grid_zones(grid['rows'], grid['cols'],
+                                grid.get('prefix', 'zone'),
+                                grid.get('box', frame_box)))
+    return collections.OrderedDict(
+        (name, tuple(int(round(v * s)) for v, s in zip(box, scale)))
+        for name, box in zones.items())
+
+
+class RegionStats:
+    """Mean and standard deviation of rectangular zones of frames"""
+
+    def __init__(self, zones):
+        """
+        `zones` maps zone names to pixel boxes (x1, y1, x2, y2), end
+        exclusive, as returned by zones_to_pixels.
+        """
+        self.names = list(zones)
+        boxes = np.array([zones[name] for name in self.names],
+                         dtype=np.intp).reshape(-1, 4)
+        x1, y1, x2, y2 = boxes.T
+        if ((x2 <= x1) | (y2 <= y1) | (x1 < 0) | (y1 < 0)).any():
+            bad = [n for n, b in zip(self.names, boxes)
+                   if b[2] <= b[0] or b[3] <= b[1] or b[0] < 0 or b[1] < 0]
+            raise ValueError('Empty or negative zones: {}'.format(bad))
+        self.boxes = boxes
+        self.area = ((x2 - x1) * (y2 - y1)).astype(np.float64)
+        self.shape = None
+
+    def _prepare(self, shape):
+        h, w = shape
+        x1, y1, x2, y2 = self.boxes.T
+        if (x2 > w).any() or (y2 > h).any():
+            raise ValueError('Zones exceed the {}x{} frame'.format(w, h))
+        # the tables have a leading row and column of zeros, so that
+        # the sum over [y1:y2, x1:x2] is sat[y2, x2] - sat[y1, x2]
+        # - sat[y2, x1] + sat[y1, x1], with flat indices below
+        stride = w + 1
+        self._corners = np.stack([y2 * stride + x2, y1 * stride + x2,
+                                  y2 * stride + x1, y1 * stride + x1])
+        self._sat = np.zeros((2, h + 1, w + 1))
+        self._tmp = np.empty((h, w))
+        self.shape = tuple(shape)
+
+    def _box_sums(self, sat):
+        s = sat.ravel()[self._corners]
+        return s[0] - s[1] - s[2] + s[3]
+
+    def compute(self, frame):
+        """
+        Return the means and standard deviations of the zones in the 2D
+        `frame`, as arrays in the order of `names`.
+        """
+        if frame.shape != self.shape:
+            self._prepare(frame.shape)
+        # accumulate deviations from one pixel, not absolute values, to
+        # keep the variance clear of cancellation
+        ref = float(frame.flat[0])
+        tmp = self._tmp
+        np.subtract(frame, ref, out=tmp)
+        sat, sat2 = self._sat
+        np.cumsum(tmp, axis=0, out=sat[1:, 1:])
+        np.cumsum(sat[1:, 1:], axis=1, out=sat[1:, 1:])
+        np.square(tmp, out=tmp)
+        np.cumsum(tmp, axis=0, out=sat2[1:, 1:])
+        np.cumsum(sat2[1:, 1:], axis=1, out=sat2[1:, 1:])
+        mean = self._box_sums(sat) / self.area
+        var = self._box_sums(sat2) / self.area - mean * mean
+        return mean + ref, np.sqrt(np.maximum(var, 0.))
+
+    def as_dict(self, frame):
+        """Return {zone name: (mean, sdev)} for `frame`"""
+        mean, sdev = self.compute(frame)
+        return collections.OrderedDict(
+            (name, (float(m), float(s)))
+            for name, m, s in zip(self.names, mean, sdev))
@@ -0,0 +1,335 @@
+# Copyright (C) Meridian Innovation Ltd. Hong Kong, 2020. All rights reserved.
+#
+"""
+Recording and replay of the byte stream of a camera session.
+
+SessionRecorder taps the serial port of a connected MI48 and writes every
+byte received, with its host time of arrival, to a session file. A
+ReplayPort plays the session back in place of the serial port: register
+commands are answered from the register values captured when recording
+started, and once capture is started, the recorded bytes are delivered
+at the original timing, at a multiple of it, or as fast as possible.
+Corrupted packets and all are replayed as they were received, so a bad
+session can be re-run through the pipeline and profiled.
+
+Session file layout:
+
+    | MAGIC | 4B info length | info (JSON) | records... |
+
+where each record is `| 8B host time (f8) | 4B length | bytes |`, little
+endian. The file is memory-mapped for replay, so even sessions of
+several hours open instantly and are not loaded into memory.
+
+Usage:
+
+    recorder = record_session(mi48, 'build-42.sxs')
+    mi48.start(stream=True)
+    ...
+    recorder.close()
+
+    mi48 = connect_replay('build-42.sxs', speed=1.0)
+    mi48.start(stream=True)
+    data, header = mi48.read()
+"""
+import re
+import mmap
+import json
+import time
+import struct
+import logging
+import numpy as np
+from senxor.mi48 import MI48, regmap, DEFAULT_CTRL_STAT, FPA_SHAPE,\
+                        GET_SINGLE_FRAME, CONTINUOUS_STREAM
+from senxor.interfaces import USB_Interface, USB_SYNC, USB_CKS_LEN
+from senxor.emulator import MI48Emulator
+
+
+logger = logging.getLogger(__name__)
+
+SESSION_MAGIC = b'SXSESS01'
+RECORD_HEADER = struct.Struct('<dI')
+
+# With speed None, bytes are delivered ahead of the reader up to this size
+REPLAY_AHEAD = 0x10000
+
+# Register acknowledges of the recorded session; these answered commands
+# of the original host, so are not replayed
+_REGISTER_ACK = re.compile(rb'   #([0-9A-Fa-f]{4})(?:RREG|WREG)')
+# longest register acknowledge: sync, length, command, data, check sum
+_REGISTER_ACK_LEN = len(USB_SYNC) + 4 + 4 + 2 + 4
+
+
+def get_session_info(mi48):
+    """Return the session information to record for `mi48`"""
+    regs = {regmap[name]: value for name, value in DEFAULT_CTRL_STAT.items()}
+    regs.update(mi48.regcache)
+    # identification registers, which a cached profile may not have read
+    regs[regmap['EVK_TEST']] = 0xFF if mi48.parse_header else 0x00
+    regs[regmap['SENXOR_TYPE']] = mi48.camera_type
+    regs[regmap['MODULE_TYPE']] = mi48.module_type
+    for i, b in enumerate(bytes.fromhex(mi48.camera_id)):
+        regs[regmap['SENXOR_ID_{}'.format(i)]] = b
+    major, minor, build = (int(v) for v in mi48.fw_version.split('.'))
+    regs[regmap['FW_VERSION_1']] = (major << 4) | minor
+    regs[regmap['FW_VERSION_2']] = build
+    # the replay starts idle, whatever the state when recording
+    for name in ['FRAME_MODE', 'STATUS']:
+        regs[regmap[name]] = DEFAULT_CTRL_STAT[name]
+    return {
+        'camera_info': mi48.camera_info,
+        'regs': {'{:02X}'.format(addr): value for addr, value in regs.items()},
+        'start_time': time.time(),
+    }
+
+
+class SessionRecorder:
+    """A serial port wrapper recording all received bytes to a file"""
+
+    def __init__(self, port, filename, info):
+        self.port = port
+        self.filename = filename
+        self.file = open(filename, 'wb')
+        _info = json.dumps(info).encode()
+        self.file.write(SESSION_MAGIC + struct.pack('<I', len(_info)) + _info)
+        self.nbytes = 0
+        self.records = 0
+
+    def _record(self, data):
+        # once stopped, the bytes still read through are not recorded
+        if data and not self.file.closed:
+            self.file.write(RECORD_HEADER.pack(time.monotonic(), len(data)))
+            self.file.write(data)
+            self.nbytes += len(data)
+            self.records += 1
+
+    def read(self, size=1):
+        data = self.port.read(size)
+        self._record(data)
+        return data
+
+    def readinto(self, b):
+        n = self.port.readinto(b)
+        if n:
+            self._record(b[:n])
+        return n
+
+    def __getattr__(self, name):
+        # everything else is the port's
+        return getattr(self.port, name)
+
+    def stop(self):
+        """Stop recording; the port remains open"""
+        if not self.file.closed:
+            self.file.close()
+            logger.info('Recorded {} bytes in {} records to {}'.
+                        format(self.nbytes, self.records, self.filename))
+
+    def close(self):
+        self.stop()
+        self.port.close()
+
+
+def record_session(mi48, filename):
+    """
+    Start recording the session of the connected `mi48` to `filename`;
+    return the SessionRecorder, which replaces the port of the MI48 USB
+    interface until `detach` is called.
+    """
+    usb = mi48.interfaces[0]
+    recorder = SessionRecorder(usb.port, filename, get_session_info(mi48))
+    usb.port = recorder
+
+    def detach():
+        recorder.stop()
+        usb.port = recorder.port
+    recorder.detach = detach
+    return recorder
+
+
+class SessionFile:
+    """Read access to a memory-mapped session file"""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._file = open(filename, 'rb')
+        self.mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mm[:len(SESSION_MAGIC)] != SESSION_MAGIC:
+            raise ValueError('{} is not a session file'.format(filename))
+        i = len(SESSION_MAGIC)
+        n, = struct.unpack_from('<I', self.mm, i)
+        i += 4
+        self.info = json.loads(self.mm[i: i + n].decode())
+        self.data_offset = i + n
+
+    def records(self, offset=None):
+        """Yield (host time, offset, length) of each record"""
+        if offset is None:
+            offset = self.data_offset
+        size = len(self.mm)
+        while offset + RECORD_HEADER.size <= size:
+            t, n = RECORD_HEADER.unpack_from(self.mm, offset)
+            offset += RECORD_HEADER.size
+            if offset + n > size:
+                # record truncated, e.g. by a crash while recording
+                return
+            yield t, offset, n
+            offset += n
+
+    def close(self):
+        self.mm.close()
+        self._file.close()
+
+
+class ReplayPort(MI48Emulator):
+    """A serial-like port replaying a recorded session"""
+
+    def __init__(self, filename, speed=1.0, loop=False, timeout=0.5):
+        """
+        Replay the session in `filename`.
+
+        `speed` is the multiple of the original timing, or None to
+        deliver as fast as the reader consumes. With `loop`, the session
+        restarts from the beginning at its end; else reads time out.
+        """
+        self.session = SessionFile(filename)
+        info = self.session.info
+        shape = FPA_SHAPE[info['camera_info']['CAMERA_TYPE']]
+        super().__init__(resolution=shape, timeout=timeout,
+                         scene=np.zeros((1, shape[0] * shape[1])))
+        for addr, value in info['regs'].items():
+            self.regs[int(addr, 16)] = value
+        self.speed = speed
+        self.loop = loop
+        self.eof = False
+        self._records = self.session.records()
+        self._next = next(self._records, None)
+        self._anchor = None  # (host time, recorded time) of the replay start
+        self._carry = b''
+        self._skip = 0
+        self.bytes_replayed = 0
+
+    def _rewind(self):
+        self._records = self.session.records()
+        self._next = next(self._records, None)
+        self._anchor = None
+
+    def _deliver(self, data):
+        """Append recorded bytes to the output, minus register acks"""
+        data = self._carry + bytes(data)
+        self._carry = b''
+        if self._skip:
+            # rest of an acknowledge begun in the previous record
+            n = min(self._skip, len(data))
+            data = data[n:]
+            self._skip -= n
+        pieces = []
+        i = 0
+        for m in _REGISTER_ACK.finditer(data):
+            if m.start() < i:
+                continue
+            pieces.append(data[i: m.start()])
+            i = m.start() + len(USB_SYNC) + int(m.group(1), 16) + USB_CKS_LEN
+        if i > len(data):
+            self._skip = i - len(data)
+            i = len(data)
+        else:
+            # hold back the start of an acknowledge cut by the record end
+            for k in range(min(_REGISTER_ACK_LEN, len(data) - i), 0, -1):
+                if _is_ack_start(data[-k:]):
+                    self._carry = data[-k:]
+                    data = data[:-k]
+                    break
+        pieces.append(data[i:])
+        data = b''.join(pieces)
+        self._out += data
+        self.bytes_replayed += len(data)
+
+    def _due(self, t, now):
+        """Whether a record of recorded time `t` is due at `now`"""
+        if self.speed is None:
+            return len(self._out) < REPLAY_AHEAD
+        t0, t0_rec = self._anchor
+        return t0 + (t - t0_rec) / self.speed <= now
+
+    def _produce(self, now):
+        """Deliver the records that became due by `now`"""
+        mode_addr = regmap['FRAME_MODE']
+        mode = self.regs[mode_addr]
+        if not mode & (GET_SINGLE_FRAME | CONTINUOUS_STREAM):
+            # idle; re-anchor the timing when capture restarts
+            self._anchor = None
+            return
+        while True:
+            if self._next is None:
+                if not self.loop:
+                    if not self.eof:
+                        self.eof = True
+                        self._out += self._carry
+                        self._carry = b''
+                        logger.info('End of session {}'.
+                                    format(self.session.filename))
+                    return
+                self._rewind()
+                if self._next is None:
+                    return
+            t, offset, n = self._next
+            if self._anchor is None:
+                if self.session.mm.find(b'GFRA', offset, offset + n) < 0:
+                    # register traffic recorded before capture started
+                    self._deliver(self.session.mm[offset: offset + n])
+                    self._next = next(self._records, None)
+                    continue
+                self._anchor = (now, t)
+            if not self._due(t, now):
+                return
+            record = self.session.mm[offset: offset + n]
+            self._deliver(record)
+            self._next = next(self._records, None)
+            if mode & GET_SINGLE_FRAME and self._next is not None:
+                # a single frame ends where the next one starts
+                _t, _offset, _n = self._next
+                if self.session.mm.find(b'GFRA', _offset, _offset + _n) >= 0:
+                    self.regs[mode_addr] = mode & ~GET_SINGLE_FRAME & 0xFF
+                    self._anchor = None
+                    return
+
+    def _next_event(self):
+        if self._next is None or self._anchor is None or self.speed is None:
+            return None
+        t0, t0_rec = self._anchor
+        return t0 + (self._next[0] - t0_rec) / self.speed
+
+    def close(self):
+        super().close()
+        self.session.close()
+
+
+def _is_ack_start(data):
+    """Whether `data` may be the beginning of a register acknowledge"""
+    n = len(USB_SYNC)
+    if not USB_SYNC.startswith(data[:n]):
+        return False
+    field = data[n: n + 4]
+    if not all(c in b'0123456789ABCDEFabcdef' for c in field):
+        return False
+    cmd = data[n + 4: n + 8]
+    return b'RREG'.startswith(cmd) or b'WREG'.startswith(cmd)
+
+
+class ReplayInterface(USB_Interface):
+    """USB_Interface on a ReplayPort, for use in place of a camera's"""
+
+    def __init__(self, filename, speed=1.0, loop=False, bulk_read=True):
+        super().__init__(ReplayPort(filename, speed=speed, loop=loop),
+                         bulk_read=bulk_read)
+
+
+def connect_replay(filename, speed=1.0, loop=False, name=None):
+    """
+    Return an MI48 replaying the session in `filename`, the way
+    connect_senxor connects to a camera; see ReplayPort.
+    """
+    usb = ReplayInterface(filename, speed=speed, loop=loop)
+    if name is None:
+        name = usb.port.session.info['camera_info'].get('NAME', 'replay')
+    return MI48([usb, usb], name=name)
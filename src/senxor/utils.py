@@ -1,6 +1,7 @@
 # Copyright (C) Meridian Innovation Ltd. Hong Kong, 2020. All rights reserved.
 
 import time
+import datetime
 import os
 import logging
 import math
@@ -13,8 +14,13 @@ import cv2 as cv
 import cmapy
 from serial.tools import list_ports
 from serial import Serial, SerialException
-from senxor.mi48 import MI48
+from senxor.mi48 import MI48, get_celsius_lut
 from senxor.interfaces import MI_VID, MI_PIDs, USB_Interface
+from senxor.replay import connect_replay
+from senxor.loaders import load_senxor_csv
+
+
+logger = logging.getLogger(__name__)
 
 list_ironbow_b = [0,6,12,18,27,38,49,59,64,68,73,78,82,86,90,94,98,102,105,109,112,115,119,122,124,127,129,132,134,136,138,140,142,145,147,148,150,151,152,153,154,155,157,158,159,160,161,163,163,164,165,166,166,167,167,167,167,167,166,166,166,165,165,165,165,164,164,164,163,162,161,160,160,160,158,157,156,155,153,152,151,150,148,147,146,145,143,142,141,140,138,136,134,132,130,127,125,123,121,119,118,116,114,112,110,108,106,104,102,100,98,96,94,92,90,88,86,84,82,80,78,75,73,71,69,67,65,63,61,59,57,55,53,51,49,48,46,44,42,40,38,36,34,32,31,29,27,25,24,22,21,20,18,17,16,15,13,12,11,9,8,7,6,4,3,2,1,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,1,2,3,5,6,7,9,10,12,13,14,16,17,20,23,26,28,31,34,37,39,42,45,48,50,53,56,59,62,66,70,74,78,82,86,91,96,101,106,111,115,120,125,130,135,140,146,152,158,164,171,178,185,192,201,210,219,229,237,243,248,251,254]
 list_ironbow_g = [0,0,0,0,0,0,0,0,0,1,2,3,4,3,3,2,1,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,1,1,1,2,2,2,2,3,3,3,4,5,6,7,8,9,10,11,12,14,15,16,17,18,19,20,21,22,23,24,25,26,27,28,30,31,32,33,34,35,36,37,39,40,42,43,45,47,48,50,51,53,54,56,58,59,61,62,64,65,67,69,70,72,73,75,76,78,80,81,83,84,86,88,89,91,93,95,96,98,100,102,103,105,107,109,110,112,114,116,117,119,121,122,124,126,128,129,131,133,134,136,138,139,141,143,145,146,148,150,151,153,155,156,158,160,161,163,165,167,168,170,172,173,175,177,178,180,182,184,185,187,188,190,191,193,194,196,197,199,200,202,203,205,206,208,209,211,212,214,215,216,217,219,220,221,223,224,225,227,228,229,231,232,233,235,235,236,236,237,238,239,240,241,242,243,244,245,246,247,248,249,249,250,251,252,253,254,255,255,255,255,255,254,254,254,254,254]
@@ -57,7 +63,17 @@ colormaps = {
     'ironbow': lut_ironbow[-256:],
 }
 
-def connect_senxor(src=None, name=None):
+def get_senxor_ports():
+    """Return the (name, device) of the virtual comports of all SenXors"""
+    return [(p.description.split()[-1][1:-1], p.device)
+            for p in list_ports.comports()
+            if p.vid == MI_VID and p.pid in MI_PIDs]
+
+def get_senxor_port_names():
+    """Return the names of the virtual comports of all connected SenXors"""
+    return [name for name, _ in get_senxor_ports()]
+
+def connect_senxor(src=None, name=None, profile_cache=None):
     """
     Return an MI48 instance corresponding to the SenXor module connected to `src`
 
@@ -65,9 +81,18 @@ def connect_senxor(src=None, name=None):
     number, e.g. 0, 1, etc.
     if `name` (stirng) is not None, it will be assigned to mi48.name instance, else
     the name of the virtual comport will be assigned to the mi48.name.
+    If `profile_cache` (senxor.profiles.ProfileCache) is not None, a known
+    camera is reconnected from its cached profile.
+
+    `src` may also be the name of a session file recorded with
+    senxor.replay.record_session, which is then replayed at its original
+    timing instead.
 
     Return None, if no connection to SenXor can be established.
     """
+    if isinstance(src, (str, Path)) and os.path.isfile(src):
+        mi48 = connect_replay(src, name=name)
+        return mi48, str(src), []
     cam_index, port_name = None, None
     try:
         src = int(src)
@@ -78,27 +103,28 @@ def connect_senxor(src=None, name=None):
         pass
     mi48 = None
     connected_port = None
-    port_names = []
-    for p in list_ports.comports():
-        if p.vid == MI_VID and p.pid in MI_PIDs:
-            port = p.description.split()[-1][1:-1]
-            port_names.append(port)
-            if port_name is not None and port_name != port: continue
-            if cam_index is not None and cam_index != len(port_names)-1: continue
-            try:
-                ser = Serial(p.device)
-            except SerialException:
-                # port already open
-                if port_name is not None:
-                    logging.warning(f'{port_name} seems already open')
-                if cam_index is not None:
-                    logging.warning(f'Thermal image source {cam_index}'
-                                     ' seems already open')
-                continue
-            usb = USB_Interface(ser)
-            connected_port = port
-            if name is None: name = connected_port
-            mi48 = MI48([usb,usb], name=name, read_raw=False)
+    ports = get_senxor_ports()
+    port_names = [port for port, _ in ports]
+    for i, (port, device) in enumerate(ports):
+        if port_name is not None and port_name != port: continue
+        if cam_index is not None and cam_index != i: continue
+        try:
+            # a finite timeout lets the interface resend lost commands
+            # and give up waiting for frames, as with get_serial
+            ser = Serial(device, timeout=0.5, write_timeout=0.5)
+        except SerialException:
+            # port already open
+            if port_name is not None:
+                logging.warning(f'{port_name} seems already open')
+            if cam_index is not None:
+                logging.warning(f'Thermal image source {cam_index}'
+                                 ' seems already open')
+            continue
+        usb = USB_Interface(ser, bulk_read=True)
+        connected_port = port
+        if name is None: name = connected_port
+        mi48 = MI48([usb,usb], name=name, read_raw=False,
+                    profile_cache=profile_cache)
     return mi48, connected_port, port_names
 
 def data_to_frame(data, array_shape, hflip=False):
@@ -120,6 +146,72 @@ def data_to_frame(data, array_shape, hflip=False):
         frame = data.reshape(array_shape, order='F').T
     return frame.copy()
 
+class FrameGeometry:
+    """
+    Orientation and cropping of frames as a single precomputed gather.
+
+    The reshape of data_to_frame, horizontal and vertical flip, rotation
+    and region of interest are composed once into an index map from the
+    1D sensor data to the output frame; each frame then takes one pass:
+
+        geometry = FrameGeometry(mi48.fpa_shape, rotation=90, roi=roi)
+        frame = geometry.apply(data)
+
+    The crop comes with the gather, so the extremes of the output are
+    those of the ROI; to display an ROI on the scale of the whole frame,
+    as remap of the uncropped frame did, take the window from the 1D data
+    and pass it on, e.g. as `curr_range` to remap or to LutRenderer.
+    """
+
+    def __init__(self, array_shape, hflip=False, vflip=False, rotation=0,
+                 roi=None):
+        """
+        `array_shape` is the (cols, rows) of the FPA, as in FPA_SHAPE.
+        The frame is flipped first, then rotated clockwise by `rotation`
+        degrees (a multiple of 90), then cropped to `roi`, given as
+        (x1, y1, x2, y2) in the rotated frame and clipped to it like
+        a slice.
+        """
+        if rotation % 90:
+            raise ValueError('Rotation must be a multiple of 90 degrees')
+        self.array_shape = tuple(array_shape)
+        self.hflip = hflip
+        self.vflip = vflip
+        self.rotation = rotation % 360
+        self.roi = roi
+        # apply the very same operations to the pixel indices
+        npix = self.array_shape[0] * self.array_shape[1]
+        index = data_to_frame(np.arange(npix, dtype=np.intp),
+                              self.array_shape, hflip=hflip)
+        if vflip:
+            index = np.flip(index, 0)
+        index = np.rot90(index, -(self.rotation // 90))
+        if roi is not None:
+            x1, y1, x2, y2 = roi
+            nr, nc = index.shape
+            index = index[y1:y2, x1:x2]
+            if index.size == 0:
+                raise ValueError('ROI {} outside the {}x{} frame'.
+                                 format(roi, nc, nr))
+        self.index = np.ascontiguousarray(index)
+        self.shape = self.index.shape
+        self._buf = {}
+
+    def apply(self, data, out=None):
+        """
+        Return the frame of the 1D `data`, written to `out` if given.
+
+        Without `out`, the result is a buffer reused by the next call of
+        the same dtype; copy it if it must be kept.
+        """
+        if out is None:
+            out = self._buf.get(data.dtype)
+            if out is None:
+                out = self._buf[data.dtype] = np.empty(self.shape, data.dtype)
+        # the index is valid by construction; mode 'clip' spares the
+        # bounds check and lets take write to `out` directly
+        return np.take(data, self.index, out=out, mode='clip')
+
 def remap(data, new_range=(0, 255), curr_range=None, to_uint8=True):
     """
     Remap data from one range to another; return float16.
@@ -163,7 +255,10 @@ def remap(data, new_range=(0, 255), curr_range=None, to_uint8=True):
         return out.astype('float16')
 
 def get_default_outfile(src_id=None, ext='csv'):
-    """Yield a timestamped filename with specified extension."""
+    """Yield a timestamped filename with specified extension.
+
+    Use ext='sxr' (senxor.recording.RECORDING_EXT) for binary recordings.
+    """
     ts = time.strftime('%Y%m%d-%H%M%S', time.localtime())
     if src_id is not None:
         filename = "{}-{}.{}".format(src_id, ts, ext)
@@ -233,6 +328,91 @@ def cv_render(data, title='', resize=(800, 620), colormap='jet',
         cv.imshow(title, cvresize)
     return cvresize
 
+def get_palette(colormap='rainbow2', nc=None):
+    """Return the colors of `colormap` (see get_colormap) as 256x3 BGR"""
+    cmap = get_colormap(colormap, nc)
+    if isinstance(cmap, int):
+        # an OpenCV colormap; let OpenCV color all 256 levels
+        levels = np.arange(256, dtype=np.uint8).reshape(256, 1)
+        cmap = cv.applyColorMap(levels, cmap)
+    return np.ascontiguousarray(np.asarray(cmap, dtype=np.uint8).reshape(256, 3))
+
+class LutRenderer:
+    """
+    Color raw MI48 frames through a 65536-entry lookup table.
+
+    The table maps each raw pixel value (uint16, 0.1 K) straight to the
+    BGR color of its temperature within the display window [lo, hi] C,
+    so coloring a frame is a single gather, with no float conversion,
+    clipping or remap. Colors are those of remap over the same window
+    followed by cv.applyColorMap.
+
+    The table is rebuilt only when the window moves by more than
+    `tolerance` C, so it may follow a rolling min/max cheaply:
+
+        renderer = LutRenderer('ironbow', tolerance=0.5)
+        img = renderer.render(raw_frame, min_temp, max_temp)
+    """
+
+    def __init__(self, colormap='rainbow2', n_colors=None, tolerance=0.5):
+        self.palette = get_palette(colormap, n_colors)
+        self.tolerance = tolerance
+        self.window = None
+        self.rebuilds = 0
+        # raw value -> palette level, and -> BGR
+        self.level_table = None
+        self.table = None
+
+    def set_window(self, lo, hi):
+        """
+        Set the display window, in C; return True if the table was
+        rebuilt, False if the window is within tolerance of the current.
+        """
+        if self.window is not None:
+            _lo, _hi = self.window
+            if abs(lo - _lo) <= self.tolerance and\
+               abs(hi - _hi) <= self.tolerance:
+                return False
+        self._build(float(lo), float(hi))
+        return True
+
+    def _build(self, lo, hi):
+        if hi <= lo:
+            hi = lo + 0.1
+        # the same arithmetic as clip followed by remap, on all values
+        celsius = get_celsius_lut('float32')
+        relpos = (np.clip(celsius, lo, hi) - lo) / (hi - lo)
+        self.level_table = (relpos * 255).astype(np.uint8)
+        self.table = np.take(self.palette, self.level_table, axis=0)
+        self.window = (lo, hi)
+        self.rebuilds += 1
+
+    def _update(self, lo, hi):
+        if lo is not None and hi is not None:
+            self.set_window(lo, hi)
+        elif self.table is None:
+            raise ValueError('No display window set')
+
+    def render(self, raw, lo=None, hi=None, out=None):
+        """
+        Return the BGR image, shape raw.shape + (3,), of the `raw`
+        frame; if given, `lo` and `hi` first update the window.
+        """
+        self._update(lo, hi)
+        return np.take(self.table, raw, axis=0, out=out, mode='clip')
+
+    def levels(self, raw, lo=None, hi=None, out=None):
+        """
+        Return the uint8 palette levels of the `raw` frame, as remap
+        would, e.g. for filtering with cv_filter before `colorize`.
+        """
+        self._update(lo, hi)
+        return np.take(self.level_table, raw, out=out, mode='clip')
+
+    def colorize(self, levels, out=None):
+        """Return the BGR image of uint8 palette `levels`"""
+        return np.take(self.palette, levels, axis=0, out=out, mode='clip')
+
 def cv_filter(data, parameters=None, use_median=True, use_bilat=True,
                      use_nlm=False):
     """
@@ -274,7 +454,7 @@ def cv_filter(data, parameters=None, use_median=True, use_bilat=True,
         filtered = cv.fastNlMeansDenoising(filtered, None, h=par.get('h'),
                         templateWindowSize=par.get('templateWindowSize'),
                         searchWindowSize=par.get('searchWindowSize'))
-        print('NLMeans cost [ms]: {:8.4f}'.format(time.time() - t0))
+        logger.debug('NLMeans cost [ms]: %8.4f', 1.e3 * (time.time() - t0))
     return filtered
 
 def clip_frame(frame, minval=None, maxval=None, c0=0.0, c1=0.0):
@@ -468,21 +648,37 @@ class TestData:
         In the latter case, the assumption is that header[:, 1] and header[:, 2]
         are Vdd and Tsx. These are parsed to produce the correct units (V, and degC)
         (Vdd, Tsx, frame) is the stored dictionary value.
+        Data can also be loaded straight from a SenXorViewer CSV file,
+        see `load`.
         """
         self.data = {}
+        self.time = {}
 
     def update(self, key, data):
         """Add data as a tupple (Vdd, Tsx, Frames) or a 2D array from np.loadtxt"""
         try:
             Vdd, Tsx, frames = data
         except ValueError:
+            # slices are views; the 2D array is not copied
             frames = data[:, -self.nc * self.nr:]
             Vdd = data[:, 2]   # * 1.e-4
             Tsx = data[:, 3]   # 100 + KELVIN0
         self.data[key] = Vdd, Tsx, frames
 
+    def load(self, key, filename, **kwargs):
+        """
+        Add the data of a SenXorViewer CSV file, see
+        senxor.loaders.load_senxor_csv; much faster than np.loadtxt
+        and, after the first time, nearly instant.
+
+        The data stays on disk, memory-mapped, until used.
+        """
+        res = load_senxor_csv(filename, npixels=self.nc * self.nr, **kwargs)
+        self.time[key] = res['time']
+        self.update(key, (res['vdd'], res['tsx'], res['frames']))
+
     def get(self, key):
-        """Retrieve data for a given key"""
+        """Retrieve data for a given key; memory-mapped if loaded from file"""
         return self.data[key]
 
 
@@ -647,10 +843,9 @@ def stptime2float(x, fmt="%Y-%m-%dT%H:%M:%S.%f%z"):
     This function may be used as a converter, when reading e.g. output 
     from the SenXorViewer file to a numpy array, via np.loadtxt.
     However, this is not recommended.
-    Instead, read the frame data separately:
-        data = np.loadtext(filename, usecols=range(n, n+4960), delimiter=',')
-    and construct a pandas dataframe for the n columns of header related stuff
-    plus select pixels as necessary.
+    Instead, use TestData.load, or senxor.loaders.load_senxor_csv, which
+    parse the file in chunks, with stptime2float_array converting the
+    timestamps of a whole chunk at once.
     """
     dt = datetime.datetime.strptime(x, fmt)
     return np.datetime64(dt).astype(float)
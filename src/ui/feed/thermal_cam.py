@@ -5,78 +5,147 @@ import logging
 import threading
 import numpy as np
 import cv2 as cv
-from flask import Flask, Response
+from flask import Flask, Response, jsonify
 from PyQt5.QtWidgets import QWidget, QVBoxLayout, QLabel, QPushButton, QApplication
 from PyQt5.QtGui import QImage, QPixmap
 from PyQt5.QtCore import QThread, pyqtSignal
-from senxor.mi48 import MI48, format_header, format_framestats
-from senxor.utils import data_to_frame, remap, cv_filter, RollingAverageFilter, connect_senxor
+from senxor.mi48 import MI48, format_header, format_framestats, set_log_level
+from senxor.utils import FrameGeometry, LutRenderer, RollingAverageFilter, connect_senxor
+from senxor.profiles import ProfileCache
+from senxor.acquisition import Acquisition
+from senxor.pipeline import Pipeline
+from senxor.denoise import DenoiseService, fast_filter
+from senxor.regions import RegionStats, DEFAULT_ZONES, load_zones, zones_to_pixels
 
 # Enable logging
 logger = logging.getLogger(__name__)
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO'))
+# keep the per-frame USB I/O free of logging unless asked for
+set_log_level(os.environ.get('SENXOR_USB_LOG_LEVEL', 'WARNING'), 'usb')
 
 class ThermalCamera(QThread):
     frame_ready = pyqtSignal(np.ndarray)
 
-    def __init__(self, roi=(0, 0, 61, 61), com_port=None):
+    def __init__(self, roi=(0, 0, 61, 61), com_port=None, denoise=None, zones=None):
         super().__init__()
         self.roi = roi
         self.com_port = com_port
         self.running = True
         self.latest_frame = None
-        self.lock = threading.Lock()
+        self.latest_jpeg = None
+        self.streaming = False
+        # guards the latest frame; notified on every new one
+        self.lock = threading.Condition()
+        self.stopped = threading.Event()
 
-        self.temps = {"Top": 0, "Bottom": 0, "Left": 0, "Right": 0, "Center": 0}
-
-        self.mi48, self.connected_port, _ = connect_senxor(src=self.com_port) if self.com_port else connect_senxor()
+        # known cameras reconnect from their cached profile
+        profile_cache = ProfileCache()
+        self.mi48, self.connected_port, _ = connect_senxor(src=self.com_port, profile_cache=profile_cache) if self.com_port else connect_senxor(profile_cache=profile_cache)
 
         logger.info(f"Camera initialized on {self.connected_port}")
 
-        self.mi48.set_fps(25)
-        self.mi48.disable_filter(f1=True, f2=True, f3=True)
-        self.mi48.set_filter_1(85)
-        self.mi48.enable_filter(f1=True, f2=False, f3=False, f3_ks_5=False)
-        self.mi48.set_offset_corr(0.0)
-        self.mi48.set_sens_factor(100)
+        # only the registers that differ from these are written
+        self.mi48.apply_settings({
+            'FRAME_RATE': self.mi48.get_fps_divisor(25),
+            'FILTER_1_LSB': 85 & 0xFF,
+            'FILTER_1_MSB': 85 >> 8,
+            'FILTER_CTRL': 0x03,   # temporal filter 1 only, initialised
+            'OFFSET_CORR': 0x00,   # 0.0 K
+            'SENS_FACTOR': 100,    # 1.00
+        })
+        # The acquisition thread keeps reading raw frames into its ring
+        # however slow the processing below. The processing is split in
+        # stages, each on its own thread with a one-frame, latest-wins
+        # queue, so a slow filter or encode only delays its own stage.
+        # Stages work on different frames at once, so each allocates
+        # its outputs rather than reusing buffers.
+        self.acquisition = Acquisition(self.mi48, depth=8)
+        self.frames = self.acquisition.subscribe('latest')
+        self.pipeline = Pipeline(self.frames, [
+            ('decode', self.decode_stage),
+            ('geometry', self.geometry_stage),
+            ('filter', self.filter_stage),
+            ('analytics', self.analytics_stage),
+            ('render', self.render_stage),
+            ('publish', self.publish_stage),
+        ], name='thermal')
+        # the reshape and hflip of data_to_frame, undone by a flip again,
+        # the rotation and the ROI crop, fused into a single gather
+        self.geometry = FrameGeometry(self.mi48.fpa_shape, rotation=90, roi=self.roi)
+        # raw frames map straight to display levels; the table follows the
+        # rolling min/max, rebuilt only when these move by over 0.5 C
+        self.renderer = LutRenderer('inferno', tolerance=0.5)
+        # optional NLM denoising in worker processes (SENXOR_DENOISE=1);
+        # a frame not denoised within 80 ms gets the fast filters instead
+        if denoise is None:
+            denoise = os.environ.get('SENXOR_DENOISE', '0') == '1'
+        self.denoiser = DenoiseService(self.geometry.shape, budget=0.08) if denoise else None
+        # zone temperatures from a zone config (SENXOR_ZONES=<file.json>),
+        # by default thirds of the ROI; see senxor.regions
+        if zones is None:
+            zones_file = os.environ.get('SENXOR_ZONES')
+            zones = load_zones(zones_file) if zones_file else DEFAULT_ZONES
+        self.zones = zones_to_pixels(zones, self.geometry.shape)
+        self.zone_stats = RegionStats(self.zones)
+        self.overlay_zones = zones.get('overlay', list(self.zones))
+        self.temps = {name: 0. for name in self.zones}
+        # {zone name: (mean, sdev)} of one frame, replaced as a whole
+        self.zone_results = {name: (0., 0.) for name in self.zones}
         self.mi48.start(stream=True, with_header=True)
 
         self.dminav = RollingAverageFilter(N=10)
         self.dmaxav = RollingAverageFilter(N=10)
 
     def run(self):
-        while self.running:
-            self.process_frame()
-
-    def process_frame(self):
-        data, header = self.mi48.read()
-        if data is None:
-            logger.error("No data received from the camera.")
-            return
-
-        min_temp = self.dminav(data.min())
-        max_temp = self.dmaxav(data.max())
-
-        frame = data_to_frame(data, (80, 62), hflip=True)
-        frame = np.clip(frame, min_temp, max_temp)
-        frame = cv.flip(frame, 1)
-        frame = cv.rotate(frame, cv.ROTATE_90_CLOCKWISE)
-
-        filt_frame = cv_filter(remap(frame), {'blur_ks': 3, 'd': 5, 'sigmaColor': 27, 'sigmaSpace': 27}, use_median=True, use_bilat=True, use_nlm=False)
-
-        x1, y1, x2, y2 = self.roi
-        roi_frame = filt_frame[y1:y2, x1:x2]
-        roi_frame = cv.applyColorMap(roi_frame, cv.COLORMAP_INFERNO)
+        self.acquisition.start()
+        self.pipeline.start()
+        # the pipeline threads do the work
+        self.stopped.wait()
+
+    def decode_stage(self, item):
+        # the display window follows the whole frame, the view is the ROI:
+        # the ROI is shown on the scale of the whole frame, as it was when
+        # the frame was remapped before the crop
+        data = item.frame.data
+        item.min_temp = self.dminav(self.mi48.to_celsius(data.min()))
+        item.max_temp = self.dmaxav(self.mi48.to_celsius(data.max()))
+
+    def geometry_stage(self, item):
+        item.raw = self.geometry.apply(item.frame.data, out=np.empty(self.geometry.shape, dtype=np.uint16))
+
+    def filter_stage(self, item):
+        levels = self.renderer.levels(item.raw, item.min_temp, item.max_temp)
+        if self.denoiser is None:
+            item.levels = fast_filter(levels)
+        else:
+            # collected by render, so the workers overlap analytics
+            item.ticket = self.denoiser.submit(levels)
+
+    def analytics_stage(self, item):
+        data = self.mi48.to_celsius(item.raw)
+        data = np.clip(data, item.min_temp, item.max_temp, out=data)
+        item.temps = self.calculate_temperatures(data)
+
+    def render_stage(self, item):
+        levels = item.levels if self.denoiser is None else self.denoiser.collect(item.ticket)
+        roi_frame = self.renderer.colorize(levels)
         self.draw_grid(roi_frame)
         roi_frame = cv.resize(roi_frame, (600, 600), interpolation=cv.INTER_LINEAR)
-
-        temps = self.calculate_temperatures(frame, x1, y1, x2, y2)
-        self.overlay_text(roi_frame, temps)
-
+        self.overlay_text(roi_frame, item.temps)
+        item.image = roi_frame
+
+    def publish_stage(self, item):
+        # encode once per frame, for all the clients of the stream
+        jpeg = None
+        if self.streaming:
+            _, buffer = cv.imencode('.jpg', item.image)
+            jpeg = buffer.tobytes()
         with self.lock:
-            self.latest_frame = roi_frame
+            self.latest_frame = item.image
+            self.latest_jpeg = jpeg
+            self.lock.notify_all()
 
-        self.frame_ready.emit(roi_frame)
+        self.frame_ready.emit(item.image)
 
     def draw_grid(self, frame):
         h, w = frame.shape[:2]
@@ -94,36 +163,24 @@ class ThermalCamera(QThread):
             for x in range(0, w, dot_length + dot_gap):
                 cv.line(frame, (x, y), (min(x + dot_length, w), y), (255, 255, 255), 1)
 
-    def calculate_temperatures(self, frame, x1, y1, x2, y2):
-        w, h = x2 - x1, y2 - y1
-        section_w, section_h = w // 3, h // 3
-
-        sections = {
-            "Top": frame[y1:y1+section_h, x1:x2],
-            "Bottom": frame[y2-section_h:y2, x1:x2],
-            "Left": frame[y1:y2, x1:x1+section_w],
-            "Right": frame[y1:y2, x2-section_w:x2],
-            "Center": frame[y1+section_h:y2-section_h, x1+section_w:x2-section_w]
-        }
-
-        self.temps = {name: np.mean(region) for name, region in sections.items()}
+    def calculate_temperatures(self, frame):
+        results = self.zone_stats.as_dict(frame)
+        self.temps = {name: mean for name, (mean, _) in results.items()}
+        # one assignment, so readers never pair means and sdevs of
+        # different frames
+        self.zone_results = results
         return self.temps
 
     def overlay_text(self, frame, temps):
         h, w = frame.shape[:2]
-        section_w, section_h = w // 3, h // 3
-
-        positions = {
-            "Top": (w // 2 - 50, section_h // 2),
-            "Bottom": (w // 2 - 50, h - section_h // 2),
-            "Left": (section_w // 4, h // 2),
-            "Right": (w - section_w // 2 - 50, h // 2),
-            "Center": (w // 2 - 50, h // 2)
-        }
+        # the zones are in ROI pixels, the frame is resized for display
+        rh, rw = self.geometry.shape
 
-        for section, temp in temps.items():
-            x, y = positions[section]
-            cv.putText(frame, f"{temp:.2f}C", (x, y), cv.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 1)
+        for name in self.overlay_zones:
+            x1, y1, x2, y2 = self.zones[name]
+            x = (x1 + x2) * w // (2 * rw) - 50
+            y = (y1 + y2) * h // (2 * rh)
+            cv.putText(frame, f"{temps[name]:.2f}C", (x, y), cv.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 1)
 
     def start_stream(self):
         app = Flask(__name__)
@@ -132,23 +189,42 @@ class ThermalCamera(QThread):
         def video_feed():
             return Response(self.generate_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
 
+        @app.route('/stats')
+        def stats():
+            stats = self.mi48.get_stats()
+            stats['pipeline'] = self.pipeline.get_stats()
+            if self.denoiser is not None:
+                stats['denoise'] = self.denoiser.get_stats()
+            results = self.zone_results
+            stats['zones'] = {name: {'mean': mean, 'sdev': sdev} for name, (mean, sdev) in results.items()}
+            return jsonify(stats)
+
+        self.streaming = True
         threading.Thread(target=lambda: app.run(host="0.0.0.0", port=5000, threaded=True, use_reloader=False), daemon=True).start()
 
     def generate_frames(self):
+        frame_bytes = None
         while self.running:
             with self.lock:
-                if self.latest_frame is None:
-                    continue
-                
-                _, buffer = cv.imencode('.jpg', self.latest_frame)
-                frame_bytes = buffer.tobytes()
+                last = frame_bytes
+                self.lock.wait_for(lambda: self.latest_jpeg is not last or not self.running, timeout=1.0)
+                frame_bytes = self.latest_jpeg
+            if frame_bytes is None or frame_bytes is last:
+                continue
 
             yield (b'--frame\r\n'
                    b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
 
     def stop(self):
         self.running = False
+        self.pipeline.stop()
+        if self.denoiser is not None:
+            self.denoiser.close()
+        self.acquisition.stop()
         self.mi48.stop()
+        self.stopped.set()
+        with self.lock:
+            self.lock.notify_all()
         cv.destroyAllWindows()
 
 class ThermalCam(QWidget):
@@ -169,6 +245,10 @@ class ThermalCam(QWidget):
         self.video_label = QLabel()
         self.layout.addWidget(self.video_label)
 
+        self.stats_label = QLabel()
+        self.layout.addWidget(self.stats_label)
+        self.frame_count = 0
+
         self.back_button = QPushButton("Back")
         self.back_button.clicked.connect(self.go_back)
         self.layout.addWidget(self.back_button)
@@ -179,6 +259,15 @@ class ThermalCam(QWidget):
         image = QImage(frame, frame.shape[1], frame.shape[0], frame.strides[0], QImage.Format_RGB888)
         self.video_label.setPixmap(QPixmap.fromImage(image))
 
+        # acquisition health, refreshed about once a second
+        self.frame_count += 1
+        if self.frame_count % 25 == 0:
+            stats = self.thermal_camera.mi48.get_stats()
+            self.stats_label.setText(
+                f"FPS {stats['fps']:.1f}  dropped {stats['dropped_frames']}  "
+                f"CRC errors {stats['crc_errors']}  resyncs {stats['resyncs']}  "
+                f"jitter {stats.get('jitter_ms', 0):.1f} ms")
+
     def go_back(self):
         self.thermal_camera.stop()
         self.main_window.setCentralWidget(self.main_window.home_screen)
@@ -0,0 +1,24 @@
+import os
+import sys
+import pytest
+
+# the senxor package is used from the source tree
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'src'))
+
+from senxor.emulator import connect_emulator
+
+
+@pytest.fixture
+def mi48():
+    """An MI48 on an emulated 80x62 camera, at its max frame rate"""
+    mi48 = connect_emulator()
+    mi48.regwrite('FRAME_RATE', 1)
+    yield mi48
+    mi48.stop()
+
+
+@pytest.fixture
+def emulator(mi48):
+    """The emulated camera port behind the `mi48` fixture"""
+    return mi48.interfaces[0].port
@@ -0,0 +1,77 @@
+import time
+import numpy as np
+import pytest
+from senxor.acquisition import Acquisition
+
+
+@pytest.fixture
+def acquisition(mi48):
+    mi48.start(stream=True)
+    acq = Acquisition(mi48, depth=8)
+    yield acq
+    acq.stop()
+
+
+def test_latest(acquisition):
+    sub = acquisition.subscribe('latest')
+    acquisition.start()
+    time.sleep(0.3)
+    frame = sub.get(timeout=1)
+    assert frame.seq >= 4
+    assert sub.dropped == frame.seq
+    assert frame.header['crc_ok'] == 1
+    assert sub.get(timeout=1).seq > frame.seq
+
+
+def test_drop_oldest(acquisition):
+    sub = acquisition.subscribe('drop_oldest', maxlen=2)
+    acquisition.start()
+    time.sleep(0.3)
+    count = acquisition.count
+    seqs = [sub.get(timeout=1).seq for _ in range(4)]
+    # at most maxlen frames were kept back
+    assert seqs[0] >= count - 2
+    assert seqs == list(range(seqs[0], seqs[0] + 4))
+    assert sub.dropped == seqs[0]
+
+
+def test_block(acquisition):
+    sub = acquisition.subscribe('block', maxlen=2)
+    acquisition.start()
+    time.sleep(0.3)
+    # the acquisition waits for the subscriber
+    assert acquisition.count == 2
+    seqs = [sub.get(timeout=1).seq for _ in range(6)]
+    assert seqs == list(range(6))
+    assert sub.dropped == 0
+
+
+def test_frames_without_header(mi48):
+    mi48.start(stream=True, with_header=False)
+    acq = Acquisition(mi48, depth=2)
+    acq.ring.headers['frame_counter'] = 99
+    sub = acq.subscribe('block', maxlen=1)
+    acq.start()
+    try:
+        frames = [sub.get(timeout=1) for _ in range(3)]
+    finally:
+        acq.stop()
+    assert [int(f.header['frame_counter']) for f in frames] == [0, 0, 0]
+    assert frames[-1].data.shape == (4960,)
+
+
+def test_unknown_policy(acquisition):
+    with pytest.raises(ValueError):
+        acquisition.subscribe('oldest')
+
+
+def test_crc_worker(acquisition, mi48):
+    mi48.set_crc_policy('worker')
+    acquisition.start()
+    time.sleep(0.5)
+    acquisition.stop()
+    # the checks done after the headers went into the ring reach them
+    time.sleep(0.1)
+    ring = acquisition.ring
+    assert mi48.crc_checked >= 8
+    assert np.all(ring.headers['crc_ok'][ring.seq >= 0] == 1)
@@ -0,0 +1,124 @@
+import time
+import asyncio
+import threading
+from senxor.aio import AsyncMI48
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_register_commands(mi48):
+    async def main():
+        ami48 = AsyncMI48(mi48)
+        await ami48.open()
+        try:
+            # sent one at a time, each answered by its own acknowledge
+            values = await asyncio.gather(
+                *[ami48.regread(reg, cached=False)
+                  for reg in ['SENXOR_TYPE', 'FW_VERSION_1'] * 4])
+            await ami48.regwrite('EMISSIVITY', 0x55)
+            values.append(await ami48.regread('EMISSIVITY', cached=False))
+        finally:
+            await ami48.close()
+        return values
+    assert run(main()) == [1, 0x26] * 4 + [0x55]
+
+
+def test_register_cache(mi48, emulator):
+    async def main():
+        ami48 = AsyncMI48(mi48)
+        await ami48.open()
+        try:
+            await ami48.regwrite('FRAME_RATE', 8)
+            commands = emulator.commands
+            value = await ami48.regread('FRAME_RATE')
+            assert emulator.commands == commands
+        finally:
+            await ami48.close()
+        return value
+    assert run(main()) == 8
+    # the MI48 sees the write made through the asyncio front end
+    commands = emulator.commands
+    assert mi48.get_frame_rate() == 8
+    assert mi48.get_fps() == mi48.maxfps / 8
+    assert emulator.commands == commands
+
+
+def test_late_acknowledge_is_discarded(mi48, emulator):
+    write = emulator.write
+    writes = []
+
+    def late_write(data):
+        writes.append(data)
+        # the camera answers the first command after the timeout, when
+        # it has been sent again; the late acknowledge must not answer
+        # the next command
+        if len(writes) > 1:
+            return write(data)
+        threading.Timer(0.3, write, (data,)).start()
+        return len(data)
+    emulator.write = late_write
+
+    async def main():
+        ami48 = AsyncMI48(mi48, timeout=0.2)
+        await ami48.open()
+        try:
+            values = []
+            for reg in ['SENXOR_TYPE', 'FW_VERSION_1', 'SENXOR_TYPE',
+                        'FW_VERSION_1']:
+                values.append(await ami48.regread(reg, cached=False))
+        finally:
+            await ami48.close()
+        return values
+    assert run(main()) == [1, 0x26, 1, 0x26]
+    assert len(writes) == 5
+
+
+def test_lost_acknowledge(mi48, emulator):
+    write = emulator.write
+    writes = []
+
+    def lossy_write(data):
+        writes.append(data)
+        # the first command is lost; its resend is answered
+        return len(data) if len(writes) == 1 else write(data)
+    emulator.write = lossy_write
+
+    async def main():
+        ami48 = AsyncMI48(mi48, timeout=0.2)
+        await ami48.open()
+        try:
+            values = [await ami48.regread('SENXOR_TYPE', cached=False)]
+            t0 = time.monotonic()
+            for reg in ['FW_VERSION_1', 'FW_VERSION_2'] * 3:
+                values.append(await ami48.regread(reg, cached=False))
+            elapsed = time.monotonic() - t0
+        finally:
+            await ami48.close()
+        return values, elapsed
+    values, elapsed = run(main())
+    assert values == [1] + [0x26, 5] * 3
+    # the lost acknowledge is given up on, not awaited by the next reads
+    assert len(writes) == 8
+    assert elapsed < 6 * 0.2
+
+
+def test_frames(mi48):
+    async def main():
+        ami48 = AsyncMI48(mi48)
+        await ami48.open()
+        try:
+            await ami48.start(stream=True)
+            counters = []
+            async for data, header in ami48.frames():
+                assert data.shape == (4960,)
+                counters.append(int(header['frame_counter']))
+                if len(counters) == 3:
+                    break
+            await ami48.stop_capture()
+        finally:
+            await ami48.close()
+        return counters
+    counters = run(main())
+    assert counters == list(range(counters[0], counters[0] + 3))
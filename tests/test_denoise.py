@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+# the workers filter with senxor.utils.cv_filter
+pytest.importorskip('cmapy')
+pytest.importorskip('cv2')
+
+from senxor.utils import cv_filter
+from senxor.denoise import DenoiseService, DENOISE_PARAMETERS
+
+SHAPE = (31, 31)
+
+
+def make_frames(n):
+    return np.random.default_rng(0).integers(256, size=(n,) + SHAPE,
+                                             dtype=np.uint8)
+
+
+def test_results_in_order():
+    # a budget generous enough for the workers to start
+    denoiser = DenoiseService(SHAPE, budget=30., nslots=6)
+    try:
+        frames = make_frames(6)
+        tickets = [denoiser.submit(frame) for frame in frames]
+        results = [denoiser.collect(ticket) for ticket in tickets]
+        stats = denoiser.get_stats()
+    finally:
+        denoiser.close()
+    for frame, result in zip(frames, results):
+        expected = cv_filter(frame, DENOISE_PARAMETERS, use_median=True,
+                             use_bilat=True, use_nlm=True)
+        assert np.array_equal(result, expected)
+    assert stats['denoised'] == 6
+    assert stats['worker_ms'] is not None
+
+
+def test_fallback_without_slot():
+    fallbacks = []
+
+    def fallback(data):
+        fallbacks.append(data)
+        return data
+    denoiser = DenoiseService(SHAPE, fallback=fallback, budget=30.,
+                              nworkers=1, nslots=1)
+    try:
+        first, second = make_frames(2)
+        ticket = denoiser.submit(first)
+        # no slot left: filtered by the fallback
+        rejected = denoiser.submit(second)
+        assert rejected.slot is None
+        assert denoiser.collect(rejected) is second
+        assert fallbacks == [second]
+        denoiser.collect(ticket)
+        # the slot is free again once the result is in
+        assert denoiser.submit(first).slot is not None
+        assert denoiser.get_stats()['rejected'] == 1
+    finally:
+        denoiser.close()
+
+
+def test_close_frees_slots():
+    denoiser = DenoiseService(SHAPE, budget=30., nworkers=1, nslots=4)
+    for frame in make_frames(4):
+        denoiser.submit(frame)
+    denoiser.close()
+    # the slots of the frames cancelled by close are freed too
+    assert len(denoiser.free) == 4
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from senxor.emulator import connect_emulator, make_scene, FAULTS
+from senxor.mi48 import regmap
+
+
+@pytest.mark.parametrize('resolution', [(80, 62), (32, 32), (160, 120)])
+def test_read_frames(resolution):
+    mi48 = connect_emulator(resolution)
+    try:
+        assert mi48.fpa_shape == resolution
+        mi48.set_output('raw')
+        mi48.regwrite('FRAME_RATE', 1)
+        mi48.start(stream=True)
+        scene = make_scene(resolution)
+        counters = []
+        for _ in range(3):
+            data, header = mi48.read()
+            counters.append(int(header['frame_counter']))
+            # frames cycle through the scene
+            assert np.array_equal(data, scene[counters[-1] % len(scene)])
+            assert header['crc_ok'] == 1
+        assert np.all(np.diff(counters) == 1)
+    finally:
+        mi48.stop()
+
+
+def test_registers(mi48):
+    assert mi48.regread('SENXOR_TYPE') == 1
+    mi48.regwrite('EMISSIVITY', 0x50)
+    assert mi48.regread('EMISSIVITY') == 0x50
+    assert mi48.get_fw_version() == '2.6.5'
+
+
+def test_unknown_resolution(emulator):
+    with pytest.raises(ValueError):
+        connect_emulator((64, 48))
+    with pytest.raises(ValueError):
+        emulator.inject_fault('melt')
+
+
+def test_injected_faults(mi48, emulator):
+    mi48.start(stream=True)
+    mi48.read()
+    frame_faults = [fault for fault in FAULTS if fault != 'late_ack']
+    for fault in frame_faults:
+        emulator.inject_fault(fault)
+    for _ in range(6):
+        data, header = mi48.read()
+        assert data is not None
+    assert emulator.get_stats()['faults'] == dict.fromkeys(frame_faults, 1)
+    stats = mi48.get_stats()
+    # the dropped and the corrupt frame are counter gaps; the corrupt
+    # frame and the noise cost resyncs, but no good frame is lost
+    assert stats['dropped_frames'] == 2
+    assert stats['link']['cksum_errors'] == 1
+    assert stats['resyncs'] >= 2
+    assert stats['crc_errors'] == 0
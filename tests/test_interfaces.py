@@ -0,0 +1,142 @@
+import time
+import threading
+import numpy as np
+from senxor.mi48 import regmap
+from senxor.interfaces import USB_StreamParser, USB_SYNC, cksum,\
+                              usb_parse_ack
+
+
+def make_ack(cmd, data=b''):
+    """Return the acknowledge packet of `cmd` with `data`, as the MI48"""
+    body = '{:04X}'.format(4 + len(cmd) + len(data)).encode() + cmd + data
+    return USB_SYNC + body + '{:04X}'.format(cksum(body) & 0xFFFF).encode()
+
+
+def drain(parser):
+    packets = []
+    while True:
+        packet = parser.next_packet()
+        if packet is None:
+            return packets
+        cmd, data = usb_parse_ack(*packet)
+        packets.append((cmd, data.copy() if cmd == 'GFRA' else data))
+
+
+def frame_ack(value, npixels=100):
+    return make_ack(b'GFRA', np.full(npixels, value, dtype='<u2').tobytes())
+
+
+def test_packets_split_anywhere():
+    stream = make_ack(b'RREG', b'2A') + frame_ack(7) + make_ack(b'WREG')
+    parser = USB_StreamParser()
+    packets = []
+    for i in range(len(stream)):
+        parser.feed(stream[i: i + 1])
+        packets += drain(parser)
+    assert [cmd for cmd, _ in packets] == ['RREG', 'GFRA', 'WREG']
+    assert packets[0][1] == 0x2A
+    assert (packets[1][1] == 7).all()
+    assert parser.get_stats() == {'packets': 3, 'resyncs': 0,
+                                  'dropped_bytes': 0, 'cksum_errors': 0,
+                                  'length_errors': 0}
+
+
+def test_resync_on_garbage():
+    parser = USB_StreamParser()
+    parser.feed(b'\x00\xff  #' + frame_ack(1) + b'garbage' + frame_ack(2))
+    packets = drain(parser)
+    assert [int(data[0]) for _, data in packets] == [1, 2]
+    assert parser.resyncs == 2
+    assert parser.dropped_bytes == len(b'\x00\xff  #garbage')
+
+
+def test_bad_check_sum_keeps_next_packet():
+    bad = bytearray(frame_ack(1))
+    bad[20] ^= 0xFF
+    parser = USB_StreamParser()
+    parser.feed(bytes(bad) + frame_ack(2))
+    packets = drain(parser)
+    assert [int(data[0]) for _, data in packets] == [2]
+    assert parser.cksum_errors == 1
+
+
+def test_bad_length():
+    parser = USB_StreamParser()
+    parser.feed(USB_SYNC + b'ZZZZ' + make_ack(b'RREG', b'05'))
+    assert drain(parser) == [('RREG', 5)]
+    assert parser.length_errors == 1
+
+
+def test_buffer_grows_for_large_packets():
+    parser = USB_StreamParser(size=64)
+    parser.feed(frame_ack(3, npixels=19200))
+    (cmd, data), = drain(parser)
+    assert cmd == 'GFRA' and len(data) == 19200
+
+
+def test_unknown_acknowledge():
+    assert usb_parse_ack(b'XXXX', b'') is None
+
+
+REGS = ['SENXOR_TYPE', 'FW_VERSION_1', 'FW_VERSION_2', 'EMISSIVITY',
+        'SENS_FACTOR', 'FILTER_1_LSB', 'FILTER_2', 'SENXOR_ID_0']
+
+
+def test_regread_many(mi48):
+    expected = [mi48.regread(reg, cached=False) for reg in REGS]
+    assert mi48.regread_many(REGS, cached=False) == expected
+    # batches of 16, with registers by address too
+    addrs = [regmap[reg] for reg in REGS] * 5
+    assert mi48.interfaces[0].regread_many(addrs) == expected * 5
+
+
+def test_regread_many_while_streaming(mi48):
+    expected = mi48.regread_many(REGS, cached=False)
+    mi48.start(stream=True)
+    for _ in range(3):
+        assert mi48.regread_many(REGS, cached=False) == expected
+        mi48.read()
+
+
+def test_regread_many_cache(mi48, emulator):
+    values = mi48.regread_many(REGS)
+    commands = emulator.commands
+    assert mi48.regread_many(REGS) == values
+    assert emulator.commands == commands
+    # volatile registers are always read
+    mi48.regread_many(REGS + ['STATUS'])
+    assert emulator.commands == commands + 1
+    mi48.regwrite('EMISSIVITY', 0x42)
+    assert mi48.regread('EMISSIVITY') == 0x42
+
+
+def test_regread_many_late_batch(mi48, emulator):
+    usb = mi48.interfaces[0]
+    regs = [regmap['SENXOR_TYPE'], regmap['FW_VERSION_1']] * 3
+    write = emulator.write
+    writes = []
+
+    def late_write(data):
+        writes.append(data)
+        if len(writes) == 1:
+            # the batch is answered only after the port timeout
+            threading.Timer(1.5 * emulator.timeout, write, (data,)).start()
+            return len(data)
+        return write(data)
+    emulator.write = late_write
+    assert usb.regread_many(regs) == [1, 0x26] * 3
+    time.sleep(emulator.timeout)
+    # the late acknowledges of the batch answer none of the next reads
+    assert usb.regread_many([regmap['FW_VERSION_1']] * 4) == [0x26] * 4
+
+
+def test_late_acknowledge_after_resend(mi48, emulator):
+    usb = mi48.interfaces[0]
+    commands = emulator.commands
+    emulator.inject_fault('late_ack')
+    # answered after the port timeout, so the command is sent again
+    assert usb.regread(regmap['FW_VERSION_1']) == 0x26
+    assert emulator.commands == commands + 2
+    # the late acknowledge answers none of the next reads
+    assert usb.regread(regmap['FW_VERSION_2']) == 5
+    assert usb.regread(regmap['SENXOR_TYPE']) == 1
@@ -0,0 +1,86 @@
+import os
+import datetime
+import numpy as np
+import pytest
+from senxor import loaders
+from senxor.emulator import connect_emulator
+from senxor.loaders import load_senxor_csv, stptime2float_array
+
+# across the end of daylight saving, in a -0400/-0500 zone
+TIMES = ['2021-11-07T01:59:59.750000-0400',
+         '2021-11-07T01:00:00.000000-0500',
+         '2021-11-07T01:00:00.250000-0500',
+         '2021-11-07T01:00:00.500000-0500',
+         '2021-11-07T01:00:00.750000-0500']
+
+
+def utc_us(s, fmt=loaders.CSV_TIME_FORMAT):
+    dt = datetime.datetime.strptime(s, fmt)
+    return dt.timestamp() * 1.e6
+
+
+@pytest.fixture
+def capture(tmp_path):
+    """A SenXorViewer CSV of 5 frames of an emulated 32x32 camera"""
+    mi48 = connect_emulator((32, 32))
+    mi48.regwrite('FRAME_RATE', 1)
+    mi48.start(stream=True)
+    frames = []
+    try:
+        for _ in TIMES:
+            data, header = mi48.read()
+            frames.append(np.asarray(data, dtype=np.float32))
+    finally:
+        mi48.stop()
+    filename = str(tmp_path / 'capture.csv')
+    with open(filename, 'w') as f:
+        f.write('Time,Frame,Vdd,Tsx,' +
+                ','.join('P{}'.format(i) for i in range(1024)) + '\n')
+        for i, (t, data) in enumerate(zip(TIMES, frames)):
+            f.write('{},{},{:.4f},{:.2f},'.format(t, i, 3.3, 30.5 + i) +
+                    ','.join('{:.2f}'.format(v) for v in data) + '\n')
+    return filename, np.array(frames)
+
+
+def test_stptime2float_array():
+    expected = np.array([utc_us(s) for s in TIMES])
+    # the offset changes within the sequence
+    assert np.array_equal(stptime2float_array(TIMES), expected)
+    assert np.array_equal(np.diff(expected), [250000.] * 4)
+    # strings of several lengths are parsed one at a time
+    mixed = TIMES[:2] + ['2021-11-07T06:00:00.5Z']
+    assert np.array_equal(stptime2float_array(mixed),
+                          [utc_us(s) for s in mixed])
+
+
+def test_stptime2float_array_naive_is_utc():
+    fmt = '%Y-%m-%d %H:%M:%S'
+    t = stptime2float_array(['1970-01-02 00:00:00'], fmt)
+    assert t[0] == 86400 * 1.e6
+
+
+def test_load(capture):
+    filename, frames = capture
+    data = load_senxor_csv(filename, npixels=1024, chunk_rows=2)
+    assert data['frames'].shape == (5, 1024)
+    assert np.allclose(data['frames'], frames, atol=0.005)
+    assert np.array_equal(data['time'], [utc_us(s) for s in TIMES])
+    assert np.allclose(data['vdd'], 3.3)
+    assert np.allclose(data['tsx'], 30.5 + np.arange(5))
+
+
+def test_cache(capture, monkeypatch):
+    filename, frames = capture
+    load_senxor_csv(filename, npixels=1024)
+
+    def convert(*args, **kwargs):
+        raise AssertionError('converted again')
+    with monkeypatch.context() as m:
+        m.setattr(loaders, 'convert_senxor_csv', convert)
+        assert len(load_senxor_csv(filename, npixels=1024)['frames']) == 5
+    # a changed CSV is converted again
+    with open(filename, 'a') as f:
+        f.write('{},{},3.3,30.0,'.format(TIMES[-1], 5) +
+                ','.join(['25.00'] * 1024) + '\n')
+    os.utime(filename, (0, 0))
+    assert len(load_senxor_csv(filename, npixels=1024)['frames']) == 6
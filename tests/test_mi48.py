@@ -0,0 +1,174 @@
+import time
+import queue
+import numpy as np
+import pytest
+from senxor.mi48 import crc16, decode_frame_headers, KELVIN_0,\
+                        SPIHDR_FRCNT, SPIHDR_TIME, SPIHDR_CRC
+from senxor.emulator import make_scene
+
+
+def test_compensation_params(mi48):
+    params = [1.5, -2.25, 0.125, 1.e-3]
+    mi48.enable_user_flash()
+    try:
+        mi48.store_compensation_params(params)
+        assert mi48.get_compensation_params(npar=4) == \
+            [float(np.float32(p)) for p in params]
+        # STATUS maps to user flash in flash mode
+        with pytest.raises(RuntimeError):
+            mi48.wait_flash_ready()
+    finally:
+        mi48.disable_user_flash()
+    assert mi48.wait_flash_ready()
+    assert len(mi48.flash_timing['read']) == 4
+
+
+def crc16_bitwise(data):
+    crc = 0xFFFF
+    for byte in bytes(data):
+        crc ^= byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021 if crc & 0x8000 else crc << 1) & 0xFFFF
+    return crc
+
+
+def test_crc16_check_value():
+    assert crc16(b'123456789') == 0x29B1
+
+
+@pytest.mark.parametrize('nbytes', [1, 2, 63, 9920, 38400])
+def test_crc16_tables(nbytes):
+    data = np.random.default_rng(nbytes).integers(256, size=nbytes,
+                                                  dtype=np.uint8)
+    assert crc16(data) == crc16_bitwise(data)
+
+
+def test_crc_policies(mi48):
+    mi48.set_output('raw')
+    mi48.start(stream=True)
+    mi48.set_crc_policy(3)
+    checked = mi48.crc_checked
+    flags = [int(mi48.read()[1]['crc_ok']) for _ in range(6)]
+    assert mi48.crc_checked - checked == 2
+    assert sorted(flags) == [-1] * 4 + [1] * 2
+    mi48.set_crc_policy('off')
+    assert mi48.read()[1]['crc_ok'] == -1
+    with pytest.raises(ValueError):
+        mi48.set_crc_policy('some')
+
+
+def test_crc_worker(mi48):
+    mi48.set_output('raw')
+    mi48.start(stream=True)
+    mi48.set_crc_policy('worker')
+    done = queue.Queue()
+    headers = [mi48.read(crc_done=done.put)[1] for _ in range(3)]
+    assert [done.get(timeout=1) for _ in headers] == [True] * 3
+    assert [int(header['crc_ok']) for header in headers] == [1] * 3
+    assert mi48.crc_checked == 3
+
+
+def test_crc_error(mi48):
+    mi48.set_output('raw')
+    mi48.start(stream=True)
+    data, header = mi48.read()
+    header['crc'] ^= 0x0001
+    assert not mi48.check_crc(data, header)
+    assert header['crc_ok'] == 0
+    assert mi48.get_stats()['crc_errors'] == 1
+
+
+@pytest.mark.parametrize('bulk_read', [True, False])
+def test_raw_frames_persist(mi48, bulk_read):
+    mi48.interfaces[0].bulk_read = bulk_read
+    mi48.set_output('raw')
+    mi48.start(stream=True)
+    first, header = mi48.read()
+    expected = make_scene(mi48.fpa_shape)
+    i = int(header['frame_counter']) % len(expected)
+    # enough reads for the parser to reuse its whole buffer
+    for _ in range(12):
+        data, _ = mi48.read()
+    # the next reads do not overwrite the frame returned first
+    assert np.array_equal(first, expected[i])
+    out = np.empty_like(first)
+    data, _ = mi48.read(out=out)
+    assert data is out
+
+
+@pytest.mark.parametrize('dtype', ['float32', 'float16'])
+def test_celsius_lut(mi48, dtype):
+    data = np.arange(0x10000, dtype=np.uint16)
+    expected = (data / 10 + KELVIN_0).astype(dtype)
+    assert np.array_equal(mi48.to_celsius(data, dtype=dtype), expected)
+    # frames are converted through the same table
+    mi48.set_output(dtype)
+    mi48.start(stream=True)
+    frame, header = mi48.read()
+    scene = make_scene(mi48.fpa_shape)
+    raw = scene[int(header['frame_counter']) % len(scene)]
+    assert frame.dtype == dtype
+    assert np.array_equal(frame, (raw / 10 + KELVIN_0).astype(dtype))
+
+
+def test_decode_frame_headers():
+    timestamps = [0, 0xFFFF, 0x10000, 0x12345678, 0xFFFFFFFF]
+    headers = np.zeros((len(timestamps), 80), dtype=np.uint16)
+    headers[:, SPIHDR_FRCNT] = np.arange(len(timestamps))
+    headers[:, SPIHDR_TIME] = [ts & 0xFFFF for ts in timestamps]
+    headers[:, SPIHDR_TIME + 1] = [ts >> 16 for ts in timestamps]
+    headers[:, SPIHDR_CRC] = 0xABCD
+    decoded = decode_frame_headers(headers)
+    assert decoded['timestamp'].tolist() == timestamps
+    assert decoded['frame_counter'].tolist() == list(range(len(timestamps)))
+    assert np.all(decoded['crc'] == 0xABCD)
+    assert np.all(decoded['crc_ok'] == -1)
+    # a single header decodes the same as a batch of one
+    assert decode_frame_headers(headers[3])[0] == decoded[3]
+
+
+def test_measure_max_fps(mi48, monkeypatch):
+    monkeypatch.setattr('senxor.mi48.MEASURED_MAX_FPS', {})
+    mi48.regwrite('FRAME_RATE', 4)
+    res = mi48.measure_max_fps(nframes=20, nskip=2)
+    assert res['frames'] == 20
+    assert res['frames_missed'] == 0
+    assert res['fps'] == pytest.approx(25.5, rel=0.1)
+    assert mi48.maxfps == res['fps']
+    assert mi48.get_frame_rate() == 4
+    # the burst does not count as acquisition
+    assert mi48.get_stats()['frames'] == 0
+
+
+def test_fps_divisor(mi48):
+    mi48.maxfps = 25.5
+    assert mi48.get_fps_divisor(100) == 1
+    assert mi48.get_fps_divisor(25.5) == 1
+    assert mi48.get_fps_divisor(9) == 3
+    assert mi48.get_fps_divisor(1) == 26
+    assert mi48.get_fps_divisor(0) == 32
+    mi48.set_fps(5)
+    assert mi48.regread('FRAME_RATE', cached=False) == 5
+
+
+def test_capture_once(mi48, emulator):
+    mi48.set_output('raw')
+    mi48.start(stream=True)
+    # frames queue up unread; they predate the trigger
+    time.sleep(0.2)
+    data, header = mi48.capture_once()
+    stats = emulator.get_stats()
+    assert stats['frames_sent'] >= 4
+    # the frame is the one after the trigger, and the last one
+    assert header['frame_counter'] == stats['frame_counter'] - 1
+    assert header['crc_ok'] == 1
+    assert mi48.get_capture_latency()['captures'] == 1
+
+
+def test_capture_once_timeout(mi48, emulator):
+    emulator.set_fault_rate('drop', 1.)
+    t0 = time.monotonic()
+    assert mi48.capture_once(timeout=0.2) == (None, None)
+    # not held up by the port timeout
+    assert time.monotonic() - t0 < emulator.timeout
+    assert mi48.get_capture_latency()['timeouts'] == 1
@@ -0,0 +1,54 @@
+import pytest
+from senxor.emulator import connect_emulator
+
+# senxor.multicam connects through senxor.utils
+pytest.importorskip('cmapy')
+from senxor.multicam import SenxorArray
+
+
+@pytest.fixture
+def cameras(monkeypatch):
+    emulated = {}
+
+    def connect(src, profile_cache=None):
+        if src == 'bad':
+            return None, None, []
+        mi48 = connect_emulator(name=src, seed=len(emulated))
+        mi48.regwrite('FRAME_RATE', 1)
+        emulated[src] = mi48
+        return mi48, src, []
+    monkeypatch.setattr('senxor.multicam.connect_senxor', connect)
+    cameras = SenxorArray(['cam0', 'bad', 'cam1'], depth=8)
+    yield cameras
+    cameras.stop()
+
+
+def test_framesets(cameras):
+    assert cameras.open() == ['cam0', 'cam1']
+    cameras.start()
+    tolerance = cameras.get_tolerance()
+    for _ in range(3):
+        frameset = cameras.get_frameset(timeout=1.0)
+        assert list(frameset.frames) == ['cam0', 'cam1']
+        assert frameset.spread <= tolerance
+    stats = cameras.get_stats()
+    assert stats['ncameras'] == 2
+    assert stats['framesets'] == 3
+
+
+def test_failing_camera(cameras):
+    cameras.open()
+    cameras.start()
+    assert cameras.get_frameset(timeout=1.0) is not None
+    # cam1 stops delivering frames, and then fails altogether
+    port = cameras['cam1'].interfaces[0].port
+    port.set_fault_rate('drop', 1.0)
+    count = cameras.acquisitions['cam0'].count
+    assert cameras.get_frameset(timeout=0.5) is None
+    # the other camera is not held up
+    assert cameras.acquisitions['cam0'].count >= count + 10
+
+    def write(data):
+        raise OSError('device disconnected')
+    port.write = write
+    cameras.stop()
@@ -0,0 +1,100 @@
+import time
+import queue
+import numpy as np
+import pytest
+from senxor.acquisition import Frame
+from senxor.pipeline import Pipeline
+
+
+class FrameSource:
+    """Stands in for a Subscription; frames are added with `put`"""
+
+    def __init__(self):
+        self.frames = queue.Queue()
+        self.seq = 0
+
+    def put(self, n=1):
+        for _ in range(n):
+            self.frames.put(Frame(np.zeros(4, 'u2'), None, self.seq,
+                                  time.time()))
+            self.seq += 1
+
+    def get(self, timeout=None, copy=False):
+        try:
+            return self.frames.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+@pytest.fixture
+def source():
+    return FrameSource()
+
+
+def test_stages(source):
+    def double(item):
+        item.data = 2 * item.frame.data + 1
+
+    def odd(item):
+        return bool(item.seq % 2)
+    pipeline = Pipeline(source, [('double', double), ('odd', odd)])
+    pipeline.start()
+    try:
+        for _ in range(4):
+            source.put()
+            time.sleep(0.05)
+    finally:
+        pipeline.stop()
+    item = pipeline.last_item
+    assert item.seq == 3
+    assert np.array_equal(item.data, np.ones(4))
+    # a timestamp per stage boundary, in order
+    names, times = zip(*item.times)
+    assert names == ('acquired', 'double', 'odd')
+    assert list(times) == sorted(times)
+    stats = pipeline.get_stats()
+    assert stats['fed'] == 4
+    assert stats['completed'] == 2
+    assert stats['stages']['odd']['skipped'] == 2
+    assert stats['stages']['double']['dropped'] == 0
+
+
+def test_latest_wins(source):
+    seqs = []
+
+    def slow(item):
+        time.sleep(0.05)
+
+    def sink(item):
+        seqs.append(item.seq)
+    pipeline = Pipeline(source, [('slow', slow), ('sink', sink)])
+    pipeline.start()
+    try:
+        source.put(20)
+        time.sleep(0.3)
+    finally:
+        pipeline.stop()
+    stats = pipeline.get_stats()
+    # the slow stage drops the frames queued behind the one it works on,
+    # but never the latest
+    assert stats['fed'] == 20
+    assert stats['stages']['slow']['dropped'] > 0
+    assert stats['completed'] == len(seqs) < 20
+    assert seqs == sorted(seqs)
+    assert seqs[-1] == 19
+
+
+def test_stop(source):
+    def stage(item):
+        time.sleep(0.01)
+    pipeline = Pipeline(source, [('a', stage), ('b', stage)], maxlen=4)
+    pipeline.start()
+    threads = [pipeline.thread] + [s.thread for s in pipeline.stages.values()]
+    source.put(3)
+    time.sleep(0.1)
+    pipeline.stop()
+    assert not any(thread.is_alive() for thread in threads)
+    assert pipeline.thread is None
+    assert pipeline['b'].processed == 3
+    with pytest.raises(ValueError):
+        Pipeline(source, [('a', stage), ('a', stage)])
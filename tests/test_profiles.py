@@ -0,0 +1,37 @@
+from senxor.emulator import connect_emulator
+from senxor.profiles import ProfileCache
+from senxor.mi48 import get_reg_name
+
+
+def test_reconnect_with_cached_profile(tmp_path):
+    cache = ProfileCache(tmp_path / 'profiles.json')
+    mi48 = connect_emulator(profile_cache=cache)
+    try:
+        first_commands = mi48.interfaces[0].port.commands
+        settings = {'EMISSIVITY': 0x50, 'FRAME_RATE': 2, 'SENS_FACTOR': 100}
+        assert mi48.apply_settings(settings) == ['EMISSIVITY', 'FRAME_RATE']
+    finally:
+        mi48.stop()
+
+    # the same camera, reset to its defaults
+    mi48 = connect_emulator(profile_cache=cache)
+    try:
+        emulator = mi48.interfaces[0].port
+        # only the identity is read, not the whole camera information
+        assert emulator.commands < first_commands
+        profile = ProfileCache(tmp_path / 'profiles.json').get(mi48.sn)
+        assert 'Current FPS' not in profile['camera_info']
+        write = emulator.write
+        written = []
+
+        def logged_write(data):
+            if data[8:12] == b'WREG':
+                written.append(get_reg_name(int(data[12:14], 16)))
+            return write(data)
+        emulator.write = logged_write
+        assert mi48.apply_settings(profile['settings']) ==\
+            ['EMISSIVITY', 'FRAME_RATE']
+        assert written == ['EMISSIVITY', 'FRAME_RATE']
+        assert mi48.regread('EMISSIVITY', cached=False) == 0x50
+    finally:
+        mi48.stop()
@@ -0,0 +1,115 @@
+import os
+import time
+import numpy as np
+import pytest
+from senxor.acquisition import Acquisition
+from senxor.recording import FrameRecorder, RecordingReader, delta_encode,\
+                             delta_decode, get_index_filename
+
+
+@pytest.fixture
+def frames(mi48):
+    """10 raw frames and headers of the emulator"""
+    mi48.set_output('raw')
+    mi48.start(stream=True)
+    result = []
+    for _ in range(10):
+        data, header = mi48.read()
+        result.append((data.copy(), header.copy()))
+    return result
+
+
+def record(filename, frames, **kwargs):
+    recorder = FrameRecorder(filename, (80, 62), chunk_frames=4, **kwargs)
+    for i, (data, header) in enumerate(frames):
+        assert recorder.write(data, header, host_time=1000. + i)
+    recorder.close()
+    return recorder
+
+
+def check_recording(filename, frames):
+    rec = RecordingReader(filename)
+    try:
+        assert len(rec) == len(frames)
+        for i, (data, header) in enumerate(frames):
+            _data, _header = rec[i]
+            assert np.array_equal(_data, data)
+            assert _header == header
+        # across the chunks of 4 frames
+        assert np.array_equal(rec.get_frames(2, 9),
+                              [data for data, _ in frames[2: 9]])
+        counter = frames[5][1]['frame_counter']
+        assert list(rec.find_frame_counter(counter)) == [5]
+        assert rec.find_host_time(1003.5) == 4
+    finally:
+        rec.close()
+
+
+def test_round_trip(frames, tmp_path):
+    filename = str(tmp_path / 'frames.sxr')
+    recorder = record(filename, frames)
+    assert recorder.get_stats()['written'] == 10
+    check_recording(filename, frames)
+
+
+def test_rebuild_index(frames, tmp_path):
+    filename = str(tmp_path / 'frames.sxr')
+    record(filename, frames)
+    index = np.fromfile(get_index_filename(filename),
+                        dtype=RecordingReader(filename).index.dtype)
+    os.remove(get_index_filename(filename))
+    rec = RecordingReader(filename)
+    assert np.array_equal(rec.index, index)
+    assert os.path.exists(get_index_filename(filename))
+
+
+def test_truncated_recording(frames, tmp_path):
+    filename = str(tmp_path / 'frames.sxr')
+    record(filename, frames)
+    os.remove(get_index_filename(filename))
+    # the last chunk, of 2 frames, is cut short
+    with open(filename, 'r+b') as f:
+        f.truncate(os.path.getsize(filename) - 100)
+    assert len(RecordingReader(filename)) == 8
+
+
+def test_attach(mi48, tmp_path):
+    filename = str(tmp_path / 'frames.sxr')
+    mi48.start(stream=True)
+    acquisition = Acquisition(mi48, depth=8)
+    recorder = FrameRecorder(filename, mi48.fpa_shape, chunk_frames=4)
+    recorder.attach(acquisition)
+    acquisition.start()
+    time.sleep(0.3)
+    acquisition.stop()
+    recorder.close()
+    rec = RecordingReader(filename)
+    assert len(rec) == recorder.get_stats()['written'] > 0
+    counters = rec.index['frame_counter'].astype(int)
+    assert np.all(np.diff(counters) == 1)
+
+
+def test_delta_codec():
+    rng = np.random.default_rng(0)
+    frames = rng.integers(0, 2 ** 16, size=(5, 64), dtype=np.uint16)
+    # differences wrap around modulo 2**16
+    frames[1] = 0
+    frames[2] = 0xFFFF
+    planes = delta_encode(frames)
+    assert planes.shape == (5, 2, 64) and planes.dtype == np.uint8
+    decoded = delta_decode(planes.reshape(5, -1).view('<u2'))
+    assert np.array_equal(decoded, frames)
+
+
+@pytest.mark.parametrize('compression', ['zlib', 'lzma'])
+def test_compressed_round_trip(frames, tmp_path, compression):
+    filename = str(tmp_path / 'frames.sxr')
+    recorder = record(filename, frames, compression=compression)
+    assert recorder.get_stats()['compression_ratio'] > 1.5
+    check_recording(filename, frames)
+
+
+def test_unknown_compression(tmp_path):
+    with pytest.raises(ValueError):
+        FrameRecorder(str(tmp_path / 'frames.sxr'), (80, 62),
+                      compression='zip')
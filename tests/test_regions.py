@@ -0,0 +1,73 @@
+import json
+import numpy as np
+import pytest
+from senxor.regions import RegionStats, DEFAULT_ZONES, load_zones,\
+                           zones_to_pixels
+
+
+@pytest.fixture
+def frame(mi48):
+    """A 62x80 frame of the emulator, in C"""
+    mi48.set_output('float32')
+    mi48.start(stream=True)
+    return mi48.read()[0].reshape(80, 62).T.copy()
+
+
+def reference(frame, zones):
+    return {name: (frame[y1:y2, x1:x2].mean(), frame[y1:y2, x1:x2].std())
+            for name, (x1, y1, x2, y2) in zones.items()}
+
+
+def test_default_zones(frame):
+    zones = zones_to_pixels(DEFAULT_ZONES, frame.shape)
+    assert zones['Top'] == (0, 0, 80, 21)
+    assert zones['Center'] == (27, 21, 53, 41)
+    stats = RegionStats(zones)
+    expected = reference(frame, zones)
+    for name, (mean, sdev) in stats.as_dict(frame).items():
+        assert mean == pytest.approx(expected[name][0], abs=1.e-4)
+        assert sdev == pytest.approx(expected[name][1], abs=1.e-4)
+
+
+def test_grid(frame, tmp_path):
+    config = {'units': 'pixel',
+              'zones': {'spot': [10, 10, 11, 11]},
+              'grids': [{'prefix': 'bed', 'rows': 4, 'cols': 5},
+                        {'rows': 2, 'cols': 2, 'box': [40, 0, 80, 20]}],
+              'overlay': ['spot']}
+    filename = str(tmp_path / 'zones.json')
+    with open(filename, 'w') as f:
+        json.dump(config, f)
+    zones = zones_to_pixels(load_zones(filename), frame.shape)
+    assert len(zones) == 1 + 20 + 4
+    # a grid without box tiles the whole frame
+    assert zones['bed-0-0'] == (0, 0, 16, 16)
+    assert zones['bed-3-4'] == (64, 46, 80, 62)
+    assert zones['zone-1-1'] == (60, 10, 80, 20)
+    means, sdevs = RegionStats(zones).compute(frame)
+    expected = reference(frame, zones)
+    assert np.allclose(means, [m for m, _ in expected.values()], atol=1.e-4)
+    assert np.allclose(sdevs, [s for _, s in expected.values()], atol=1.e-4)
+    assert sdevs[0] == 0.
+
+
+def test_large_offset():
+    # deviations are accumulated, so no cancellation far from zero
+    frame = 1.e6 + np.random.default_rng(0).normal(size=(62, 80))
+    zones = {'all': (0, 0, 80, 62)}
+    means, sdevs = RegionStats(zones).compute(frame)
+    assert sdevs[0] == pytest.approx(frame.std(), rel=1.e-9)
+
+
+def test_invalid_zones(frame, tmp_path):
+    with pytest.raises(ValueError):
+        RegionStats({'empty': (5, 5, 5, 10)})
+    with pytest.raises(ValueError):
+        RegionStats({'wide': (0, 0, 81, 10)}).compute(frame)
+    with pytest.raises(ValueError):
+        zones_to_pixels({'units': 'inch'}, frame.shape)
+    filename = str(tmp_path / 'zones.json')
+    with open(filename, 'w') as f:
+        json.dump({'overlay': []}, f)
+    with pytest.raises(ValueError):
+        load_zones(filename)
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from senxor.replay import record_session, connect_replay
+
+
+@pytest.fixture
+def session(mi48, emulator, tmp_path):
+    """A session of 6 frames, the 3rd corrupted; and the good frames"""
+    filename = str(tmp_path / 'session.sxs')
+    recorder = record_session(mi48, filename)
+    mi48.set_output('raw')
+    mi48.start(stream=True)
+    frames = [mi48.read()]
+    emulator.inject_fault('corrupt')
+    while mi48.get_stats()['frames'] < 5:
+        data, header = mi48.read()
+        frames.append((data.copy(), header))
+    mi48.stop()
+    recorder.close()
+    return filename, frames
+
+
+def test_replay(session):
+    filename, frames = session
+    mi48 = connect_replay(filename, speed=None)
+    try:
+        assert mi48.fpa_shape == (80, 62)
+        assert mi48.regread('SENXOR_TYPE') == 1
+        mi48.set_output('raw')
+        mi48.start(stream=True)
+        for data, header in frames:
+            _data, _header = mi48.read()
+            assert _header['frame_counter'] == header['frame_counter']
+            assert np.array_equal(_data, data)
+        # the corrupted frame is replayed as it was received
+        assert mi48.get_stats()['link']['cksum_errors'] == 1
+    finally:
+        mi48.stop()
+
+
+def test_replay_timing(session):
+    filename, frames = session
+    mi48 = connect_replay(filename, speed=1.0, loop=True)
+    try:
+        mi48.start(stream=True)
+        counters = [int(mi48.read()[1]['frame_counter'])
+                    for _ in range(2 * len(frames))]
+        # replayed at the original rate, and from the start at the end
+        assert counters[:len(frames)] == counters[len(frames):]
+        assert 10 < mi48.get_stats()['fps'] < 50
+    finally:
+        mi48.stop()
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+# senxor.utils needs the display dependencies
+pytest.importorskip('cmapy')
+cv = pytest.importorskip('cv2')
+
+from senxor.mi48 import get_celsius_lut
+from senxor.utils import FrameGeometry, LutRenderer, data_to_frame, remap,\
+                         get_palette
+
+
+@pytest.fixture
+def raw(mi48):
+    mi48.set_output('raw')
+    mi48.start(stream=True)
+    return mi48.read()[0].copy()
+
+
+def reference_geometry(data, array_shape, hflip, vflip, rotation, roi):
+    frame = data_to_frame(data, array_shape, hflip=hflip)
+    if vflip:
+        frame = frame[::-1]
+    frame = np.rot90(frame, -(rotation // 90))
+    if roi is not None:
+        x1, y1, x2, y2 = roi
+        frame = frame[y1:y2, x1:x2]
+    return frame
+
+
+@pytest.mark.parametrize('array_shape', [(80, 62), (32, 32), (160, 120)])
+@pytest.mark.parametrize('rotation', [0, 90, 180, 270])
+@pytest.mark.parametrize('hflip, vflip', [(False, False), (True, False),
+                                          (True, True)])
+@pytest.mark.parametrize('roi', [None, (3, 5, 29, 30)])
+def test_geometry(array_shape, rotation, hflip, vflip, roi):
+    data = np.arange(array_shape[0] * array_shape[1], dtype=np.uint16)
+    geometry = FrameGeometry(array_shape, hflip, vflip, rotation, roi)
+    expected = reference_geometry(data, array_shape, hflip, vflip,
+                                  rotation, roi)
+    assert np.array_equal(geometry.apply(data), expected)
+    assert geometry.shape == expected.shape
+
+
+def test_geometry_of_thermal_cam(raw):
+    # the steps replaced in ThermalCamera
+    roi = (0, 0, 61, 61)
+    frame = data_to_frame(raw, (80, 62), hflip=True)
+    frame = cv.flip(frame, 1)
+    frame = cv.rotate(frame, cv.ROTATE_90_CLOCKWISE)
+    geometry = FrameGeometry((80, 62), rotation=90, roi=roi)
+    out = np.empty(geometry.shape, dtype=raw.dtype)
+    assert geometry.apply(raw, out=out) is out
+    assert np.array_equal(out, frame[:61, :61])
+
+
+def test_geometry_errors():
+    with pytest.raises(ValueError):
+        FrameGeometry((80, 62), rotation=45)
+    with pytest.raises(ValueError):
+        FrameGeometry((80, 62), roi=(90, 0, 100, 10))
+
+
+def test_lut_renderer(raw):
+    renderer = LutRenderer('inferno')
+    celsius = get_celsius_lut('float32')[raw]
+    lo, hi = float(celsius.min()) + 1., float(celsius.max()) - 1.
+    levels = renderer.levels(raw, lo, hi)
+    # as remap of the clipped frame over the same window
+    expected = remap(np.clip(celsius, lo, hi), curr_range=(lo, hi))
+    assert np.abs(levels.astype(int) - expected).max() <= 1
+    image = renderer.render(raw)
+    assert image.shape == raw.shape + (3,)
+    assert np.array_equal(image, renderer.colorize(levels))
+    assert np.array_equal(image, get_palette('inferno')[levels])
+
+
+def test_lut_renderer_tolerance():
+    renderer = LutRenderer('inferno', tolerance=0.5)
+    with pytest.raises(ValueError):
+        renderer.render(np.zeros(4, dtype=np.uint16))
+    assert renderer.set_window(20., 30.)
+    assert not renderer.set_window(20.4, 29.6)
+    assert renderer.set_window(20., 31.)
+    assert renderer.rebuilds == 2